@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import queue as queues
+import resource
+import sys
+import tempfile
+import time
+import traceback
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from payroll_processor import (  # noqa: E402
+    FUNCTION_CODE,
+    GRADE,
+    POSITION,
+    STATUS,
+    TAB_KEY,
+    UNIT_KEY,
+    UNIT_PATH,
+    PayrollProcessor,
+)
+
+
+def make_sources(units: int, seed: int = 0) -> dict[str, pd.DataFrame]:
+    rng = np.random.default_rng(seed)
+    keys = np.array([f"ШЕ-{i:08d}" for i in range(units)], dtype=object)
+    tabs = (100_000 + np.arange(units)).astype(str).astype(object)
+    status = pd.Categorical(
+        np.where(rng.random(units) < 0.1, "Вакансия", "Основное место работы")
+    )
+    market_size = 12_000
+    paths = np.array([f"Группирующий узел {i % 8} \\ Филиал {i}" for i in range(125)], dtype=object)
+    functions = np.array([f"{i:04d} Функция" for i in range(187)], dtype=object)
+    positions = np.array([f"Должность {i}" for i in range(461)], dtype=object)
+    grades = np.array([str(i) for i in range(1, 6)], dtype=object)
+    market = pd.DataFrame(
+        {
+            UNIT_PATH: pd.Categorical(paths[rng.integers(0, len(paths), market_size)]),
+            FUNCTION_CODE: pd.Categorical(functions[rng.integers(0, len(functions), market_size)]),
+            POSITION: pd.Categorical(positions[rng.integers(0, len(positions), market_size)]),
+            GRADE: pd.Categorical(grades[rng.integers(0, len(grades), market_size)]),
+            "ФОТ по рынку": rng.uniform(30_000, 300_000, market_size),
+        }
+    )
+    picked = market.iloc[rng.integers(0, market_size, units)].reset_index(drop=True)
+    regions = np.array([f"{i:05d}.0384.Филиал" for i in range(83)], dtype=object)
+
+    def frame(columns: dict) -> pd.DataFrame:
+        order = rng.permutation(units)
+        base = {UNIT_KEY: keys, TAB_KEY: tabs, STATUS: status}
+        return pd.DataFrame({**base, **columns}).iloc[order].reset_index(drop=True)
+
+    return {
+        "positions": frame({POSITION: picked[POSITION], GRADE: picked[GRADE]}),
+        "org_units": frame(
+            {
+                UNIT_PATH: picked[UNIT_PATH],
+                FUNCTION_CODE: picked[FUNCTION_CODE],
+                "РФ": pd.Categorical(regions[rng.integers(0, len(regions), units)]),
+                "МРФ": pd.Categorical(rng.choice(["Волга", "Сибирь", "Центр", "Юг"], units)),
+            }
+        ),
+        "salaries": frame({"Тарифная ставка (оклад), руб.": rng.uniform(2e4, 15e4, units)}),
+        "projects": frame({"OPEX": rng.choice([0.0, 50.0, 100.0], units)}),
+        "bonuses": frame({"Процент годовой премии": rng.choice([0.0, 20.0], units)}),
+        "insurance": pd.DataFrame(
+            {"РФ": pd.Categorical(regions), "Процентр страховых взносов": rng.uniform(0.27, 0.3, 83)}
+        ),
+        "market": market,
+    }
+
+
+def legacy_merge(sources: dict[str, pd.DataFrame]) -> pd.DataFrame:
+    def employees(df: pd.DataFrame) -> pd.DataFrame:
+        return df.loc[~df[STATUS].eq("Вакансия")].copy()
+
+    df = employees(sources["positions"])
+    for name in ["org_units", "salaries", "projects", "bonuses"]:
+        df = pd.merge(df, employees(sources[name]), how="inner")
+    df = df.merge(sources["market"], on=[UNIT_PATH, FUNCTION_CODE, POSITION, GRADE], how="left")
+    df = df.merge(sources["insurance"], on="РФ", how="left")
+    df.drop_duplicates(inplace=True, subset=UNIT_KEY)
+    return df
+
+
+def _current_rss() -> int:
+    with open("/proc/self/statm") as fh:
+        return int(fh.read().split()[1]) * resource.getpagesize()
+
+
+def _run(func, sources: dict[str, pd.DataFrame], queue) -> None:
+    try:
+        start_rss = _current_rss()
+        started = time.perf_counter()
+        result = func(sources)
+        elapsed = time.perf_counter() - started
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        columns = sorted(result.columns)
+        ordered = result.sort_values(UNIT_KEY)[columns].reset_index(drop=True)
+        digest = int(pd.util.hash_pandas_object(ordered, index=False).sum())
+        queue.put((True, (elapsed, max(peak - start_rss, 0), len(result), digest)))
+    except BaseException:
+        queue.put((False, traceback.format_exc()))
+
+
+def measure(label: str, func, sources: dict[str, pd.DataFrame]) -> int:
+    # Каждый вариант — в отдельном процессе (fork), чтобы пики памяти не смешивались.
+    # Ошибка замера передается родителю текстом; если процесс убит (например,
+    # по нехватке памяти) и ничего не передал, ожидание прерывается по коду выхода.
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    worker = context.Process(target=_run, args=(func, sources, queue))
+    worker.start()
+    while True:
+        try:
+            ok, result = queue.get(timeout=1)
+            break
+        except queues.Empty:
+            if worker.is_alive():
+                continue
+            try:
+                ok, result = queue.get(timeout=1)
+                break
+            except queues.Empty:
+                raise RuntimeError(f"Замер {label} прерван, код выхода {worker.exitcode}") from None
+    worker.join()
+    if not ok:
+        raise RuntimeError(f"Замер {label} завершился ошибкой:\n{result}")
+    if worker.exitcode:
+        raise RuntimeError(f"Замер {label} завершился с кодом {worker.exitcode}")
+    elapsed, peak, rows, digest = result
+    print(f"{label:<10} {elapsed:8.2f} с {peak / 2**20:10.1f} МБ {rows:>10} строк")
+    return digest
+
+
+def keyed_merge(sources: dict[str, pd.DataFrame]) -> pd.DataFrame:
+    # Индекс ставок рынка сверяется с файлом рынка по размеру и mtime,
+    # а сами ставки берет из sources — достаточно пустого файла.
+    with tempfile.TemporaryDirectory() as data_dir:
+        processor = PayrollProcessor(data_dir)
+        (Path(data_dir) / processor.files.market).touch()
+        return processor.merge_employees(sources)[0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Сравнение цепочки merge и KeyedJoiner")
+    parser.add_argument("--units", default=1_000_000, type=int, help="Число штатных единиц")
+    args = parser.parse_args()
+
+    sources = make_sources(args.units)
+    print(f"{'вариант':<10} {'время':>10} {'прирост RSS':>14} {'результат':>16}")
+    legacy = measure("merge", legacy_merge, sources)
+    keyed = measure("keyed", keyed_merge, sources)
+    print("Результаты совпадают." if legacy == keyed else "Результаты различаются!")
+
+
+if __name__ == "__main__":
+    main()
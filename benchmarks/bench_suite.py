@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from pathlib import Path
+
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path[:0] = [str(ROOT / "src"), str(ROOT / "web"), str(Path(__file__).resolve().parent)]
+
+from generate_data import generate  # noqa: E402
+from payroll_processor import TAB_KEY, PayrollProcessor  # noqa: E402
+from profiling import Profiler, activate  # noqa: E402
+
+SUITES = ("stages", "cli", "views")
+
+
+def ensure_data(data_root: Path, units: int, seed: int) -> Path:
+    # Сгенерированные наборы переиспользуются между прогонами.
+    path = data_root / f"units-{units}-seed-{seed}"
+    marker = path / ".complete"
+    if not marker.exists():
+        generate(path, units, seed=seed)
+        marker.touch()
+    return path
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _in_fork(target, *args) -> list[dict]:
+    # Каждый замер — в отдельном процессе, чтобы пики памяти и прогретые
+    # кэши одного замера не влияли на другой.
+    # Ошибка замера передается родителю текстом, иначе он ждал бы результат вечно.
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+
+    def run() -> None:
+        try:
+            queue.put((True, target(*args)))
+        except BaseException:
+            queue.put((False, traceback.format_exc()))
+
+    worker = context.Process(target=run)
+    worker.start()
+    ok, result = queue.get()
+    worker.join()
+    if not ok:
+        raise RuntimeError(f"Замер {target.__name__} завершился ошибкой:\n{result}")
+    return result
+
+
+def _stage_run(data_dir: Path, work_dir: Path, trace_memory: bool) -> list[dict]:
+    profiler = Profiler(trace_memory=trace_memory)
+    processor = PayrollProcessor(data_dir, work_dir)
+    with activate(profiler):
+        processor.process()
+    return [{**stage, "process_peak_mb": _peak_rss_mb()} for stage in profiler.report()]
+
+
+def bench_stages(data_dir: Path, work_dir: Path) -> list[dict]:
+    # Время — без tracemalloc (он замедляет расчет), пик памяти — отдельным прогоном.
+    timed = _in_fork(_stage_run, data_dir, work_dir / "stages", False)
+    traced = {stage["name"]: stage for stage in _in_fork(_stage_run, data_dir, work_dir / "stages", True)}
+    results = []
+    for stage in timed:
+        rows = stage["rows_in"] if stage["rows_in"] is not None else stage["rows_out"]
+        results.append(
+            {
+                "suite": "stages",
+                "name": stage["name"],
+                "seconds": stage["wall"],
+                "cpu_seconds": stage["cpu"],
+                "rows": rows,
+                "rows_per_s": rows / stage["wall"] if rows and stage["wall"] else None,
+                "peak_mb": traced.get(stage["name"], {}).get("peak_mb"),
+                "process_peak_mb": stage["process_peak_mb"],
+            }
+        )
+    return results
+
+
+def bench_cli(data_dir: Path, work_dir: Path) -> list[dict]:
+    command = [
+        sys.executable,
+        str(ROOT / "src" / "main.py"),
+        "--data-dir",
+        str(data_dir),
+        "--output-dir",
+        str(work_dir / "cli"),
+    ]
+    started = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - started
+    code = os.waitstatus_to_exitcode(status)
+    if code:
+        raise RuntimeError(f"CLI завершился с кодом {code}")
+    return [
+        {
+            "suite": "cli",
+            "name": "main.py",
+            "seconds": elapsed,
+            "cpu_seconds": usage.ru_utime + usage.ru_stime,
+            "process_peak_mb": usage.ru_maxrss / 1024,
+        }
+    ]
+
+
+def _views_run(data_dir: Path, work_dir: Path, repeat: int) -> list[dict]:
+    os.environ["DJANGO_SETTINGS_MODULE"] = "config.settings"
+    import django
+    from django.conf import settings
+
+    output_dir = work_dir / "web"
+    settings.DATA_DIR = data_dir
+    settings.OUTPUT_DIR = output_dir
+    settings.SOURCE_CACHE_DIR = output_dir / "cache"
+    settings.MEDIA_ROOT = output_dir
+    settings.ALLOWED_HOSTS = ["testserver"]
+    settings.DATABASES["default"]["NAME"] = work_dir / "bench.sqlite3"
+    # Задачу пересчета выполняет сам замер, без фонового пула.
+    settings.BUDGET_JOBS_IN_PROCESS = False
+    django.setup()
+
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+    from django.test import Client
+
+    from cabinet.jobs import drain
+
+    call_command("migrate", verbosity=0)
+    user_model = get_user_model()
+    boss, _ = user_model.objects.get_or_create(username="bench-boss", is_superuser=True)
+    tab = pd.read_csv(
+        data_dir / "Должности.csv", sep="\t", encoding="utf-8-sig", dtype=str, nrows=10
+    )[TAB_KEY].dropna().iloc[0]
+    employee, _ = user_model.objects.get_or_create(username=tab)
+
+    budget = Client()
+    budget.force_login(boss)
+    personal = Client()
+    personal.force_login(employee)
+
+    def budget_request(limit: float):
+        # Пост ставит задачу и перенаправляет на страницу результата: замер
+        # включает расчет задачи и открытие готовой страницы.
+        response = budget.post("/budget/", {"limit": str(limit)})
+        if response.status_code != 302:
+            return response
+        drain()
+        return budget.get(response["Location"])
+
+    requests = {
+        "budget_dashboard": budget_request,
+        "employee_dashboard": lambda _: personal.get("/employee/"),
+    }
+
+    results = []
+    for name, request in requests.items():
+        timings = []
+        for i in range(repeat + 1):
+            started = time.perf_counter()
+            response = request(5_000_000 + i * 100_000)
+            timings.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise RuntimeError(f"{name}: HTTP {response.status_code}")
+        results.append(
+            {
+                "suite": "views",
+                "name": name,
+                "cold_seconds": timings[0],
+                "seconds": statistics.median(timings[1:]),
+                "process_peak_mb": _peak_rss_mb(),
+            }
+        )
+    return results
+
+
+def bench_views(data_dir: Path, work_dir: Path, repeat: int = 5) -> list[dict]:
+    return _in_fork(_views_run, data_dir, work_dir, repeat)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(baseline: dict, current: dict) -> None:
+    def key(row: dict) -> tuple:
+        return row["units"], row["suite"], row["name"]
+
+    old = {key(row): row for row in baseline["results"]}
+    print(f"{'размер':>9} {'набор':<7} {'этап':<22} {'было, с':>9} {'стало, с':>9} {'изм.':>7}")
+    for row in current["results"]:
+        before = old.get(key(row))
+        if not before or not before["seconds"]:
+            continue
+        change = row["seconds"] / before["seconds"] - 1
+        print(
+            f"{row['units']:>9} {row['suite']:<7} {row['name']:<22} "
+            f"{before['seconds']:>9.3f} {row['seconds']:>9.3f} {change:>+7.1%}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Замеры масштабирования расчета ФОТ")
+    parser.add_argument(
+        "--sizes",
+        default="10000,100000",
+        type=lambda value: [int(float(part)) for part in value.split(",")],
+        help="Размеры набора в штатных единицах через запятую (до 5e6)",
+    )
+    parser.add_argument("--suites", default=",".join(SUITES), help="Наборы замеров: stages, cli, views")
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument(
+        "--data-root",
+        default=Path(tempfile.gettempdir()) / "salary-bench-data",
+        type=Path,
+        help="Каталог сгенерированных наборов",
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        type=Path,
+        help="JSON с результатами (по умолчанию benchmarks/results/<коммит>.json)",
+    )
+    parser.add_argument("--compare", default=None, type=Path, help="JSON прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    suites = [suite.strip() for suite in args.suites.split(",") if suite.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"неизвестные наборы: {', '.join(sorted(unknown))}")
+
+    runners = {"stages": bench_stages, "cli": bench_cli, "views": bench_views}
+    revision = git_revision()
+    report = {
+        "revision": revision,
+        "created": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "cpus": os.cpu_count(),
+        "results": [],
+    }
+    for units in args.sizes:
+        data_dir = ensure_data(args.data_root, units, args.seed)
+        with tempfile.TemporaryDirectory(prefix="salary-bench-") as work:
+            for suite in suites:
+                for row in runners[suite](data_dir, Path(work)):
+                    row = {"units": units, **row}
+                    report["results"].append(row)
+                    print(
+                        f"{units:>9} {suite:<7} {row['name']:<22} {row['seconds']:>9.3f} с "
+                        f"{row.get('process_peak_mb', 0):>9.1f} МБ"
+                    )
+
+    output = args.output or ROOT / "benchmarks" / "results" / f"{revision}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=1), encoding="utf-8")
+    print(f"Результаты: {output}")
+    if args.compare:
+        compare(json.loads(args.compare.read_text(encoding="utf-8")), report)
+
+
+if __name__ == "__main__":
+    main()
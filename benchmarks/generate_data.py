@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import argparse
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from payroll_processor import (  # noqa: E402
+    FUNCTION_CODE,
+    GRADE,
+    MARKET_KEY,
+    POSITION,
+    STATUS,
+    TAB_KEY,
+    UNIT_KEY,
+    UNIT_PATH,
+    SourceFiles,
+)
+
+MRF = [
+    "МРФ Волга",
+    "МРФ Дальний Восток",
+    "МРФ Северо-Запад",
+    "МРФ Сибирь",
+    "МРФ Урал",
+    "МРФ Центр",
+    "МРФ Юг",
+    "Корпоративный центр",
+]
+# Кардинальности как в выгрузке рынка: 125 подразделений, 187 функций,
+# 461 должность, 5 грейдов, около 12 тыс. строк ставок.
+UNIT_PATHS = 125
+FUNCTIONS = 187
+POSITIONS = 461
+GRADES = 5
+REGIONS = 83
+CSV_OPTIONS = {"sep": "\t", "index": False, "encoding": "utf-8-sig"}
+
+
+def make_dimensions(
+    rng: np.random.Generator, market_rows: int = 12_000
+) -> tuple[pd.DataFrame, pd.DataFrame, dict[str, str]]:
+    mrf_by_path = {
+        f"Группирующий узел {MRF[i % len(MRF)]} \\ Филиал {i:03d} ": MRF[i % len(MRF)]
+        for i in range(UNIT_PATHS)
+    }
+    paths = np.array(list(mrf_by_path), dtype=object)
+    functions = np.array([f"{i:04d} Функция {i}" for i in range(FUNCTIONS)], dtype=object)
+    positions = np.array([f"Должность {i}" for i in range(POSITIONS)], dtype=object)
+    grades = np.array([str(i) for i in range(1, GRADES + 1)], dtype=object)
+
+    sample = market_rows * 2
+    market = pd.DataFrame(
+        {
+            UNIT_PATH: paths[rng.integers(0, UNIT_PATHS, sample)],
+            FUNCTION_CODE: functions[rng.integers(0, FUNCTIONS, sample)],
+            POSITION: positions[rng.integers(0, POSITIONS, sample)],
+            GRADE: grades[rng.integers(0, GRADES, sample)],
+        }
+    )
+    market = market.drop_duplicates().head(market_rows).reset_index(drop=True)
+    market["ФОТ по рынку"] = rng.uniform(30_000, 300_000, len(market)).round(2)
+
+    insurance = pd.DataFrame(
+        {
+            "РФ": [f"{1000 + i:05d}.0384.Филиал {i}" for i in range(REGIONS)],
+            "Процентр страховых взносов": rng.choice([0.28, 0.29, 0.3], REGIONS),
+        }
+    )
+    return market, insurance, mrf_by_path
+
+
+def _decimal(values: np.ndarray) -> pd.Series:
+    return pd.Series(np.round(values, 2)).astype(str).str.replace(".", ",", regex=False)
+
+
+def make_chunk(
+    rng: np.random.Generator,
+    start: int,
+    size: int,
+    market: pd.DataFrame,
+    insurance: pd.DataFrame,
+    vacancy_share: float,
+    market_miss: float,
+    mrf_by_path: dict[str, str],
+) -> tuple[dict[str, object], dict[str, dict[str, object]]]:
+    numbers = np.arange(start, start + size)
+    units = pd.Series(numbers).map("ШЕ-{:08d}".format)
+    vacancy = rng.random(size) < vacancy_share
+    tabs = pd.Series((100_000 + numbers).astype(str)).where(~vacancy, "")
+    status = np.where(
+        vacancy,
+        "Вакансия",
+        np.where(rng.random(size) < 0.9, "Основное место работы", "Внутреннее совместительство"),
+    )
+    keys = market.iloc[rng.integers(0, len(market), size), :4].reset_index(drop=True)
+    # Часть единиц не находит ставку рынка (грейд вне справочника).
+    keys.loc[rng.random(size) < market_miss, GRADE] = str(GRADES + 1)
+    mrf = keys[UNIT_PATH].map(mrf_by_path)
+    hire = pd.Timestamp("2000-01-01") + pd.to_timedelta(rng.integers(0, 9_000, size), unit="D")
+    raised = pd.Timestamp("2018-01-01") + pd.to_timedelta(rng.integers(0, 3_000, size), unit="D")
+    opex = rng.choice([100, 80, 50, 20, 0], size)
+    capex = np.minimum(100 - opex, rng.choice([0, 20, 50], size))
+
+    base = {UNIT_KEY: units, TAB_KEY: tabs, STATUS: status}
+    return base, {
+        "positions": {
+            "Ф.И.О.": pd.Series(numbers).map("Сотрудник {}".format).where(~vacancy, ""),
+            POSITION: keys[POSITION],
+            GRADE: keys[GRADE],
+        },
+        "org_units": {
+            UNIT_PATH: keys[UNIT_PATH],
+            FUNCTION_CODE: keys[FUNCTION_CODE],
+            "РФ": insurance["РФ"].to_numpy()[rng.integers(0, len(insurance), size)],
+            "МРФ": mrf,
+            "Дата приема": hire.strftime("%d.%m.%Y"),
+        },
+        "salaries": {
+            "Кол-во единиц": np.where(rng.random(size) < 0.85, "1", "0,5"),
+            "Дата последнего повышения": raised.strftime("%Y-%m-%d"),
+            "Тарифная ставка (оклад), руб.": _decimal(rng.uniform(20_000, 150_000, size)),
+            "Районный коэффициент": _decimal(rng.choice([0, 5_000, 10_000], size)),
+            "Надбавка за вредность": _decimal(rng.uniform(0, 5_000, size)).where(rng.random(size) < 0.3, ""),
+        },
+        "projects": {
+            "OPEX": opex.astype(str),
+            "CAPEX": capex.astype(str),
+            "O2O": (100 - opex - capex).astype(str),
+        },
+        "bonuses": {
+            "Процент месячной премии": rng.choice(["0", "10", "15", "20"], size),
+            "Процент квартальной премии": rng.choice(["0", "10", "12,5"], size),
+            "Процент годовой премии": rng.choice(["0", "20", "25"], size),
+        },
+    }
+
+
+def generate(
+    out: Path,
+    units: int,
+    seed: int = 0,
+    vacancy_share: float = 0.1,
+    market_miss: float = 0.02,
+    chunk_size: int = 500_000,
+    dimensions_from: Path | None = None,
+) -> None:
+    # Файлы пишутся кусками, поэтому 5 млн единиц не требуют держать все в памяти.
+    # Строки внутри куска перемешаны по-разному для каждого файла.
+    rng = np.random.default_rng(seed)
+    out.mkdir(parents=True, exist_ok=True)
+    files = SourceFiles()
+    if dimensions_from:
+        for name in (files.market, files.insurance):
+            shutil.copyfile(dimensions_from / name, out / name)
+        read = {"sep": "\t", "encoding": "utf-8-sig", "dtype": str}
+        market = pd.read_csv(out / files.market, **read)[MARKET_KEY]
+        insurance = pd.read_csv(out / files.insurance, **read)
+        # МРФ определяется подразделением, как в реальной структуре.
+        paths = sorted(market[UNIT_PATH].unique())
+        mrf_by_path = {path: MRF[i % len(MRF)] for i, path in enumerate(paths)}
+    else:
+        market, insurance, mrf_by_path = make_dimensions(rng)
+        market.to_csv(out / files.market, **CSV_OPTIONS)
+        insurance.to_csv(out / files.insurance, **CSV_OPTIONS)
+
+    for start in range(0, units, chunk_size):
+        size = min(chunk_size, units - start)
+        base, chunk = make_chunk(rng, start, size, market, insurance, vacancy_share, market_miss, mrf_by_path)
+        for name, columns in chunk.items():
+            df = pd.DataFrame({**base, **columns})
+            df = df.iloc[rng.permutation(size)]
+            if start == 0:
+                df.to_csv(out / getattr(files, name), **CSV_OPTIONS)
+            else:
+                # BOM пишется только в начале файла.
+                df.to_csv(out / getattr(files, name), mode="a", header=False, **(CSV_OPTIONS | {"encoding": "utf-8"}))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Генератор синтетических исходных файлов")
+    parser.add_argument("output_dir", type=Path, help="Каталог для семи CSV")
+    parser.add_argument("--units", default=100_000, type=int, help="Число штатных единиц (10 тыс. — 5 млн)")
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--vacancy-share", default=0.1, type=float, help="Доля вакансий")
+    parser.add_argument("--market-miss", default=0.02, type=float, help="Доля единиц без ставки рынка")
+    parser.add_argument(
+        "--dimensions-from",
+        default=None,
+        type=Path,
+        help="Взять справочники рынка и взносов из каталога (например, data) вместо синтетических",
+    )
+    args = parser.parse_args()
+    generate(
+        args.output_dir,
+        args.units,
+        seed=args.seed,
+        vacancy_share=args.vacancy_share,
+        market_miss=args.market_miss,
+        dimensions_from=args.dimensions_from,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+from itertools import combinations
+from typing import Iterable, Mapping
+
+import numpy as np
+import pandas as pd
+
+COUNT = "Сотрудников"
+RECOMMENDED = "Рекомендовано"
+RAISE = "Сумма повышения"
+SCALED_RAISE = "Повышение по лимиту"
+
+
+def base_cuboid(df: pd.DataFrame, dimensions: Iterable[str], measures: Iterable[str]) -> pd.DataFrame:
+    # Самый подробный срез: суммы мер по всем измерениям сразу. Строки без
+    # значения измерения остаются отдельной группой, чтобы итоги сходились.
+    dimensions, measures = list(dimensions), list(measures)
+    grouped = df.groupby(dimensions, observed=True, dropna=False, sort=False)
+    base = grouped[measures].sum()
+    base[COUNT] = grouped.size()
+    base[RECOMMENDED] = grouped["Рекомендуется повышение"].sum()
+    return base.reset_index()
+
+
+class AggregationCube:
+    # Суммы аддитивных мер по всем сочетаниям измерений. Каждый срез
+    # сворачивается из наименьшего уже готового среза с одним измерением
+    # больше, поэтому построение не трогает строки сотрудников. Повышение по
+    # лимиту линейно по лимиту: смена лимита только умножает сумму повышения
+    # на коэффициент, запрос стоит O(групп).
+    def __init__(self, base: pd.DataFrame, dimensions: Iterable[str]) -> None:
+        self.dimensions = tuple(dimensions)
+        self.measures = [column for column in base.columns if column not in self.dimensions]
+        self.cuboids: dict[frozenset[str], pd.DataFrame] = {frozenset(self.dimensions): base}
+        for size in range(len(self.dimensions) - 1, -1, -1):
+            for names in combinations(self.dimensions, size):
+                parent = min(
+                    (self.cuboids[frozenset(names) | {name}] for name in self.dimensions if name not in names),
+                    key=len,
+                )
+                self.cuboids[frozenset(names)] = self._roll_up(parent, list(names))
+
+    def _roll_up(self, cuboid: pd.DataFrame, names: list[str]) -> pd.DataFrame:
+        if not names:
+            return pd.DataFrame({measure: [cuboid[measure].sum()] for measure in self.measures})
+        grouped = cuboid.groupby(names, observed=True, dropna=False, sort=False)
+        return grouped[self.measures].sum().reset_index()
+
+    def total(self, measure: str) -> float:
+        return float(self.cuboids[frozenset()][measure].iloc[0])
+
+    def query(
+        self,
+        by: Iterable[str] = (),
+        filters: Mapping[str, object] | None = None,
+        scale: float = 1.0,
+        dropna: bool = True,
+    ) -> pd.DataFrame:
+        by = list(by)
+        filters = dict(filters or {})
+        unknown = (set(by) | set(filters)) - set(self.dimensions)
+        if unknown:
+            raise KeyError(f"Неизвестные измерения: {sorted(unknown)}")
+
+        # Отбор по измерению берется из среза, где оно есть, и затем сворачивается.
+        cuboid = self.cuboids[frozenset(by) | frozenset(filters)]
+        if filters:
+            keep = np.ones(len(cuboid), dtype=bool)
+            for name, value in filters.items():
+                keep &= (cuboid[name].astype(str) == str(value)).to_numpy()
+            cuboid = self._roll_up(cuboid[keep], by)
+        else:
+            cuboid = cuboid.copy()
+        if by:
+            if dropna:
+                cuboid = cuboid.dropna(subset=by)
+            cuboid = cuboid.sort_values(by, ignore_index=True)
+        cuboid[SCALED_RAISE] = cuboid[RAISE] * scale
+        return cuboid
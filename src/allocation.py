@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Mapping
+
+import numpy as np
+import pandas as pd
+
+FULL = "полное повышение"
+CAP = "потолок"
+MINIMUM = "минимум"
+TOTAL = "общий лимит"
+
+
+@dataclass(frozen=True)
+class AllocationRules:
+    max_raise: float | None = None
+    min_raise: float = 0.0
+    mrf_budgets: Mapping[str, float] = field(default_factory=dict)
+    grade_budgets: Mapping[str, float] = field(default_factory=dict)
+
+    @classmethod
+    def from_file(cls, path: Path) -> AllocationRules:
+        # {"max_raise": 50000, "min_raise": 3000, "mrf": {"МРФ Юг": 1e6}, "grade": {"5": 5e5}}
+        raw = json.loads(Path(path).read_text(encoding="utf-8"))
+        unknown = set(raw) - {"max_raise", "min_raise", "mrf", "grade"}
+        if unknown:
+            raise ValueError(f"Неизвестные параметры распределения: {sorted(unknown)}")
+        return cls(
+            max_raise=float(raw["max_raise"]) if raw.get("max_raise") is not None else None,
+            min_raise=float(raw.get("min_raise", 0.0)),
+            mrf_budgets={str(key): float(value) for key, value in raw.get("mrf", {}).items()},
+            grade_budgets={str(key): float(value) for key, value in raw.get("grade", {}).items()},
+        )
+
+
+@dataclass
+class Allocation:
+    amount: np.ndarray
+    binding: pd.Categorical
+    spent: float
+    rounds: int
+
+    def binding_counts(self) -> dict[str, int]:
+        counts = pd.Series(self.binding).value_counts(sort=False)
+        return {str(reason): int(count) for reason, count in counts.items() if count}
+
+
+class _Cells:
+    # Ячейка — сочетание групп всех измерений; кандидаты фиксируются только
+    # целыми ячейками. События кандидатов ячейки (вход на уровне entry,
+    # насыщение на уровне saturation) отсортированы по уровню, с накопленными
+    # суммами: повышения ячейки при уровне L — intercept + slope * L.
+    def __init__(
+        self,
+        count: int,
+        cell: np.ndarray,
+        order: np.ndarray,
+        level: np.ndarray,
+        d_intercept: np.ndarray,
+        d_slope: np.ndarray,
+    ) -> None:
+        # cell — ячейки событий в порядке уровня (order); устойчивая сортировка
+        # по ячейке сохраняет этот порядок внутри ячеек. Перестановки
+        # складываются, чтобы исходные массивы выбирались по индексу один раз.
+        order = order[np.argsort(cell, kind="stable")]
+        counts = np.bincount(cell, minlength=count)
+        self.ends = np.cumsum(counts)
+        self.starts = self.ends - counts
+        self.level = level[order]
+        self.intercept = np.cumsum(d_intercept[order])
+        self.slope = np.cumsum(d_slope[order])
+        before = np.maximum(self.starts - 1, 0)
+        self.base_intercept = np.where(counts > 0, self.intercept[before], 0.0) * (self.starts > 0)
+        self.base_slope = np.where(counts > 0, self.slope[before], 0.0) * (self.starts > 0)
+
+    def line(self, cells: np.ndarray, level: float) -> tuple[float, float]:
+        intercept = slope = 0.0
+        for cell in cells:
+            start, end = self.starts[cell], self.ends[cell]
+            last = start + np.searchsorted(self.level[start:end], level, side="right") - 1
+            if last >= start:
+                intercept += self.intercept[last] - self.base_intercept[cell]
+                slope += self.slope[last] - self.base_slope[cell]
+        return intercept, slope
+
+
+class _Dimension:
+    # Бюджеты одного измерения (общий лимит, МРФ, грейд). Для каждой группы
+    # ищется наибольший уровень, при котором ее живые ячейки укладываются
+    # в остаток бюджета: бинарный поиск по отсортированным уровням всех событий
+    # (между соседними сумма группы линейна), сумма в точке — по накопленным
+    # суммам ячеек.
+    def __init__(self, name: str, budgets: np.ndarray, cell_group: np.ndarray) -> None:
+        self.name = name
+        self.budgets = budgets
+        self.cell_group = cell_group
+        self.fixed = np.zeros(len(budgets))
+        self.group_cells = [np.flatnonzero(cell_group == group) for group in range(len(budgets))]
+        # Уровень группы пересчитывается, только если в ней что-то зафиксировано.
+        self.dirty = np.ones(len(budgets), dtype=bool)
+        self.cached = np.full(len(budgets), np.inf)
+
+    def freeze(self, frozen_cells: np.ndarray, cell_spent: np.ndarray) -> None:
+        self.fixed += np.bincount(self.cell_group, weights=cell_spent, minlength=len(self.budgets))
+        self.dirty[self.cell_group[frozen_cells]] = True
+
+    def levels(self, cells: _Cells, cell_alive: np.ndarray, points: np.ndarray) -> np.ndarray:
+        for group in np.flatnonzero(self.dirty):
+            live = self.group_cells[group][cell_alive[self.group_cells[group]]]
+            remaining = self.budgets[group] - self.fixed[group]
+            if not len(live) or not np.isfinite(remaining):
+                self.cached[group] = np.inf
+                continue
+            # Сумма монотонна по уровню: ищем последнюю точку, где она в остатке.
+            low, high = -1, len(points)
+            while high - low > 1:
+                middle = (low + high) // 2
+                intercept, slope = cells.line(live, points[middle])
+                if intercept + slope * points[middle] <= remaining:
+                    low = middle
+                else:
+                    high = middle
+            next_level = points[high] if high < len(points) else np.inf
+            if low < 0:
+                self.cached[group] = next_level
+                continue
+            intercept, slope = cells.line(live, points[low])
+            self.cached[group] = min(next_level, (remaining - intercept) / slope) if slope > 0 else next_level
+        self.dirty[:] = False
+        return self.cached.copy()
+
+
+def _codes(labels, budgets: Mapping[str, float]) -> tuple[np.ndarray, np.ndarray]:
+    codes, uniques = pd.factorize(labels)
+    # Кандидаты без метки группы попадают в отдельную группу без ограничения.
+    limits = np.array([budgets.get(str(label), np.inf) for label in uniques] + [np.inf])
+    codes = np.where(codes < 0, len(uniques), codes)
+    return codes.astype(np.int16 if len(limits) < 2**15 else np.int64), limits
+
+
+def water_fill(
+    current,
+    market,
+    desired,
+    budget: float,
+    groups: Mapping[str, tuple[object, Mapping[str, float]]] | None = None,
+    cap: float | None = None,
+    minimum: float = 0.0,
+) -> Allocation:
+    # Уровень «воды» — целевая проплаченность L: кандидат получает
+    # L * ФОТ по рынку - ФОТ, но не больше своего потолка и не меньше минимума
+    # (иначе ничего). Первыми повышаются самые недоплаченные. Уровень поднимается
+    # для всех, пока не исчерпается какой-то бюджет (общий, МРФ, грейда); его
+    # кандидаты фиксируются, для остальных уровень поднимается дальше. События
+    # сортируются один раз; раунд — бинарные поиски по группам, раундов не
+    # больше числа бюджетов.
+    current = np.asarray(current, dtype="float64")
+    market = np.asarray(market, dtype="float64")
+    desired = np.asarray(desired, dtype="float64")
+    size = len(current)
+    limit = desired if cap is None else np.minimum(desired, cap)
+
+    # Причины храним кодами: 0 — полное повышение, 1 — потолок, 2 — минимум,
+    # 3+ — бюджеты; -1 — не кандидат.
+    names = [FULL, CAP, MINIMUM, *([TOTAL] if np.isfinite(budget) else [])]
+    names += [name for name, (_, budgets) in (groups or {}).items() if budgets]
+    amount = np.full(size, np.nan)
+    binding = np.full(size, -1, dtype=np.int8)
+    eligible = (limit > 0) & (market > 0) & np.isfinite(current)
+    too_small = eligible & (limit < minimum)
+    amount[too_small] = 0.0
+    binding[too_small] = 2
+    eligible &= ~too_small
+    index = np.flatnonzero(eligible)
+    if not len(index):
+        return Allocation(amount, pd.Categorical.from_codes(binding, names), 0.0, 0)
+
+    current, market, desired, limit = current[index], market[index], desired[index], limit[index]
+    entry = (current + minimum) / market
+    saturation = (current + limit) / market
+
+    specs = []
+    if np.isfinite(budget):
+        specs.append((TOTAL, np.zeros(len(index), dtype=np.int16), np.array([float(budget)])))
+    for name, (labels, budgets) in (groups or {}).items():
+        if budgets:
+            codes, limits = _codes(labels, budgets)
+            specs.append((name, codes[index], limits))
+
+    combined = np.zeros(len(index), dtype=np.int64)
+    for _, codes, limits in specs:
+        combined = combined * len(limits) + codes
+    member_cell, cell_keys = pd.factorize(combined)
+    member_cell = member_cell.astype(np.int16 if len(cell_keys) < 2**15 else np.int64)
+
+    levels = np.concatenate([entry, saturation])
+    order = np.argsort(levels)
+    cells = _Cells(
+        len(cell_keys),
+        np.concatenate([member_cell, member_cell])[order],
+        order,
+        levels,
+        np.concatenate([-current, current + limit]),
+        np.concatenate([market, -market]),
+    )
+    points = levels[order]
+    dimensions = []
+    stride = 1
+    for name, codes, limits in reversed(specs):
+        cell_group = ((cell_keys // stride) % len(limits)).astype(codes.dtype)
+        stride *= len(limits)
+        dimensions.insert(0, _Dimension(name, limits, cell_group))
+
+    by_cell = np.argsort(member_cell, kind="stable")
+    cell_ends = np.cumsum(np.bincount(member_cell, minlength=len(cell_keys)))
+    cell_starts = np.concatenate([[0], cell_ends[:-1]])
+    cell_alive = np.ones(len(cell_keys), dtype=bool)
+    capped = limit < desired
+    allocated = np.zeros(len(index))
+    reason = np.zeros(len(index), dtype=np.int8)
+    rounds = 0
+    while cell_alive.any():
+        rounds += 1
+        levels = [dimension.levels(cells, cell_alive, points) for dimension in dimensions]
+        water = min((level.min() for level in levels), default=np.inf)
+
+        frozen_cells = np.zeros(len(cell_keys), dtype=bool)
+        cell_reason = np.zeros(len(cell_keys), dtype=np.int8)
+        if np.isfinite(water):
+            for number, (dimension, level) in enumerate(zip(dimensions, levels), start=3):
+                hit = (level == water)[dimension.cell_group] & cell_alive & ~frozen_cells
+                cell_reason[hit] = number
+                frozen_cells |= hit
+        else:
+            frozen_cells = cell_alive.copy()
+
+        chosen = np.concatenate(
+            [by_cell[cell_starts[cell]:cell_ends[cell]] for cell in np.flatnonzero(frozen_cells)]
+        )
+        reason[chosen] = cell_reason[member_cell[chosen]]
+        raw = water * market[chosen] - current[chosen]
+        entered = entry[chosen] < water
+        saturated = saturation[chosen] <= water
+        allocated[chosen] = np.where(
+            saturated,
+            limit[chosen],
+            np.where(entered, np.clip(raw, minimum, limit[chosen]), 0.0),
+        )
+        reason[chosen[saturated]] = capped[chosen[saturated]]
+        reason[chosen[~entered & ~saturated & (raw > 0)]] = 2
+
+        cell_alive &= ~frozen_cells
+        cell_spent = np.bincount(member_cell[chosen], weights=allocated[chosen], minlength=len(cell_keys))
+        for dimension in dimensions:
+            dimension.freeze(frozen_cells, cell_spent)
+
+    amount[index] = allocated
+    binding[index] = reason
+    return Allocation(amount, pd.Categorical.from_codes(binding, names), float(allocated.sum()), rounds)
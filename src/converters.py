@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass, field
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+
+@dataclass
+class ConversionStats:
+    column: str
+    rows: int = 0
+    distinct: int = 0
+    failed: int = 0
+    examples: list[str] = field(default_factory=list)
+
+
+class Converter:
+    # Значения в выгрузках сильно повторяются (даты приема, суммы надбавок,
+    # проценты), поэтому колонка факторизуется, разбираются только уникальные
+    # значения, а результат разносится обратно по кодам.
+    max_examples = 5
+
+    def __init__(self) -> None:
+        self.stats: dict[str, ConversionStats] = {}
+        self._lock = threading.Lock()
+
+    # Загрузчик с конвертером передается в процессы пула, блокировку
+    # сериализовать нельзя — в процессе создается своя.
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def factorize(series: pd.Series) -> tuple[np.ndarray, pd.Index]:
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return series.cat.codes.to_numpy(), pd.Index(series.cat.categories)
+        codes, uniques = pd.factorize(series)
+        return codes, pd.Index(uniques)
+
+    @staticmethod
+    def broadcast(series: pd.Series, converted, codes: np.ndarray) -> pd.Series:
+        values = pd.api.extensions.take(np.asarray(converted), codes, allow_fill=True)
+        return pd.Series(values, index=series.index, name=series.name)
+
+    def _record(self, series: pd.Series, uniques: pd.Index, codes: np.ndarray, bad: np.ndarray) -> None:
+        name = str(series.name)
+        failed = int(np.bincount(codes[codes >= 0], minlength=len(uniques))[bad].sum()) if bad.any() else 0
+        with self._lock:
+            stats = self.stats.setdefault(name, ConversionStats(name))
+            stats.rows += len(series)
+            stats.distinct = max(stats.distinct, len(uniques))
+            stats.failed += failed
+            for value in uniques[bad]:
+                if len(stats.examples) >= self.max_examples:
+                    break
+                if str(value) not in stats.examples:
+                    stats.examples.append(str(value))
+
+    @staticmethod
+    def _unparsed(uniques: pd.Index, converted: pd.Index | np.ndarray) -> np.ndarray:
+        # Пустые строки считаются пропусками, а не ошибками разбора.
+        blank = uniques.astype(str).str.strip().isin(["", "nan", "NaN", "None"])
+        return np.asarray(pd.isna(converted)) & ~np.asarray(blank)
+
+    def to_numeric(self, series: pd.Series) -> pd.Series:
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            return series.astype("float64")
+        codes, uniques = self.factorize(series)
+        converted = pd.to_numeric(
+            uniques.astype(str).str.replace(",", ".", regex=False), errors="coerce"
+        ).astype("float64")
+        self._record(series, uniques, codes, self._unparsed(uniques, converted))
+        return self.broadcast(series, converted, codes).astype("float64")
+
+    def to_datetime(self, series: pd.Series, fmt: str | None = None, dayfirst: bool = False) -> pd.Series:
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return series
+        if fmt is None:
+            # Формат определяется один раз по первому значению колонки, как в pandas.
+            first = series.first_valid_index()
+            if first is not None:
+                fmt = guess_datetime_format(str(series.loc[first]), dayfirst=dayfirst)
+        codes, uniques = self.factorize(series)
+        converted = pd.to_datetime(
+            uniques.astype(object), errors="coerce", format=fmt, dayfirst=dayfirst
+        )
+        self._record(series, uniques, codes, self._unparsed(uniques, converted))
+        result = self.broadcast(series, converted.to_numpy(), codes)
+        return result.astype(converted.dtype)
+
+    def merge(self, stats: Iterable[ConversionStats]) -> None:
+        # Счетчики другого разбора (части файла, файла из кэша) добавляются к своим.
+        with self._lock:
+            for other in stats:
+                own = self.stats.setdefault(other.column, ConversionStats(other.column))
+                own.rows += other.rows
+                own.distinct = max(own.distinct, other.distinct)
+                own.failed += other.failed
+                for example in other.examples:
+                    if len(own.examples) >= self.max_examples:
+                        break
+                    if example not in own.examples:
+                        own.examples.append(example)
+
+    def failures(self) -> list[ConversionStats]:
+        return [stats for stats in self.stats.values() if stats.failed]
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+
+class DatasetSnapshot:
+    pointer_name = "CURRENT"
+
+    def __init__(self, root: Path | str, name: str = "employees", keep: int = 3) -> None:
+        self.root = Path(root)
+        self.name = name
+        self.keep = keep
+
+    @property
+    def pointer(self) -> Path:
+        return self.root / f"{self.name}.{self.pointer_name}"
+
+    @staticmethod
+    def version_of(df: pd.DataFrame) -> str:
+        digest = int(pd.util.hash_pandas_object(df, index=False).sum()) & (2**64 - 1)
+        return f"{digest:016x}{len(df):x}"
+
+    @staticmethod
+    def _replace(tmp: Path, path: Path) -> None:
+        with open(tmp, "rb") as fh:
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+
+    def publish(self, df: pd.DataFrame, version: str | None = None) -> str:
+        # Снимок пишется во временный файл и подменяется атомарно: сначала файл
+        # данных, затем указатель, поэтому читатели видят либо старую, либо новую
+        # версию целиком.
+        self.root.mkdir(parents=True, exist_ok=True)
+        version = version or self.version_of(df)
+        path = self.root / f"{self.name}-{version}.arrow"
+        if not path.exists():
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=64 * 1024)
+            self._replace(tmp, path)
+
+        tmp = self.pointer.with_name(f"{self.pointer.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({"version": version, "file": path.name}), encoding="utf-8")
+        self._replace(tmp, self.pointer)
+        self._prune(path)
+        return version
+
+    def _prune(self, current: Path) -> None:
+        # Удаление не мешает процессам, которые уже отобразили старый файл в память.
+        old = sorted(
+            (p for p in self.root.glob(f"{self.name}-*.arrow") if p != current),
+            key=lambda p: p.stat().st_mtime_ns,
+            reverse=True,
+        )
+        for path in old[max(self.keep - 1, 0):]:
+            path.unlink(missing_ok=True)
+
+    def current(self) -> tuple[str, Path] | None:
+        try:
+            meta = json.loads(self.pointer.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        return meta["version"], self.root / meta["file"]
+
+    def open_table(self) -> tuple[str, pa.Table] | None:
+        current = self.current()
+        if current is None:
+            return None
+        version, path = current
+        source = pa.memory_map(str(path), "r")
+        return version, pa.ipc.open_file(source).read_all()
+
+    def open_frame(self, columns: list[str] | None = None) -> tuple[str, pd.DataFrame] | None:
+        # Колонки остаются в отображенных страницах файла (ArrowDtype, без копии),
+        # поэтому все воркеры разделяют одну копию данных в page cache.
+        opened = self.open_table()
+        if opened is None:
+            return None
+        version, table = opened
+        if columns is not None:
+            table = table.select([col for col in columns if col in table.column_names])
+        return version, table.to_pandas(types_mapper=pd.ArrowDtype)
@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterator
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: без блокировки кэш рассчитан на один процесс.
+    fcntl = None
+
+HASH_CHUNK_SIZE = 1 << 20
+
+
+@dataclass(frozen=True)
+class FileStamp:
+    size: int
+    mtime_ns: int
+    sha256: str
+
+    @staticmethod
+    def content_hash(path: Path) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @classmethod
+    def of(cls, path: Path, known: FileStamp | None = None) -> FileStamp:
+        # Хэш пересчитывается только если размер или mtime изменились.
+        stat = path.stat()
+        if known and known.size == stat.st_size and known.mtime_ns == stat.st_mtime_ns:
+            return known
+        return cls(stat.st_size, stat.st_mtime_ns, cls.content_hash(path))
+
+
+class FrameCache:
+    # Индекс читается без блокировки (файл заменяется атомарно), а каждое
+    # чтение-изменение-запись идет под блокировкой index.lock, чтобы параллельные
+    # запуски не теряли записи друг друга. Попадание индекс не переписывает:
+    # время использования — mtime файла кадра, его и смотрит вытеснение.
+    index_name = "index.json"
+    lock_name = "index.lock"
+
+    def __init__(self, cache_dir: Path | str, max_bytes: int = 512 * 1024 * 1024) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+
+    def _read_index(self) -> dict[str, dict]:
+        path = self.cache_dir / self.index_name
+        if not path.exists():
+            return {}
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {}
+
+    def _write_index(self, index: dict[str, dict]) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self.cache_dir / self.index_name
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(index, ensure_ascii=False, indent=1), encoding="utf-8")
+        os.replace(tmp, path)
+
+    @contextmanager
+    def _locked(self) -> Iterator[dict[str, dict]]:
+        # Индекс перечитывается уже под блокировкой и записывается при выходе.
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.cache_dir / self.lock_name, "a") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            index = self._read_index()
+            yield index
+            self._write_index(index)
+
+    def _write_frame(self, df: pd.DataFrame, path: Path) -> None:
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        df.reset_index(drop=True).to_feather(tmp)
+        os.replace(tmp, path)
+
+    def _last_used(self, entry: dict) -> float:
+        try:
+            return (self.cache_dir / entry["file"]).stat().st_mtime
+        except OSError:
+            return 0.0
+
+    def _evict(self, index: dict[str, dict]) -> None:
+        frames = {key: entry for key, entry in index.items() if entry.get("file")}
+        total = sum(entry["bytes"] for entry in frames.values())
+        for key in sorted(frames, key=lambda k: self._last_used(frames[k])):
+            if total <= self.max_bytes:
+                break
+            entry = index.pop(key)
+            (self.cache_dir / entry["file"]).unlink(missing_ok=True)
+            total -= entry["bytes"]
+
+    def _touch(self, path: Path) -> None:
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _replace(self, index: dict[str, dict], key: str, entry: dict) -> None:
+        # Старый файл записи удаляется, только если это не тот же файл.
+        old = index.get(key)
+        if old and old.get("file") and old["file"] != entry["file"]:
+            (self.cache_dir / old["file"]).unlink(missing_ok=True)
+        index[key] = entry
+        self._evict(index)
+
+    def stamp(self, path: Path) -> FileStamp:
+        key = f"stamp|{path.resolve()}"
+        entry = self._read_index().get(key)
+        known = FileStamp(entry["size"], entry["mtime_ns"], entry["sha256"]) if entry else None
+        stamp = FileStamp.of(path, known)
+        if stamp != known:
+            with self._locked() as index:
+                index[key] = {**asdict(stamp), "file": None, "bytes": 0}
+        return stamp
+
+    def get(self, key: str, fingerprint: str) -> pd.DataFrame | None:
+        entry = self._read_index().get(key)
+        if not entry or entry.get("fingerprint") != fingerprint:
+            return None
+        path = self.cache_dir / entry["file"]
+        if not path.exists():
+            return None
+        df = pd.read_feather(path)
+        self._touch(path)
+        return df
+
+    def put(self, key: str, fingerprint: str, df: pd.DataFrame) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        path = self.cache_dir / f"{key.replace(':', '-')}.{fingerprint[:16]}.feather"
+        self._write_frame(df, path)
+        entry = {"fingerprint": fingerprint, "file": path.name, "bytes": path.stat().st_size}
+        with self._locked() as index:
+            self._replace(index, key, entry)
+
+    @staticmethod
+    def _key(path: Path, variant: str) -> str:
+        return f"{path.resolve()}|{variant}"
+
+    def has(self, key: str, fingerprint: str) -> bool:
+        entry = self._read_index().get(key)
+        return bool(
+            entry
+            and entry.get("fingerprint") == fingerprint
+            and (self.cache_dir / entry["file"]).exists()
+        )
+
+    def lookup(self, path: Path, variant: str = "") -> tuple[FileStamp, pd.DataFrame | None]:
+        key = self._key(path, variant)
+        entry = self._read_index().get(key)
+
+        known = None
+        if entry:
+            known = FileStamp(entry["size"], entry["mtime_ns"], entry["sha256"])
+        stamp = FileStamp.of(path, known)
+        frame_path = self.cache_dir / entry["file"] if entry else None
+        if not (entry and stamp.sha256 == entry["sha256"] and frame_path.exists()):
+            return stamp, None
+
+        df = pd.read_feather(frame_path)
+        self._touch(frame_path)
+        if stamp != known:
+            # Файл переписан без изменений: запоминаем новые размер и mtime,
+            # чтобы не хэшировать его снова.
+            with self._locked() as index:
+                if index.get(key, {}).get("file") == entry["file"]:
+                    index[key] = {**index[key], **asdict(stamp)}
+        return stamp, df
+
+    def store(
+        self,
+        path: Path,
+        variant: str,
+        stamp: FileStamp,
+        df: pd.DataFrame,
+        meta: dict | None = None,
+    ) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        key = self._key(path, variant)
+        variant_hash = hashlib.sha256(key.encode("utf-8")).hexdigest()[:12]
+        frame_path = self.cache_dir / f"{path.stem}.{variant_hash}.{stamp.sha256[:16]}.feather"
+        self._write_frame(df, frame_path)
+        entry = {**asdict(stamp), "file": frame_path.name, "bytes": frame_path.stat().st_size}
+        with self._locked() as index:
+            self._replace(index, key, entry)
+            if meta is not None:
+                # Сведения о разборе хранятся отдельной записью без файла: она
+                # переживает вытеснение кадра и нужна, даже когда файл не читается.
+                index[f"meta|{key}"] = {"sha256": stamp.sha256, "meta": meta, "file": None, "bytes": 0}
+
+    def lookup_meta(self, path: Path, variant: str, stamp: FileStamp) -> dict | None:
+        entry = self._read_index().get(f"meta|{self._key(path, variant)}")
+        if entry and entry["sha256"] == stamp.sha256:
+            return entry["meta"]
+        return None
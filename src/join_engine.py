@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+
+class KeyedJoiner:
+    def __init__(self) -> None:
+        self.duplicate_keys: dict[str, int] = {}
+        self.unmatched: dict[str, int] = {}
+
+    @staticmethod
+    def _encode(series: pd.Series, vocabulary: pd.Index) -> np.ndarray:
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Для категорий сопоставляется только словарь, строки не материализуются.
+            mapping = np.append(
+                vocabulary.get_indexer(series.cat.categories),
+                vocabulary.get_indexer([np.nan]),
+            )
+            return mapping[series.cat.codes.to_numpy()]
+        return vocabulary.get_indexer(series)
+
+    def key_codes(
+        self,
+        indexed: pd.DataFrame,
+        others: Sequence[pd.DataFrame],
+        on: Sequence[str],
+    ) -> tuple[np.ndarray, list[np.ndarray], int]:
+        # Ключи индексируемой таблицы кодируются целыми числами один раз,
+        # остальные таблицы переводятся в те же коды; -1 — ключа нет в индексе.
+        own = np.zeros(len(indexed), dtype=np.int64)
+        rest = [np.zeros(len(frame), dtype=np.int64) for frame in others]
+        for col in on:
+            vocabulary = pd.Index(np.asarray(indexed[col], dtype=object))
+            if vocabulary.is_unique:
+                # Уникальный ключ: код строки — ее позиция, хэш-таблица строится один раз.
+                codes = np.arange(len(vocabulary))
+            else:
+                codes, uniques = pd.factorize(indexed[col], use_na_sentinel=False)
+                vocabulary = pd.Index(np.asarray(uniques, dtype=object))
+            own = own * len(vocabulary) + codes
+            for i, frame in enumerate(others):
+                other_codes = self._encode(frame[col], vocabulary)
+                rest[i] = np.where(
+                    (rest[i] >= 0) & (other_codes >= 0),
+                    rest[i] * len(vocabulary) + other_codes,
+                    -1,
+                )
+        if len(on) == 1:
+            return own, rest, int(own.max(initial=-1)) + 1
+
+        own, uniques = pd.factorize(own)
+        combos = pd.Index(uniques)
+        rest = [np.where(codes >= 0, combos.get_indexer(codes), -1) for codes in rest]
+        return own, rest, len(combos)
+
+    @staticmethod
+    def _first_occurrences(codes: np.ndarray, size: int) -> np.ndarray:
+        # Позиция первого вхождения каждого кода; лишний последний элемент
+        # остается -1, по нему разрешается код -1 (ключа нет).
+        valid = np.flatnonzero(codes >= 0)
+        positions = np.full(size + 1, len(codes), dtype=np.int64)
+        np.minimum.at(positions, codes[valid], valid)
+        positions[positions == len(codes)] = -1
+        return positions
+
+    def count_duplicates(self, name: str, codes: np.ndarray, size: int) -> int:
+        valid = codes[codes >= 0]
+        duplicates = len(valid) - int(np.count_nonzero(np.bincount(valid, minlength=size)))
+        if duplicates:
+            self.duplicate_keys[name] = duplicates
+        return duplicates
+
+    def first_positions(self, name: str, codes: np.ndarray, size: int) -> np.ndarray:
+        self.count_duplicates(name, codes, size)
+        return self._first_occurrences(codes, size)
+
+    @staticmethod
+    def _same(left: pd.Series, right: pd.Series) -> np.ndarray:
+        if isinstance(left.dtype, pd.CategoricalDtype) and isinstance(right.dtype, pd.CategoricalDtype):
+            mapping = left.cat.categories.get_indexer(right.cat.categories)
+            mapping = np.append(np.where(mapping >= 0, mapping, -2), -1)
+            return left.cat.codes.to_numpy() == mapping[right.cat.codes.to_numpy()]
+
+        left_values = np.asarray(left, dtype=object)
+        right_values = np.asarray(right, dtype=object)
+        same = left_values == right_values
+        differ = ~same
+        if differ.any():
+            same[differ] = pd.isna(left_values[differ]) & pd.isna(right_values[differ])
+        return same
+
+    @staticmethod
+    def _take(frame: pd.DataFrame, columns: list[str], rows: np.ndarray) -> dict[str, object]:
+        taken = {}
+        for col in columns:
+            series = frame[col]
+            values = (
+                series.array
+                if pd.api.types.is_extension_array_dtype(series.dtype)
+                else series.to_numpy()
+            )
+            taken[col] = pd.api.extensions.take(values, rows, allow_fill=True)
+        return taken
+
+    def _first_match(
+        self,
+        frames: dict[str, pd.DataFrame],
+        rows: dict[str, np.ndarray],
+        owners: dict[str, str],
+        name: str,
+        shared: list[str],
+        wanted: np.ndarray,
+        present: np.ndarray,
+    ) -> np.ndarray:
+        # Ключ в таблице повторяется: коды ключа уточняются остальными общими
+        # колонками, и каждой строке результата достается первая строка таблицы
+        # с тем же сочетанием.
+        frame = frames[name]
+        for col in shared:
+            owner_rows = rows[owners[col]]
+            owner_codes, (col_codes,), col_size = self.key_codes(frames[owners[col]], [frame], [col])
+            owner_codes = np.where(owner_rows >= 0, owner_codes[owner_rows], -1)
+            wanted = np.where((wanted >= 0) & (owner_codes >= 0), wanted * col_size + owner_codes, -1)
+            present = np.where((present >= 0) & (col_codes >= 0), present * col_size + col_codes, -1)
+            # Коды сжимаются после каждой колонки, чтобы произведение не переполнилось.
+            both = np.concatenate([wanted, present])
+            dense = pd.factorize(both)[0]
+            dense[both < 0] = -1
+            wanted, present = dense[: len(wanted)], dense[len(wanted):]
+        size = int(max(wanted.max(initial=-1), present.max(initial=-1))) + 1
+        return self._first_occurrences(present, size)[wanted]
+
+    def inner_join(self, frames: dict[str, pd.DataFrame], on: str) -> pd.DataFrame:
+        # Как цепочка merge без on= с последующим отбором первой строки по ключу:
+        # для каждой строки первой таблицы берется первая строка следующей, у
+        # которой совпадают ключ и остальные общие колонки, а из строк первой
+        # таблицы с одним ключом остается первая, нашедшая пару во всех таблицах.
+        names = list(frames)
+        base = frames[names[0]]
+        base_codes, codes, size = self.key_codes(base, list(frames.values())[1:], [on])
+        duplicates = {
+            name: self.count_duplicates(name, table_codes, size)
+            for name, table_codes in zip(names, [base_codes, *codes])
+        }
+
+        rows = {names[0]: np.arange(len(base))}
+        owners = {col: names[0] for col in base.columns}
+        mask = np.ones(len(base), dtype=bool)
+        for name, table_codes in zip(names[1:], codes):
+            shared = [col for col in frames[name].columns if col != on and col in owners]
+            if duplicates[name]:
+                positions = self._first_match(frames, rows, owners, name, shared, base_codes, table_codes)
+                checked = []
+            else:
+                # Ключ уникален: пара одна, общие колонки только проверяются.
+                positions = self._first_occurrences(table_codes, size)[base_codes]
+                checked = shared
+            mask &= positions >= 0
+            safe = np.where(positions >= 0, positions, 0)
+            for col in checked:
+                owner_rows = rows[owners[col]]
+                mask &= self._same(
+                    frames[owners[col]][col].iloc[np.where(owner_rows >= 0, owner_rows, 0)],
+                    frames[name][col].iloc[safe],
+                )
+            rows[name] = positions
+            for col in frames[name].columns:
+                owners.setdefault(col, name)
+
+        matched = np.flatnonzero(mask)
+        _, first = np.unique(base_codes[matched], return_index=True)
+        selected = np.sort(matched[first])
+        columns = {}
+        for name in names:
+            own_columns = [col for col, owner in owners.items() if owner == name]
+            columns.update(self._take(frames[name], own_columns, rows[name][selected]))
+        return pd.DataFrame(columns, copy=False)
+
+    def left_join(
+        self,
+        df: pd.DataFrame,
+        dim: pd.DataFrame,
+        on: Sequence[str],
+        name: str,
+    ) -> pd.DataFrame:
+        dim_codes, (left_codes,), size = self.key_codes(dim, [df], on)
+        positions = self.first_positions(name, dim_codes, size)[left_codes]
+        self.unmatched[name] = int((positions < 0).sum())
+        columns = [col for col in dim.columns if col not in on and col not in df.columns]
+        df = df.copy(deep=False)
+        for col, values in self._take(dim, columns, positions).items():
+            df[col] = values
+        return df
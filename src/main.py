@@ -3,7 +3,36 @@ from __future__ import annotations
 import argparse
 from pathlib import Path
 
+import numpy as np
+
+from allocation import AllocationRules
+from output_store import OUTPUT_FORMATS
+from parallel_loader import ParallelLoader
 from payroll_processor import PayrollProcessor
+from profiling import Profiler, activate
+from raise_rules import RaiseRule, load_rule_grid
+from streaming import StreamingPayrollProcessor
+
+
+def parse_limits(value: str) -> list[float]:
+    try:
+        if ":" in value:
+            start, stop, step = (float(part) for part in value.split(":"))
+            if step <= 0 or stop < start:
+                raise ValueError
+            count = int(np.floor((stop - start) / step + 1e-9)) + 1
+            return (start + step * np.arange(count)).tolist()
+        return [float(part) for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            "ожидается число, список через запятую или диапазон start:stop:step"
+        ) from None
+
+
+def print_conversion_failures(processor: PayrollProcessor) -> None:
+    for stats in processor.conversion_failures():
+        examples = ", ".join(stats.examples)
+        print(f"Не разобрано значений в {stats.column}: {stats.failed} из {stats.rows} (например: {examples})")
 
 
 def main() -> None:
@@ -23,18 +52,216 @@ def main() -> None:
     )
     parser.add_argument(
         "--limit",
-        default=10_000_000,
-        type=float,
-        help="Лимит бюджета на повышение",
+        default=[10_000_000.0],
+        type=parse_limits,
+        help=(
+            "Лимит бюджета на повышение; список (5e6,1e7) или диапазон (5e6:15e6:2.5e6) "
+            "включает режим сравнения сценариев"
+        ),
+    )
+    parser.add_argument(
+        "--sweep-matrix",
+        action="store_true",
+        help="В режиме сценариев сохранить повышения по сотрудникам для каждого лимита",
+    )
+    parser.add_argument(
+        "--rule",
+        default=None,
+        type=Path,
+        metavar="JSON",
+        help="Параметры правила рекомендаций: порог проплаченности, срок с повышения, стаж, ставка, процент",
+    )
+    parser.add_argument(
+        "--rule-grid",
+        default=None,
+        type=Path,
+        metavar="JSON",
+        help="Сравнить варианты правила рекомендаций: список правил или списки значений параметров",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        type=Path,
+        help="Каталог кэша разобранных CSV (по умолчанию кэш выключен)",
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        default=512,
+        type=int,
+        help="Максимальный размер кэша, МБ",
+    )
+    parser.add_argument(
+        "--explain",
+        action="store_true",
+        help="Показать этапы расчета: какие взяты из кэша, какие пересчитаны",
+    )
+    parser.add_argument(
+        "--workers",
+        default=1,
+        type=int,
+        help="Число потоков/процессов для чтения исходных CSV (0 — по числу ядер)",
+    )
+    parser.add_argument(
+        "--pool",
+        choices=("thread", "process"),
+        default="thread",
+        help="Тип пула для параллельного чтения",
+    )
+    parser.add_argument(
+        "--split-mb",
+        default=None,
+        type=int,
+        help="Файлы крупнее этого размера (МБ) разбираются по частям параллельно",
+    )
+    parser.add_argument(
+        "--metrics-workers",
+        default=1,
+        type=int,
+        help="Число процессов для расчета метрик по диапазонам строк (0 — по числу ядер)",
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=tuple(OUTPUT_FORMATS),
+        default="csv",
+        help="Формат результатов: csv, csv.gz, parquet или feather",
+    )
+    parser.add_argument(
+        "--partition-by-mrf",
+        action="store_true",
+        help="Разбить результаты на файлы по МРФ",
+    )
+    parser.add_argument(
+        "--allocation",
+        default=None,
+        type=Path,
+        metavar="JSON",
+        help="Правила распределения лимита: потолок и минимум повышения, бюджеты по МРФ и грейдам",
+    )
+    parser.add_argument(
+        "--period",
+        default=None,
+        help="Сохранить результат как снимок периода (например, 2024-05) для сравнения через period_store.py",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Потоковый режим для больших файлов: штатные таблицы читаются кусками",
+    )
+    parser.add_argument(
+        "--memory-limit",
+        default=1024,
+        type=int,
+        help="Бюджет памяти потокового режима, МБ",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="JSON",
+        help="Замерить время, CPU, память и строки по этапам; отчет в JSON (по умолчанию output/profile.json)",
     )
     args = parser.parse_args()
 
-    processor = PayrollProcessor(args.data_dir, args.output_dir)
-    employees, vacancies, leftover = processor.process(budget_limit=args.limit)
+    if args.profile is None:
+        run(parser, args)
+        return
+
+    profiler = Profiler(trace_memory=True)
+    with activate(profiler):
+        run(parser, args)
+    print(profiler.table())
+    path = Path(args.profile) if args.profile else args.output_dir / "profile.json"
+    profiler.save(path)
+    print(f"Профиль сохранен: {path}")
+
+
+def run(parser: argparse.ArgumentParser, args: argparse.Namespace) -> None:
+    loader = None
+    if args.workers != 1:
+        loader = ParallelLoader(
+            args.workers or None,
+            pool=args.pool,
+            split_bytes=args.split_mb * 1024 * 1024 if args.split_mb else None,
+        )
+
+    if args.allocation and (args.stream or len(args.limit) > 1):
+        parser.error("--allocation работает только с одним лимитом и без --stream")
+
+    rule = RaiseRule.from_file(args.rule) if args.rule else None
+    if args.rule_grid and (args.stream or len(args.limit) > 1):
+        parser.error("--rule-grid работает только с одним лимитом и без --stream")
+
+    if args.period and (args.stream or len(args.limit) > 1 or args.rule_grid):
+        parser.error("--period сохраняет только обычный расчет с одним лимитом")
+
+    if args.stream:
+        if len(args.limit) > 1:
+            parser.error("--stream поддерживает только один лимит")
+        if args.output_format != "csv" or args.partition_by_mrf:
+            parser.error("--stream пишет только несжатый CSV без разбиения")
+        streaming = StreamingPayrollProcessor(
+            args.data_dir,
+            args.output_dir,
+            memory_limit=args.memory_limit * 1024 * 1024,
+            cache_dir=args.cache_dir,
+            cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+            rule=rule,
+        )
+        result = streaming.process_stream(budget_limit=args.limit[0])
+        print(f"Сотрудников обработано: {result.employees}")
+        print(f"Вакансий отделено: {result.vacancies}")
+        print(f"Неиспользованный лимит: {result.leftover:.2f}")
+        print(f"Частей: {result.partitions}")
+        for name, count in streaming.duplicate_keys.items():
+            print(f"Отброшено дубликатов ключа в {name}: {count}")
+        print_conversion_failures(streaming)
+        return
+
+    processor = PayrollProcessor(
+        args.data_dir,
+        args.output_dir,
+        cache_dir=args.cache_dir,
+        cache_max_bytes=args.cache_max_mb * 1024 * 1024,
+        loader=loader,
+        output_format=args.output_format,
+        partition_by="МРФ" if args.partition_by_mrf else None,
+        allocation=AllocationRules.from_file(args.allocation) if args.allocation else None,
+        metrics_workers=args.metrics_workers,
+        rule=rule,
+    )
+    if args.rule_grid:
+        prepared, _ = processor.prepare()
+        summary = processor.rule_grid(prepared, load_rule_grid(args.rule_grid), args.limit[0])
+        processor.save_rule_grid(summary)
+        print(summary.to_string(index=False))
+        print_conversion_failures(processor)
+        if args.explain:
+            print(processor.pipeline.explain())
+        return
+    if len(args.limit) > 1:
+        prepared, _ = processor.prepare()
+        summary, matrix = processor.budget_sweep(prepared, args.limit, with_matrix=args.sweep_matrix)
+        processor.save_sweep(summary, matrix)
+        print(summary[["Лимит", "Коэффициент", "Сумма повышений", "Остаток лимита"]].to_string(index=False))
+        print_conversion_failures(processor)
+        if args.explain:
+            print(processor.pipeline.explain())
+        return
+
+    employees, vacancies, leftover = processor.process(budget_limit=args.limit[0])
 
     print(f"Сотрудников обработано: {len(employees)}")
     print(f"Вакансий отделено: {len(vacancies)}")
     print(f"Неиспользованный лимит: {leftover:.2f}")
+    if args.period:
+        saved = processor.save_period(employees, args.period)
+        print(f"Период {saved.period} сохранен: строк {saved.rows}, новых частей {saved.written} из {saved.parts}")
+    for name, count in processor.duplicate_keys.items():
+        print(f"Отброшено дубликатов ключа в {name}: {count}")
+    print_conversion_failures(processor)
+    if args.explain:
+        print(processor.pipeline.explain())
 
 
 if __name__ == "__main__":
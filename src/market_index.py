@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import asdict
+from pathlib import Path
+from typing import Callable, Sequence
+
+import numpy as np
+import pandas as pd
+
+from frame_cache import FileStamp
+from join_engine import KeyedJoiner
+
+
+class MarketRateIndex:
+    rate_column = "ФОТ по рынку"
+
+    def __init__(self, keys: pd.DataFrame, rates: np.ndarray, duplicates: int = 0) -> None:
+        # keys — уникальные составные ключи (категории = компактные коды),
+        # rates[i] — ставка по ключу в строке i.
+        self.keys = keys
+        self.rates = np.ascontiguousarray(rates, dtype=np.float64)
+        self.duplicates = duplicates
+        self._lookup: dict[tuple[str, ...], int] | None = None
+
+    @property
+    def key_columns(self) -> list[str]:
+        return list(self.keys.columns)
+
+    @classmethod
+    def build(cls, market: pd.DataFrame, key_columns: Sequence[str]) -> MarketRateIndex:
+        first = ~market.duplicated(subset=list(key_columns))
+        unique = market.loc[first].reset_index(drop=True)
+        keys = pd.DataFrame({col: unique[col].astype("category") for col in key_columns})
+        rates = pd.to_numeric(unique[cls.rate_column], errors="coerce").to_numpy(dtype=np.float64)
+        return cls(keys, rates, duplicates=int((~first).sum()))
+
+    @classmethod
+    def load_or_build(
+        cls,
+        source: Path,
+        cache_dir: Path,
+        key_columns: Sequence[str],
+        load_market: Callable[[], pd.DataFrame],
+    ) -> MarketRateIndex:
+        frame_path = cache_dir / "market_index.feather"
+        meta_path = cache_dir / "market_index.json"
+        known = None
+        meta = {}
+        if meta_path.exists() and frame_path.exists():
+            try:
+                meta = json.loads(meta_path.read_text(encoding="utf-8"))
+                known = FileStamp(**meta["stamp"])
+            except (OSError, ValueError, KeyError, TypeError):
+                known = None
+        stamp = FileStamp.of(source, known)
+
+        if known and stamp.sha256 == known.sha256 and meta.get("key_columns") == list(key_columns):
+            frame = pd.read_feather(frame_path)
+            index = cls(frame[list(key_columns)], frame[cls.rate_column].to_numpy(), meta["duplicates"])
+        else:
+            index = cls.build(load_market(), key_columns)
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp = frame_path.with_name(f"{frame_path.name}.{os.getpid()}.tmp")
+            index.keys.assign(**{cls.rate_column: index.rates}).to_feather(tmp)
+            os.replace(tmp, frame_path)
+
+        if stamp != known:
+            meta = {
+                "stamp": asdict(stamp),
+                "key_columns": list(key_columns),
+                "duplicates": index.duplicates,
+            }
+            tmp = meta_path.with_name(f"{meta_path.name}.{os.getpid()}.tmp")
+            tmp.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, meta_path)
+        return index
+
+    def codes(self, df: pd.DataFrame) -> np.ndarray:
+        _, (codes,), _ = KeyedJoiner().key_codes(self.keys, [df], self.key_columns)
+        return codes
+
+    def rates_for(self, df: pd.DataFrame) -> np.ndarray:
+        codes = self.codes(df)
+        return np.where(codes >= 0, self.rates[np.maximum(codes, 0)], np.nan)
+
+    def rate(self, *key: str) -> float | None:
+        if self._lookup is None:
+            columns = [self.keys[col].astype(str).to_numpy() for col in self.key_columns]
+            self._lookup = {values: i for i, values in enumerate(zip(*columns))}
+        position = self._lookup.get(tuple(str(part) for part in key))
+        if position is None:
+            return None
+        return float(self.rates[position])
@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable
+
+import pandas as pd
+
+OUTPUT_FORMATS = {
+    "csv": ".csv",
+    "csv.gz": ".csv.gz",
+    "parquet": ".parquet",
+    "feather": ".feather",
+}
+MANIFEST_NAME = "manifest.json"
+
+
+class OutputWriter:
+    def __init__(
+        self,
+        root: Path | str,
+        fmt: str = "csv",
+        partition_by: str | None = None,
+        workers: int = 4,
+    ) -> None:
+        if fmt not in OUTPUT_FORMATS:
+            raise ValueError(f"Неизвестный формат вывода: {fmt}")
+        self.root = Path(root)
+        self.fmt = fmt
+        self.partition_by = partition_by
+        self.workers = workers
+
+    def _write_file(self, df: pd.DataFrame, path: Path) -> None:
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        if self.fmt == "parquet":
+            df.to_parquet(tmp, index=False)
+        elif self.fmt == "feather":
+            df.reset_index(drop=True).to_feather(tmp)
+        else:
+            df.to_csv(tmp, index=False, compression="gzip" if self.fmt == "csv.gz" else None)
+        os.replace(tmp, path)
+
+    def write(self, name: str, df: pd.DataFrame, version: str) -> dict:
+        suffix = OUTPUT_FORMATS[self.fmt]
+        entry = {
+            "rows": len(df),
+            "columns": {col: str(dtype) for col, dtype in df.dtypes.items()},
+            "partition_by": None,
+            "files": [],
+        }
+        if not self.partition_by or self.partition_by not in df.columns:
+            path = self.root / f"{name}{suffix}"
+            self._write_file(df, path)
+            entry["files"].append({"path": path.name, "rows": len(df), "value": None})
+            return entry
+
+        # Части лежат в каталоге версии: читатели старого манифеста не видят
+        # наполовину перезаписанных файлов.
+        folder = self.root / f"{name}-{version[:16]}"
+        folder.mkdir(parents=True, exist_ok=True)
+        groups = df.groupby(self.partition_by, observed=True, dropna=False, sort=True).indices
+        parts = []
+        for number, (value, rows) in enumerate(groups.items()):
+            path = folder / f"part-{number:05d}{suffix}"
+            label = None if pd.isna(value) else str(value)
+            parts.append((path, rows, label))
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(lambda part: self._write_file(df.iloc[part[1]], part[0]), parts))
+        entry["partition_by"] = self.partition_by
+        entry["files"] = [
+            {"path": f"{folder.name}/{path.name}", "rows": len(rows), "value": label}
+            for path, rows, label in parts
+        ]
+        return entry
+
+    def write_manifest(self, tables: dict[str, dict], version: str) -> None:
+        manifest = {"version": version, "format": self.fmt, "tables": tables}
+        path = self.root / MANIFEST_NAME
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding="utf-8")
+        os.replace(tmp, path)
+        self._prune(manifest)
+
+    def _prune(self, manifest: dict) -> None:
+        current = {
+            Path(item["path"]).parts[0]
+            for table in manifest["tables"].values()
+            for item in table["files"]
+        }
+        for name in manifest["tables"]:
+            for folder in self.root.glob(f"{name}-*"):
+                if folder.is_dir() and folder.name not in current:
+                    shutil.rmtree(folder, ignore_errors=True)
+
+
+class OutputReader:
+    def __init__(self, root: Path | str) -> None:
+        self.root = Path(root)
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.root / MANIFEST_NAME
+
+    def manifest(self) -> dict | None:
+        try:
+            return json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _read_file(path: Path, fmt: str, columns: list[str] | None, dtype: dict | None) -> pd.DataFrame:
+        if fmt == "parquet":
+            return pd.read_parquet(path, columns=columns)
+        if fmt == "feather":
+            return pd.read_feather(path, columns=columns)
+        return pd.read_csv(path, usecols=columns, dtype=dtype)
+
+    def read(
+        self,
+        name: str,
+        columns: Iterable[str] | None = None,
+        partitions: Iterable[str] | None = None,
+        dtype: dict | None = None,
+        manifest: dict | None = None,
+    ) -> pd.DataFrame:
+        # Читаются только нужные колонки и части; без манифеста — старый CSV.
+        manifest = manifest or self.manifest()
+        columns = list(columns) if columns is not None else None
+        if manifest is None or name not in manifest["tables"]:
+            return self._read_file(self.root / f"{name}.csv", "csv", columns, dtype)
+
+        table = manifest["tables"][name]
+        if columns is not None:
+            columns = [col for col in columns if col in table["columns"]]
+        files = table["files"]
+        if partitions is not None and table["partition_by"]:
+            wanted = set(partitions)
+            files = [item for item in files if item["value"] in wanted]
+        frames = [
+            self._read_file(self.root / item["path"], manifest["format"], columns, dtype)
+            for item in files
+        ]
+        if not frames:
+            return pd.DataFrame(columns=columns or list(table["columns"]))
+        return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
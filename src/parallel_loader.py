@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import io
+import os
+import pickle
+from concurrent.futures import FIRST_EXCEPTION, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import pandas as pd
+
+from converters import ConversionStats, Converter
+
+if TYPE_CHECKING:
+    from payroll_processor import BaseCSVLoader, SourceSchema
+
+
+def byte_ranges(path: Path, parts: int) -> tuple[bytes, list[tuple[int, int]]]:
+    # Границы диапазонов сдвигаются до конца строки. Разбиение предполагает, что
+    # в значениях нет переводов строк внутри кавычек (в выгрузках их нет).
+    size = path.stat().st_size
+    with open(path, "rb") as fh:
+        header = fh.readline()
+        bounds = [fh.tell()]
+        step = max((size - bounds[0]) // parts, 1)
+        for i in range(1, parts):
+            fh.seek(max(bounds[0] + step * i, bounds[-1]))
+            fh.readline()
+            position = fh.tell()
+            if position >= size:
+                break
+            bounds.append(position)
+    bounds.append(size)
+    return header, [(start, end) for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def parse_range(
+    loader: BaseCSVLoader,
+    path: Path,
+    schema: SourceSchema,
+    header: bytes,
+    start: int,
+    end: int,
+) -> tuple[pd.DataFrame, list[ConversionStats]]:
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        data = header + fh.read(end - start)
+    loader = loader.isolated()
+    options, numeric = loader._read_options(path, schema)
+    df = loader._convert(pd.read_csv(io.BytesIO(data), **options), schema, numeric)
+    return df, list(loader.converter.stats.values())
+
+
+def parse_file(
+    loader: BaseCSVLoader, path: Path, schema: SourceSchema
+) -> tuple[pd.DataFrame, list[ConversionStats]]:
+    return loader.parse_csv(path, schema)
+
+
+class ParallelLoader:
+    def __init__(self, workers: int | None = None, pool: str = "thread", split_bytes: int | None = None) -> None:
+        if pool not in ("thread", "process"):
+            raise ValueError(f"Неизвестный тип пула: {pool}")
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = pool
+        self.split_bytes = split_bytes
+
+    def _executor(self) -> Executor:
+        if self.pool == "process":
+            return ProcessPoolExecutor(max_workers=self.workers)
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="csv")
+
+    def _submit(
+        self,
+        executor: Executor,
+        loader: BaseCSVLoader,
+        path: Path,
+        schema: SourceSchema,
+    ) -> list[Future]:
+        size = path.stat().st_size
+        if self.split_bytes and size > self.split_bytes and self.workers > 1:
+            parts = min(self.workers, -(-size // self.split_bytes))
+            header, ranges = byte_ranges(path, parts)
+            return [
+                executor.submit(parse_range, loader, path, schema, header, start, end)
+                for start, end in ranges
+            ]
+        return [executor.submit(parse_file, loader, path, schema)]
+
+    @staticmethod
+    def _combine(pieces: list[pd.DataFrame], schema: SourceSchema) -> pd.DataFrame:
+        if len(pieces) == 1:
+            return pieces[0]
+        df = pd.concat(pieces, ignore_index=True)
+        # У частей разные словари категорий, после concat колонка становится object.
+        for col in schema.categorical:
+            if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype("category")
+        return df
+
+    @staticmethod
+    def _combine_stats(parts: list[list[ConversionStats]], rows: int) -> list[ConversionStats]:
+        # В частях, где C-парсер сразу прочитал колонку числами, конвертер ее
+        # не видит; строк в колонке столько же, сколько в файле.
+        combined = Converter()
+        for stats in parts:
+            combined.merge(stats)
+        for stats in combined.stats.values():
+            stats.rows = rows
+        return list(combined.stats.values())
+
+    def load(
+        self,
+        loader: BaseCSVLoader,
+        jobs: dict[str, tuple[Path, SourceSchema]],
+    ) -> dict[str, tuple[pd.DataFrame, list[ConversionStats]]]:
+        # Вместе с кадром возвращаются счетчики разбора всех частей файла.
+        # Первая же ошибка отменяет еще не начатые задачи и пробрасывается
+        # с именем файла. Перед этим пул дожидается уже запущенных задач:
+        # иначе его служебный поток остается жить и процесс зависает на выходе.
+        if self.pool == "process":
+            # Ошибка сериализации в потоке подачи задач оставляет задачу в пуле
+            # навсегда, и ожидание пула не завершается. Загрузчик проверяется
+            # заранее, до запуска процессов.
+            pickle.dumps(loader)
+        executor = self._executor()
+        try:
+            futures = {name: self._submit(executor, loader, path, schema) for name, (path, schema) in jobs.items()}
+            owners = {future: name for name, parts in futures.items() for future in parts}
+            done, _ = wait(owners, return_when=FIRST_EXCEPTION)
+            for future in done:
+                error = future.exception()
+                if error is not None:
+                    error.add_note(f"Файл: {jobs[owners[future]][0]}")
+                    raise error
+            result = {}
+            for name, parts in futures.items():
+                df = self._combine([future.result()[0] for future in parts], jobs[name][1])
+                result[name] = (df, self._combine_stats([future.result()[1] for future in parts], len(df)))
+        except BaseException:
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        executor.shutdown(wait=False)
+        return result
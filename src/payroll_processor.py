@@ -1,15 +1,34 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import copy
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
-from typing import Iterable
+from typing import Iterable, Iterator
 
 import matplotlib
 import numpy as np
 import pandas as pd
 
 matplotlib.use("Agg")
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+
+from aggregation import AggregationCube, base_cuboid
+from allocation import AllocationRules, water_fill
+from converters import ConversionStats, Converter
+from dataset_snapshot import DatasetSnapshot
+from frame_cache import FileStamp, FrameCache
+from join_engine import KeyedJoiner
+from market_index import MarketRateIndex
+from output_store import OutputWriter
+from parallel_loader import ParallelLoader
+from profiling import stage
+from raise_rules import RaiseRule, evaluate_rules
+from period_store import PeriodStore, SavedPeriod
+from pipeline import Stage, StagePipeline
+from shared_columns import SharedColumns
 
 
 @dataclass
@@ -23,49 +42,302 @@ class SourceFiles:
     market: str = "ФОТ по рынку.csv"
 
 
+UNIT_KEY = "Имя штатной единицы"
+TAB_KEY = "Таб. №"
+STATUS = "Статус назначения"
+UNIT_PATH = "Структурное подразделение - полный путь с группирующими"
+FUNCTION_CODE = "Код функции"
+POSITION = "Должность /профессия (разряд, категория)"
+GRADE = "Грейд"
+MARKET_KEY = [UNIT_PATH, FUNCTION_CODE, POSITION, GRADE]
+COST_SPLIT = ["OPEX", "CAPEX", "O2O"]
+PREMIUM_COLUMNS = ["Процент месячной премии", "Процент квартальной премии", "Процент годовой премии"]
+# Измерения и аддитивные меры куба для разрезов кабинета.
+CUBE_DIMENSIONS = {"mrf": "МРФ", "rf": "РФ", "function": FUNCTION_CODE, "unit": UNIT_PATH, "grade": GRADE}
+CUBE_MEASURES = ["ФОТ", "ФОТ с СВ", *(f"ФОТ_{col}" for col in COST_SPLIT), "Сумма повышения"]
+
+
+@dataclass(frozen=True)
+class SourceSchema:
+    numeric: tuple[str, ...] = ()
+    categorical: tuple[str, ...] = ()
+    dates: tuple[tuple[str, str | None], ...] = ()
+    text: tuple[str, ...] = ()
+    numeric_by_default: bool = False
+    dayfirst: bool = True
+    decimal: str = ","
+
+    def numeric_columns(self, columns: Iterable[str]) -> list[str]:
+        if not self.numeric_by_default:
+            return [col for col in columns if col in self.numeric]
+        typed = {*self.categorical, *self.text, *(col for col, _ in self.dates)}
+        return [col for col in columns if col not in typed]
+
+
+@dataclass
+class SourceSchemas:
+    positions: SourceSchema = field(
+        default_factory=lambda: SourceSchema(
+            categorical=(STATUS, POSITION, GRADE),
+            text=(UNIT_KEY, TAB_KEY, "Ф.И.О."),
+        )
+    )
+    salaries: SourceSchema = field(
+        default_factory=lambda: SourceSchema(
+            categorical=(STATUS,),
+            dates=(("Дата последнего повышения", "%Y-%m-%d"),),
+            text=(UNIT_KEY, TAB_KEY),
+            numeric_by_default=True,
+        )
+    )
+    org_units: SourceSchema = field(
+        default_factory=lambda: SourceSchema(
+            categorical=(STATUS, UNIT_PATH, FUNCTION_CODE, "РФ", "МРФ"),
+            dates=(("Дата приема", None),),
+            text=(UNIT_KEY, TAB_KEY),
+        )
+    )
+    projects: SourceSchema = field(
+        default_factory=lambda: SourceSchema(
+            numeric=("OPEX", "CAPEX", "O2O"),
+            categorical=(STATUS,),
+            text=(UNIT_KEY, TAB_KEY),
+        )
+    )
+    bonuses: SourceSchema = field(
+        default_factory=lambda: SourceSchema(
+            numeric=(
+                "Процент месячной премии",
+                "Процент квартальной премии",
+                "Процент годовой премии",
+            ),
+            categorical=(STATUS,),
+            text=(UNIT_KEY, TAB_KEY),
+        )
+    )
+    insurance: SourceSchema = field(
+        default_factory=lambda: SourceSchema(
+            numeric=("Процентр страховых взносов",),
+            categorical=("РФ",),
+            decimal=".",
+        )
+    )
+    market: SourceSchema = field(
+        default_factory=lambda: SourceSchema(
+            numeric=("ФОТ по рынку",),
+            categorical=(UNIT_PATH, FUNCTION_CODE, POSITION, GRADE),
+            decimal=".",
+        )
+    )
+
+
 class BaseCSVLoader:
-    def __init__(self, data_dir: Path | str) -> None:
+    def __init__(
+        self,
+        data_dir: Path | str,
+        cache_dir: Path | str | None = None,
+        cache_max_bytes: int = 512 * 1024 * 1024,
+    ) -> None:
         self.data_dir = Path(data_dir)
+        self.cache = FrameCache(cache_dir, cache_max_bytes) if cache_dir else None
+        self.converter = Converter()
+        # Неразобранные значения файлов, прочитанных через кэш (разобранных заново
+        # или взятых из него), по пути файла; у файлов, разобранных в
+        # self.converter, — пустой список.
+        self.source_failures: dict[Path, list[ConversionStats]] = {}
+
+    def _to_numeric(self, series: pd.Series) -> pd.Series:
+        return self.converter.to_numeric(series)
+
+    def _parse_date(self, series: pd.Series, fmt: str | None = None, dayfirst: bool = False) -> pd.Series:
+        return self.converter.to_datetime(series, fmt=fmt, dayfirst=dayfirst)
+
+    def _read_options(self, path: Path, schema: SourceSchema) -> tuple[dict, list[str]]:
+        columns = pd.read_csv(path, sep="\t", encoding="utf-8-sig", nrows=0).columns
+        numeric = schema.numeric_columns(columns)
+        categorical = set(schema.categorical)
+        # Числа разбирает C-парсер с нужным десятичным разделителем,
+        # остальные колонки читаются как строки или категории.
+        dtype = {
+            col: "category" if col in categorical else str
+            for col in columns
+            if col not in numeric
+        }
+        options = {"sep": "\t", "encoding": "utf-8-sig", "dtype": dtype, "decimal": schema.decimal}
+        return options, numeric
+
+    def _convert(self, df: pd.DataFrame, schema: SourceSchema, numeric: list[str]) -> pd.DataFrame:
+        for col in numeric:
+            df[col] = self._to_numeric(df[col])
+        for col, fmt in schema.dates:
+            if col in df.columns:
+                df[col] = self._parse_date(df[col], fmt=fmt, dayfirst=schema.dayfirst)
+        return df
+
+    def read_csv(self, path: Path, schema: SourceSchema | None = None) -> pd.DataFrame:
+        if schema is None:
+            return pd.read_csv(path, sep="\t", encoding="utf-8-sig", dtype=str)
+        options, numeric = self._read_options(path, schema)
+        return self._convert(pd.read_csv(path, **options), schema, numeric)
+
+    def iter_csv(self, path: Path, schema: SourceSchema, chunksize: int) -> Iterator[pd.DataFrame]:
+        # Счетчики кусков копятся в self.converter, сохраненные в кэше не нужны.
+        self.source_failures[path] = []
+        options, numeric = self._read_options(path, schema)
+        with pd.read_csv(path, chunksize=chunksize, **options) as reader:
+            for chunk in reader:
+                yield self._convert(chunk, schema, numeric)
 
-    def load_csv(self, filename: str) -> pd.DataFrame:
+    @staticmethod
+    def cache_variant(schema: SourceSchema | None) -> str:
+        return repr(schema) if schema else "str"
+
+    def isolated(self) -> BaseCSVLoader:
+        # Копия со своим конвертером: счетчики разбора относятся к одному файлу.
+        loader = copy.copy(self)
+        loader.converter = Converter()
+        return loader
+
+    def parse_csv(self, path: Path, schema: SourceSchema | None = None) -> tuple[pd.DataFrame, list[ConversionStats]]:
+        loader = self.isolated()
+        return loader.read_csv(path, schema), list(loader.converter.stats.values())
+
+    def cached_failures(self, path: Path, variant: str, stamp: FileStamp) -> list[ConversionStats] | None:
+        meta = self.cache.lookup_meta(path, variant, stamp)
+        if meta is None:
+            return None
+        return [ConversionStats(**stats) for stats in meta["conversion_failures"]]
+
+    def store_parsed(
+        self, path: Path, variant: str, stamp: FileStamp, df: pd.DataFrame, stats: list[ConversionStats]
+    ) -> None:
+        # Неразобранные значения сохраняются вместе с кадром, чтобы прогон
+        # из кэша показывал тот же отчет, что и с разбором.
+        failures = [item for item in stats if item.failed]
+        meta = {"conversion_failures": [asdict(item) for item in failures]}
+        self.cache.store(path, variant, stamp, df, meta=meta)
+        self.source_failures[path] = failures
+
+    def load_csv(self, filename: str, schema: SourceSchema | None = None) -> pd.DataFrame:
         path = self.data_dir / filename
-        return pd.read_csv(path, sep="\t", encoding="utf-8-sig", dtype=str)
+        if self.cache is None:
+            return self.read_csv(path, schema)
+        variant = self.cache_variant(schema)
+        stamp, df = self.cache.lookup(path, variant)
+        failures = self.cached_failures(path, variant, stamp) if df is not None else None
+        if failures is None:
+            df, stats = self.parse_csv(path, schema)
+            self.store_parsed(path, variant, stamp, df, stats)
+        else:
+            self.source_failures[path] = failures
+        return df
 
 
 class PayrollProcessor(BaseCSVLoader):
-    def __init__(self, data_dir: Path | str, output_dir: Path | str = "output") -> None:
-        super().__init__(data_dir)
+    def __init__(
+        self,
+        data_dir: Path | str,
+        output_dir: Path | str = "output",
+        cache_dir: Path | str | None = None,
+        cache_max_bytes: int = 512 * 1024 * 1024,
+        loader: ParallelLoader | None = None,
+        output_format: str = "csv",
+        partition_by: str | None = None,
+        allocation: AllocationRules | None = None,
+        metrics_workers: int = 1,
+        rule: RaiseRule | None = None,
+    ) -> None:
+        super().__init__(data_dir, cache_dir, cache_max_bytes)
         self.output_dir = Path(output_dir)
+        self.loader = loader
+        # Правила распределения лимита; без них повышения масштабируются пропорционально.
+        self.allocation = allocation
+        # Процессов для построчных метрик; 0 — по числу ядер, 1 — без пула.
+        self.metrics_workers = metrics_workers or os.cpu_count() or 1
+        self.rule = rule or RaiseRule()
+        self.writer = OutputWriter(self.output_dir, output_format, partition_by)
         self.files = SourceFiles()
+        self.schemas = SourceSchemas()
         self.salary_pay_cols: list[str] = []
+        self.duplicate_keys: dict[str, int] = {}
+        # Максимумы долей OPEX/CAPEX/O2O, если они известны заранее (потоковый режим).
+        self.percent_max: dict[str, float] = {}
+        self._market_index: tuple[tuple, MarketRateIndex] | None = None
+        self.snapshot = DatasetSnapshot(self.output_dir / "snapshots")
+        self.periods = PeriodStore(self.output_dir / "periods")
+        self.dataset_version: str | None = None
+        self._prepared: tuple[tuple, pd.DataFrame, pd.DataFrame] | None = None
+        self.prepared_version: str | None = None
+        self.pipeline: StagePipeline | None = None
+        self._prepare_lock = threading.Lock()
+        self._cube: tuple[str, AggregationCube] | None = None
 
     @staticmethod
-    def _to_numeric(series: pd.Series) -> pd.Series:
-        return pd.to_numeric(series.astype(str).str.replace(",", ".", regex=False), errors="coerce")
-
-    @staticmethod
-    def _parse_date(series: pd.Series, fmt: str | None = None, dayfirst: bool = False) -> pd.Series:
-        return pd.to_datetime(series, errors="coerce", format=fmt, dayfirst=dayfirst)
-
-    @staticmethod
-    def _normalize_percent(series: pd.Series) -> pd.Series:
-        max_val = series.max(skipna=True)
+    def _normalize_percent(series: pd.Series, max_val: float | None = None) -> pd.Series:
+        if max_val is None:
+            max_val = series.max(skipna=True)
         if pd.notna(max_val) and max_val > 1:
             return series / 100
         return series
 
-    def load_sources(self) -> dict[str, pd.DataFrame]:
-        sources = {
-            "positions": self.load_csv(self.files.positions),
-            "salaries": self.load_csv(self.files.salaries),
-            "org_units": self.load_csv(self.files.org_units),
-            "projects": self.load_csv(self.files.projects),
-            "bonuses": self.load_csv(self.files.bonuses),
-            "insurance": self.load_csv(self.files.insurance),
-            "market": self.load_csv(self.files.market),
-        }
+    def load_sources(self, names: Iterable[str] | None = None) -> dict[str, pd.DataFrame]:
+        names = list(vars(self.files) if names is None else names)
+        with stage("load_sources") as record:
+            if self.loader is None:
+                sources = {
+                    name: self.load_csv(getattr(self.files, name), getattr(self.schemas, name))
+                    for name in names
+                }
+            else:
+                sources = self._load_parallel(names)
+            record.rows_out = sum(len(df) for df in sources.values())
+            record.extra.update({name: len(df) for name, df in sources.items()})
+        if "salaries" in sources:
+            self.salary_pay_cols = self.salary_pay_columns(sources["salaries"].columns)
+        return sources
+
+    def _load_parallel(self, names: list[str]) -> dict[str, pd.DataFrame]:
+        # Кэш читается и пишется только здесь, в пул уходит один разбор файлов.
+        sources, jobs, stamps = {}, {}, {}
+        for name in names:
+            path = self.data_dir / getattr(self.files, name)
+            schema = getattr(self.schemas, name)
+            if self.cache is not None:
+                variant = self.cache_variant(schema)
+                stamps[name], df = self.cache.lookup(path, variant)
+                failures = self.cached_failures(path, variant, stamps[name]) if df is not None else None
+                if failures is not None:
+                    sources[name] = df
+                    self.source_failures[path] = failures
+                    continue
+            jobs[name] = (path, schema)
+        if jobs:
+            parsed = self.loader.load(BaseCSVLoader(self.data_dir), jobs)
+            for name, (df, stats) in parsed.items():
+                path, schema = jobs[name]
+                if self.cache is not None:
+                    self.store_parsed(path, self.cache_variant(schema), stamps[name], df, stats)
+                else:
+                    self.converter.merge(stats)
+                sources[name] = df
+        return {name: sources[name] for name in names}
+
+    def conversion_failures(self) -> list[ConversionStats]:
+        # Источники, которые в этом прогоне не читались (этапы взяты из кэша),
+        # добавляются по сохраненным при разборе счетчикам.
+        report = Converter()
+        report.merge(self.converter.stats.values())
+        for name, filename in vars(self.files).items():
+            path = self.data_dir / filename
+            failures = self.source_failures.get(path)
+            if failures is None and self.cache is not None and path.exists():
+                variant = self.cache_variant(getattr(self.schemas, name))
+                failures = self.cached_failures(path, variant, self.cache.stamp(path))
+            report.merge(failures or [])
+        return report.failures()
 
-        salary_cols = sources["salaries"].columns.tolist()
+    @staticmethod
+    def salary_pay_columns(columns: Iterable[str]) -> list[str]:
         exclude = {
             "Имя штатной единицы",
             "Таб. №",
@@ -74,14 +346,13 @@ class PayrollProcessor(BaseCSVLoader):
             "Дата последнего повышения",
             "Тарифная ставка (оклад), руб.",
         }
-        self.salary_pay_cols = [col for col in salary_cols if col not in exclude]
-        return sources
+        return [col for col in columns if col not in exclude]
 
     def _split_vacancies(self, df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
         is_vacancy = df["Статус назначения"].eq("Вакансия")
         return df.loc[~is_vacancy].copy(), df.loc[is_vacancy].copy()
 
-    def merge_employees(self, sources: dict[str, pd.DataFrame]) -> tuple[pd.DataFrame, pd.DataFrame]:
+    def join_staff(self, sources: dict[str, pd.DataFrame]) -> tuple[pd.DataFrame, pd.DataFrame]:
         positions = sources["positions"]
         salaries = sources["salaries"]
         org_units = sources["org_units"]
@@ -93,128 +364,471 @@ class PayrollProcessor(BaseCSVLoader):
         emp_org_units, _ = self._split_vacancies(org_units)
         emp_projects, _ = self._split_vacancies(projects)
         emp_bonuses, _ = self._split_vacancies(bonuses)
+        frames = {
+            "positions": emp_positions,
+            "org_units": emp_org_units,
+            "salaries": emp_salaries,
+            "projects": emp_projects,
+            "bonuses": emp_bonuses,
+        }
 
-        df = emp_positions
-        df = pd.merge(df, emp_org_units, how="inner")
-        df = pd.merge(df, emp_salaries, how="inner")
-        df = pd.merge(df, emp_projects, how="inner")
-        df = pd.merge(df, emp_bonuses, how="inner")
-
-        market = sources["market"]
-        market_key = [
-            "Структурное подразделение - полный путь с группирующими",
-            "Код функции",
-            "Должность /профессия (разряд, категория)",
-            "Грейд",
-        ]
-        df = df.merge(market, on=market_key, how="left")
+        # Ключ — Имя штатной единицы; остальные общие колонки (Таб. №, статус)
+        # должны совпадать. Дубликаты ключей отбрасываются до соединения.
+        joiner = KeyedJoiner()
+        with stage("join.staff", rows_in=len(emp_positions)) as record:
+            df = joiner.inner_join(frames, on=UNIT_KEY)
+            record.rows_out = len(df)
+            # Каждая строка результата берет ровно одну строку каждой таблицы,
+            # остальное — дубликаты ключа или строки без пары.
+            for name, frame in frames.items():
+                duplicates = joiner.duplicate_keys.get(name, 0)
+                record.extra[f"{name}.дубликаты"] = duplicates
+                record.extra[f"{name}.без_пары"] = len(frame) - duplicates - len(df)
+        self.duplicate_keys.update(joiner.duplicate_keys)
+        return df, vacancies
 
-        insurance = sources["insurance"]
-        df = df.merge(insurance, on="РФ", how="left")
-        df.drop_duplicates(inplace=True, subset="Имя штатной единицы")
+    def join_market(self, df: pd.DataFrame, market: pd.DataFrame) -> pd.DataFrame:
+        with stage("join.market", rows_in=len(df)) as record:
+            market_index = self.load_market_index(market)
+            df["ФОТ по рынку"] = market_index.rates_for(df)
+            record.rows_out = len(df)
+            record.extra["без_ставки"] = int(df["ФОТ по рынку"].isna().sum())
+        if market_index.duplicates:
+            self.duplicate_keys["market"] = market_index.duplicates
+        return df
+
+    def join_insurance(self, df: pd.DataFrame, insurance: pd.DataFrame) -> pd.DataFrame:
+        joiner = KeyedJoiner()
+        with stage("join.insurance", rows_in=len(df)) as record:
+            joined = joiner.left_join(df, insurance, on=["РФ"], name="insurance")
+            record.rows_out = len(joined)
+            record.extra["без_пары"] = joiner.unmatched.get("insurance", 0)
+        self.duplicate_keys.update(joiner.duplicate_keys)
+        # Колонки взносов встают сразу после ставки рынка, где бы ни выполнялось соединение.
+        position = joined.columns.get_loc("ФОТ по рынку") + 1
+        added = [col for col in joined.columns if col not in df.columns]
+        order = [*df.columns[:position], *added, *df.columns[position:]]
+        return joined[order]
 
+    def merge_employees(self, sources: dict[str, pd.DataFrame]) -> tuple[pd.DataFrame, pd.DataFrame]:
+        self.duplicate_keys = {}
+        df, vacancies = self.join_staff(sources)
+        df = self.join_market(df, sources["market"])
+        df = self.join_insurance(df, sources["insurance"])
         return df, vacancies
 
-    def calculate_metrics(self, df: pd.DataFrame, budget_limit: float) -> tuple[pd.DataFrame, float]:
-        df["Кол-во единиц"] = self._to_numeric(df["Кол-во единиц"]).fillna(0)
-        df["Тарифная ставка (оклад), руб."] = self._to_numeric(df["Тарифная ставка (оклад), руб."])
+    def load_market_index(self, market: pd.DataFrame | None = None) -> MarketRateIndex:
+        path = self.data_dir / self.files.market
+        stat = path.stat()
+        stamp = (stat.st_size, stat.st_mtime_ns)
+        if self._market_index and self._market_index[0] == stamp:
+            return self._market_index[1]
+
+        def load_market() -> pd.DataFrame:
+            if market is not None:
+                return market
+            return self.load_csv(self.files.market, self.schemas.market)
+
+        if self.cache is None:
+            index = MarketRateIndex.build(load_market(), MARKET_KEY)
+        else:
+            index = MarketRateIndex.load_or_build(path, self.cache.cache_dir, MARKET_KEY, load_market)
+        self._market_index = (stamp, index)
+        return index
+
+    def prepare_metrics(self, df: pd.DataFrame) -> pd.DataFrame:
+        now = pd.Timestamp('today')
+        with stage("metrics.types", rows_in=len(df)):
+            df["Кол-во единиц"] = self._to_numeric(df["Кол-во единиц"]).fillna(0)
+            df["Тарифная ставка (оклад), руб."] = self._to_numeric(df["Тарифная ставка (оклад), руб."])
+
+            for col in self.salary_pay_cols:
+                df[col] = self._to_numeric(df[col])
+
+            df["Дата последнего повышения"] = self._parse_date(
+                df["Дата последнего повышения"], fmt="%Y-%m-%d"
+            )
+            df["Дата приема"] = self._parse_date(df["Дата приема"], dayfirst=True)
+
+            for col in PREMIUM_COLUMNS:
+                df[col] = self._to_numeric(df[col]).fillna(0)
+            for col in COST_SPLIT:
+                df[col] = self._to_numeric(df[col])
+            df["ФОТ по рынку"] = self._to_numeric(df["ФОТ по рынку"]).replace({0: np.nan})
+
+        if self.metrics_workers > 1:
+            df = self._row_metrics_parallel(df, now)
+        else:
+            self.row_metrics(df, now, self.salary_pay_cols, self.percent_max, self.rule)
+
+        if "Процентр страховых взносов" in df.columns:
+            self.insurance_metrics(df)
+        return df
+
+    @classmethod
+    def row_metrics(
+        cls,
+        df: pd.DataFrame,
+        now: pd.Timestamp,
+        salary_pay_cols: list[str],
+        percent_max: dict[str, float],
+        rule: RaiseRule,
+    ) -> pd.DataFrame:
+        # Все колонки здесь считаются построчно из уже разобранных: результат
+        # не зависит от того, весь фрейм пришел или его часть.
+        with stage("metrics.fot", rows_in=len(df)):
+            df["Процент премирования"] = 1 + (
+                df["Процент месячной премии"]
+                * (11 / 12)
+                + df["Процент квартальной премии"]
+                * (9 / 12)
+                + df["Процент годовой премии"]
+            ) / 100
+
+            df["Надбавки всего"] = df[salary_pay_cols].sum(axis=1, skipna=True)
+            df["База ФОТ"] = df["Тарифная ставка (оклад), руб."] + df["Надбавки всего"]
+            df["ФОТ"] = df["База ФОТ"] * df["Процент премирования"]
+            cls._split_costs(df, percent_max)
+
+        with stage("metrics.market", rows_in=len(df)):
+            df["Стаж (лет)"] = ((now - pd.DateOffset(months=18) - df["Дата приема"]).dt.days / 365.25).round(1)
+            df["Проплаченность"] = df["ФОТ"] / df["ФОТ по рынку"]
+
+        with stage("metrics.recommend", rows_in=len(df)) as record:
+            df["Рекомендуется повышение"] = (
+                (df["Проплаченность"] < rule.max_paid_ratio)
+                & (df["Дата последнего повышения"] <= rule.last_raise_cutoff(now))
+                & (df["Стаж (лет)"] > rule.min_seniority)
+                & (df["Кол-во единиц"] > rule.min_units)
+            )
+
+            # where вместо присваивания по маске: колонка float и в части без кандидатов.
+            df["Сумма повышения"] = (df["Тарифная ставка (оклад), руб."] / 100 * rule.raise_percent).where(
+                df["Рекомендуется повышение"]
+            )
+            df["Новый ФОТ (до лимита)"] = df["ФОТ"] + df["Сумма повышения"]
+            record.extra["рекомендовано"] = int(df["Рекомендуется повышение"].sum())
+        return df
+
+    def _row_metrics_parallel(self, df: pd.DataFrame, now: pd.Timestamp) -> pd.DataFrame:
+        # Разобранные входы кладутся в разделяемую память, процессы пула считают
+        # построчные метрики по диапазонам строк. Максимумы долей затрат берутся
+        # по всему набору, как в последовательном расчете, а части склеиваются
+        # в исходном порядке — результат совпадает побитно.
+        inputs = list(
+            dict.fromkeys(
+                [
+                    "Кол-во единиц",
+                    "Тарифная ставка (оклад), руб.",
+                    *self.salary_pay_cols,
+                    "Дата последнего повышения",
+                    "Дата приема",
+                    *PREMIUM_COLUMNS,
+                    *COST_SPLIT,
+                    "ФОТ по рынку",
+                ]
+            )
+        )
+        percent_max = {
+            col: self.percent_max.get(col, df[col].max(skipna=True)) for col in COST_SPLIT
+        }
+        bounds = np.linspace(0, len(df), min(self.metrics_workers, max(len(df), 1)) + 1).astype(int)
+        with stage("metrics.parallel", rows_in=len(df)) as record:
+            shared, shm = SharedColumns.create(df, inputs)
+            try:
+                with ProcessPoolExecutor(max_workers=self.metrics_workers) as executor:
+                    futures = [
+                        executor.submit(
+                            row_metrics_part,
+                            shared,
+                            int(start),
+                            int(stop),
+                            now,
+                            self.salary_pay_cols,
+                            percent_max,
+                            self.rule,
+                        )
+                        for start, stop in zip(bounds[:-1], bounds[1:])
+                    ]
+                    parts = [future.result() for future in futures]
+            finally:
+                shm.close()
+                shm.unlink()
+            result = pd.concat(parts)
+            for col in result.columns:
+                df[col] = result[col].to_numpy()
+            record.extra["частей"] = len(parts)
+            record.extra["рекомендовано"] = int(result["Рекомендуется повышение"].sum())
+        return df
+
+    def split_costs(self, df: pd.DataFrame) -> pd.DataFrame:
+        return self._split_costs(df, self.percent_max)
+
+    @classmethod
+    def _split_costs(cls, df: pd.DataFrame, percent_max: dict[str, float]) -> pd.DataFrame:
+        for col in COST_SPLIT:
+            pct = cls._normalize_percent(df[col], percent_max.get(col))
+            df[f"ФОТ_{col}"] = df["ФОТ"] * pct
+        return df
+
+    def insurance_metrics(self, df: pd.DataFrame) -> pd.DataFrame:
+        with stage("metrics.insurance", rows_in=len(df)):
+            df["Процентр страховых взносов"] = (
+                self._to_numeric(df["Процентр страховых взносов"]).fillna(0)
+            )
+            with_insurance = df["ФОТ"] * (1 + df["Процентр страховых взносов"])
+            if "ФОТ с СВ" in df.columns:
+                df["ФОТ с СВ"] = with_insurance
+            else:
+                df.insert(df.columns.get_loc("ФОТ_O2O") + 1, "ФОТ с СВ", with_insurance)
+        return df
 
-        for col in self.salary_pay_cols:
-            df[col] = self._to_numeric(df[col])
+    @staticmethod
+    def budget_scale(total_desired: float, budget_limit: float) -> float:
+        if total_desired > 0 and total_desired > budget_limit:
+            return budget_limit / total_desired
+        return 1.0
 
-        df["Дата последнего повышения"] = self._parse_date(
-            df["Дата последнего повышения"], fmt="%Y-%m-%d"
-        )
-        df["Дата приема"] = self._parse_date(df["Дата приема"], dayfirst=True)
+    def apply_budget(self, df: pd.DataFrame, budget_limit: float) -> tuple[pd.DataFrame, float]:
+        if self.allocation is not None:
+            return self.allocate_budget(df, budget_limit)
+        with stage("metrics.budget", rows_in=len(df)):
+            # Мелкая копия: подготовленный датафрейм остается нетронутым и переиспользуется.
+            df = df.copy(deep=False)
+            scale = self.budget_scale(df["Сумма повышения"].sum(), budget_limit)
 
-        premium_cols = [
-            "Процент месячной премии",
-            "Процент квартальной премии",
-            "Процент годовой премии",
-        ]
-        for col in premium_cols:
-            df[col] = self._to_numeric(df[col]).fillna(0)
-
-        df["Процент премирования"] = 1 + (
-            df["Процент месячной премии"]
-            * (11 / 12)
-            + df["Процент квартальной премии"]
-            * (9 / 12)
-            + df["Процент годовой премии"]
-        ) / 100
-
-        df["Надбавки всего"] = df[self.salary_pay_cols].sum(axis=1, skipna=True)
-        df["База ФОТ"] = df["Тарифная ставка (оклад), руб."] + df["Надбавки всего"]
-        df["ФОТ"] = df["База ФОТ"] * df["Процент премирования"]
-
-        for col in ["OPEX", "CAPEX", "O2O"]:
-            df[col] = self._to_numeric(df[col])
-            pct = self._normalize_percent(df[col])
-            df[f"ФОТ_{col}"] = df["ФОТ"] * pct
+            df["Повышение по лимиту"] = df["Сумма повышения"] * scale
+            calc_desired = budget_limit - df["Повышение по лимиту"].sum()
+            df["Новый ФОТ (после лимита)"] = df["ФОТ"] + df["Повышение по лимиту"]
 
-        df["Процентр страховых взносов"] = (
-            self._to_numeric(df["Процентр страховых взносов"]).fillna(0)
-        )
-        df["ФОТ с СВ"] = df["ФОТ"] * (1 + df["Процентр страховых взносов"])
+        return df, calc_desired
 
-        now = pd.Timestamp('today')
-        df["Стаж (лет)"] = ((now - pd.DateOffset(months=18) - pd.to_datetime(df["Дата приема"], dayfirst=True)).dt.days / 365.25).round(1)
+    def allocate_budget(self, df: pd.DataFrame, budget_limit: float) -> tuple[pd.DataFrame, float]:
+        # Лимит достается сначала самым недоплаченным (наименьшая проплаченность)
+        # с учетом потолка, минимума и бюджетов по МРФ и грейдам.
+        rules = self.allocation or AllocationRules()
+        with stage("metrics.allocation", rows_in=len(df)) as record:
+            df = df.copy(deep=False)
+            result = water_fill(
+                df["ФОТ"].to_numpy(dtype="float64", na_value=np.nan),
+                df["ФОТ по рынку"].to_numpy(dtype="float64", na_value=np.nan),
+                df["Сумма повышения"].to_numpy(dtype="float64", na_value=np.nan),
+                budget_limit,
+                {"МРФ": (df["МРФ"], rules.mrf_budgets), GRADE: (df[GRADE], rules.grade_budgets)},
+                cap=rules.max_raise,
+                minimum=rules.min_raise,
+            )
+            df["Повышение по лимиту"] = result.amount
+            df["Новый ФОТ (после лимита)"] = df["ФОТ"] + df["Повышение по лимиту"]
+            df["Ограничение повышения"] = pd.Series(result.binding, index=df.index)
+            record.extra.update(result.binding_counts())
+            record.extra["раундов"] = result.rounds
+        # Лимит не перерасходуется; отрицательный остаток — только погрешность округления.
+        return df, max(budget_limit - result.spent, 0.0)
 
-        df["ФОТ по рынку"] = self._to_numeric(df["ФОТ по рынку"]).replace({0: np.nan})
-        df["Проплаченность"] = df["ФОТ"] / df["ФОТ по рынку"]
+    def calculate_metrics(self, df: pd.DataFrame, budget_limit: float) -> tuple[pd.DataFrame, float]:
+        return self.apply_budget(self.prepare_metrics(df), budget_limit)
 
-        six_months_ago = now - pd.DateOffset(months=24)
-        df["Рекомендуется повышение"] = (
-            (df["Проплаченность"] < 0.8)
-            & (df["Дата последнего повышения"] <= six_months_ago)
-            & (df["Стаж (лет)"] > 1)
-            & (df["Кол-во единиц"] > 0.5)
+    def budget_sweep(
+        self,
+        df: pd.DataFrame,
+        limits: Iterable[float],
+        with_matrix: bool = False,
+    ) -> tuple[pd.DataFrame, pd.DataFrame | None]:
+        limits = np.asarray(list(limits), dtype="float64")
+        raises = df["Сумма повышения"].to_numpy(dtype="float64", na_value=np.nan)
+        total_desired = np.nansum(raises)
+
+        # Повышение по лимиту линейно по лимиту: один коэффициент на сценарий.
+        scales = np.ones_like(limits)
+        over = (total_desired > 0) & (total_desired > limits)
+        scales[over] = limits[over] / total_desired
+
+        summary = pd.DataFrame(
+            {
+                "Лимит": limits,
+                "Коэффициент": scales,
+                "Сумма повышений": total_desired * scales,
+                "Остаток лимита": limits - total_desired * scales,
+            }
         )
-
-        df.loc[df["Рекомендуется повышение"], "Сумма повышения"] = (
-            df["Тарифная ставка (оклад), руб."] / 100 * 30
+        by_mrf = df.groupby("МРФ", observed=True)["Сумма повышения"].sum()
+        summary = pd.concat(
+            [summary, pd.DataFrame(np.outer(scales, by_mrf.to_numpy()), columns=by_mrf.index)],
+            axis=1,
         )
-        df["Новый ФОТ (до лимита)"] = df["ФОТ"] + df["Сумма повышения"]
 
-        total_desired = df["Сумма повышения"].sum()
-        scale = 1.0
-        if total_desired > 0 and total_desired > budget_limit:
-            scale = (budget_limit / total_desired)
+        matrix = None
+        if with_matrix:
+            candidates = ~np.isnan(raises)
+            matrix = pd.DataFrame(
+                raises[candidates, None] * scales[None, :],
+                index=df.loc[candidates, UNIT_KEY].to_numpy(),
+                columns=limits,
+            )
+            matrix.index.name = UNIT_KEY
+        return summary, matrix
+
+    def sources_stamp(self) -> tuple:
+        stamp = []
+        for filename in vars(self.files).values():
+            stat = (self.data_dir / filename).stat()
+            stamp.append((filename, stat.st_size, stat.st_mtime_ns))
+        return (pd.Timestamp("today").date(), *stamp)
+
+    def source_fingerprint(self, name: str) -> str:
+        path = self.data_dir / getattr(self.files, name)
+        if self.cache is not None:
+            content = self.cache.stamp(path).sha256
+        else:
+            stat = path.stat()
+            content = f"{stat.st_size}:{stat.st_mtime_ns}"
+        return f"{content}|{getattr(self.schemas, name)!r}"
+
+    def build_pipeline(self) -> StagePipeline:
+        sources = {
+            name: (lambda name=name: self.load_csv(getattr(self.files, name), getattr(self.schemas, name)))
+            for name in vars(self.files)
+        }
+        # Метрики зависят от текущей даты (стаж, срок с последнего повышения)
+        # и от параметров правила рекомендаций.
+        sources["today"] = lambda: pd.Timestamp("today").date()
+        sources["rule"] = lambda: self.rule
+        fingerprints = {name: self.source_fingerprint(name) for name in vars(self.files)}
+        fingerprints["today"] = str(pd.Timestamp("today").date())
+        fingerprints["rule"] = repr(self.rule)
+
+        staff_inputs = ("positions", "org_units", "salaries", "projects", "bonuses")
+        stages = [
+            Stage(
+                "staff",
+                staff_inputs,
+                lambda *frames: self.join_staff(dict(zip(staff_inputs, frames)))[0],
+            ),
+            Stage("vacancies", ("positions",), lambda positions: self._split_vacancies(positions)[1]),
+            Stage("rates", ("staff", "market"), lambda df, market: self.join_market(df.copy(deep=False), market)),
+            Stage("metrics", ("rates", "today", "rule"), lambda df, *_: self.prepare_metrics(df.copy(deep=False))),
+            Stage(
+                "insured",
+                ("metrics", "insurance"),
+                lambda df, insurance: self.insurance_metrics(self.join_insurance(df, insurance)),
+            ),
+            Stage("cube", ("insured",), lambda df: self.build_cube(df)),
+        ]
+        files = set(vars(self.files))
+        return StagePipeline(
+            stages,
+            sources,
+            fingerprints,
+            cache=self.cache,
+            prefetch=lambda names: self.load_sources([name for name in names if name in files]),
+        )
 
-        df["Повышение по лимиту"] = df["Сумма повышения"] * scale
-        calc_desired = budget_limit - df["Повышение по лимиту"].sum()
-        df["Новый ФОТ (после лимита)"] = df["ФОТ"] + df["Повышение по лимиту"]
+    def prepare(self) -> tuple[pd.DataFrame, pd.DataFrame]:
+        with self._prepare_lock:
+            stamp = self.sources_stamp()
+            if self._prepared is None or self._prepared[0] != stamp:
+                # Состав надбавок берется из заголовка: этап metrics может быть взят из кэша без чтения файла.
+                header = pd.read_csv(
+                    self.data_dir / self.files.salaries, sep="\t", encoding="utf-8-sig", nrows=0
+                )
+                self.salary_pay_cols = self.salary_pay_columns(header.columns)
+                self.duplicate_keys = {}
+                self.pipeline = self.build_pipeline()
+                prepared, vacancies = self.pipeline.run("insured", "vacancies")
+                self._prepared = (stamp, prepared, vacancies)
+                self.prepared_version = self.pipeline.fingerprints["insured"][:16]
+            return self._prepared[1], self._prepared[2]
 
-        return df, calc_desired
+    @staticmethod
+    def build_cube(df: pd.DataFrame) -> pd.DataFrame:
+        with stage("aggregation.cube", rows_in=len(df)) as record:
+            base = base_cuboid(df, CUBE_DIMENSIONS.values(), CUBE_MEASURES)
+            record.extra["групп"] = len(base)
+        return base
+
+    def aggregation_cube(self) -> AggregationCube:
+        # Куб строится по подготовленному результату один раз на версию данных;
+        # самый подробный срез сохраняется в кэше как этап cube.
+        self.prepare()
+        with self._prepare_lock:
+            if self._cube is None or self._cube[0] != self.prepared_version:
+                (base,) = self.pipeline.run("cube")
+                self._cube = (self.prepared_version, AggregationCube(base, CUBE_DIMENSIONS.values()))
+            return self._cube[1]
+
+    def current_version(self) -> str:
+        # Та же версия, что prepared_version после prepare(), но без расчета:
+        # только по отпечаткам источников.
+        return self.build_pipeline().fingerprints["insured"][:16]
 
     def save_outputs(self, df: pd.DataFrame, vacancies: pd.DataFrame) -> None:
+        with stage("save_outputs", rows_in=len(df) + len(vacancies)):
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            self.dataset_version = self.snapshot.publish(df)
+            tables = {
+                "employees_fot": self.writer.write("employees_fot", df, self.dataset_version),
+                "vacancies": self.writer.write("vacancies", vacancies, self.dataset_version),
+            }
+            self.writer.write_manifest(tables, self.dataset_version)
+
+    def save_period(self, df: pd.DataFrame, period: str) -> SavedPeriod:
+        # Снимок периода для сравнения месяц к месяцу; отпечаток — версия исходных данных.
+        with stage("save_period", rows_in=len(df)) as record:
+            saved = self.periods.save(df, period, fingerprint=self.prepared_version)
+            record.extra["записано частей"] = saved.written
+        return saved
+
+    def rule_grid(self, df: pd.DataFrame, rules: list[RaiseRule], budget_limit: float) -> pd.DataFrame:
+        # Сравнение вариантов правила рекомендаций на уже посчитанных метриках.
+        with stage("metrics.rule_grid", rows_in=len(df)) as record:
+            summary = evaluate_rules(df, rules, budget_limit, pd.Timestamp("today"))
+            record.extra["правил"] = len(rules)
+        return summary
+
+    def save_rule_grid(self, summary: pd.DataFrame) -> None:
         self.output_dir.mkdir(parents=True, exist_ok=True)
-        df.to_csv(self.output_dir / "employees_fot.csv", index=False)
-        vacancies.to_csv(self.output_dir / "vacancies.csv", index=False)
+        summary.to_csv(self.output_dir / "rule_grid.csv", index=False)
 
-    def plot_raises(self, df: pd.DataFrame) -> None:
+    def save_sweep(self, summary: pd.DataFrame, matrix: pd.DataFrame | None = None) -> None:
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        summary.to_csv(self.output_dir / "budget_sweep.csv", index=False)
+        if matrix is not None:
+            matrix.to_csv(self.output_dir / "budget_sweep_matrix.csv")
 
-        by_mrf = df.groupby("МРФ", dropna=True)["Повышение по лимиту"].sum()
-        if not by_mrf.empty:
-            fig, ax = plt.subplots(figsize=(12, max(4, len(by_mrf) * 0.35)))
-            by_mrf.plot(kind="barh", ax=ax)
+    @staticmethod
+    def raise_totals(df: pd.DataFrame) -> dict[str, pd.Series]:
+        return {
+            kind: df.groupby(column, dropna=True, observed=True)["Повышение по лимиту"].sum()
+            for kind, column in (("mrf", "МРФ"), ("grade", GRADE))
+        }
+
+    @staticmethod
+    def render_chart(series: pd.Series, kind: str, path: Path) -> None:
+        # Figure без pyplot: не трогает глобальное состояние и безопасна в фоновом потоке.
+        labels = [str(label) for label in series.index]
+        if kind == "mrf":
+            fig = Figure(figsize=(12, max(4, len(series) * 0.35)))
+            ax = fig.add_subplot()
+            ax.barh(labels, series.to_numpy())
             ax.set_title("Raise by MRF")
             ax.set_xlabel("Increase")
             ax.invert_yaxis()
-            fig.tight_layout()
-            fig.savefig(self.output_dir / "raise_by_mrf.png")
-            plt.close(fig)
-
-        by_grade = df.groupby("Грейд", dropna=True)["Повышение по лимиту"].sum()
-        if not by_grade.empty:
-            fig, ax = plt.subplots(figsize=(10, 6))
-            by_grade.plot(kind="bar", ax=ax)
+        else:
+            fig = Figure(figsize=(10, 6))
+            ax = fig.add_subplot()
+            ax.bar(labels, series.to_numpy())
             ax.set_title("Raise by Grade")
             ax.set_ylabel("Increase")
-            fig.tight_layout()
-            fig.savefig(self.output_dir / "raise_by_grade.png")
-            plt.close(fig)
+        fig.tight_layout()
+        fig.savefig(path)
+
+    def plot_raises(self, df: pd.DataFrame) -> None:
+        with stage("plot_raises", rows_in=len(df)):
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            for kind, series in self.raise_totals(df).items():
+                if not series.empty:
+                    self.render_chart(series, kind, self.output_dir / f"raise_by_{kind}.png")
 
     def process(
         self,
@@ -222,11 +836,26 @@ class PayrollProcessor(BaseCSVLoader):
         write_outputs: bool = True,
         plot: bool = True,
     ) -> tuple[pd.DataFrame, pd.DataFrame, float]:
-        sources = self.load_sources()
-        merged, vacancies = self.merge_employees(sources)
-        enriched, leftover = self.calculate_metrics(merged, budget_limit=budget_limit)
+        prepared, vacancies = self.prepare()
+        enriched, leftover = self.apply_budget(prepared, budget_limit=budget_limit)
         if write_outputs:
             self.save_outputs(enriched, vacancies)
         if plot:
             self.plot_raises(enriched)
         return enriched, vacancies, leftover
+
+
+def row_metrics_part(
+    shared: SharedColumns,
+    start: int,
+    stop: int,
+    now: pd.Timestamp,
+    salary_pay_cols: list[str],
+    percent_max: dict[str, float],
+    rule: RaiseRule,
+) -> pd.DataFrame:
+    # Выполняется в процессе пула: возвращает только посчитанные колонки.
+    part = shared.read(start, stop)
+    inputs = list(part.columns)
+    PayrollProcessor.row_metrics(part, now, salary_pay_cols, percent_max, rule)
+    return part.drop(columns=inputs)
@@ -0,0 +1,277 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+KEY = "Имя штатной единицы"
+DIFF_COLUMNS = ["ФОТ", "Проплаченность", "Рекомендуется повышение"]
+ADDED = "добавлен"
+REMOVED = "удален"
+PERIOD_NAME = re.compile(r"^[\w.-]+$")
+
+
+@dataclass
+class SavedPeriod:
+    period: str
+    rows: int
+    parts: int
+    written: int
+
+
+class PeriodStore:
+    # Снимок периода — результат расчета, разложенный по корзинам хэша ключа
+    # штатной единицы, внутри корзины строки отсортированы по ключу. Корзина
+    # пишется файлом Arrow IPC с именем по хэшу содержимого, поэтому корзины,
+    # не изменившиеся между периодами, хранятся один раз. Манифест периода
+    # хранит хэши колонок каждой корзины: сравнение читает только те корзины,
+    # где нужные колонки различаются, и только эти колонки. Манифесты лежат
+    # отдельно от настроек хранилища, поэтому имя периода с ними не пересекается.
+    settings_name = "store.json"
+
+    rows_per_bucket = 4096
+
+    def __init__(self, root: Path | str, buckets: int | None = None) -> None:
+        self.root = Path(root)
+        self.default_buckets = buckets
+
+    @property
+    def blobs(self) -> Path:
+        return self.root / "parts"
+
+    @property
+    def manifest_dir(self) -> Path:
+        return self.root / "manifests"
+
+    def _manifest_path(self, period: str) -> Path:
+        if not PERIOD_NAME.match(period):
+            raise ValueError(f"Некорректное имя периода: {period}")
+        return self.manifest_dir / f"{period}.json"
+
+    def _bucket_count(self, rows: int) -> int:
+        # Число корзин фиксируется при первом сохранении, иначе корзины периодов
+        # не сопоставить. По умолчанию — степень двойки, около rows_per_bucket строк в корзине.
+        path = self.root / self.settings_name
+        if path.exists():
+            return int(json.loads(path.read_text(encoding="utf-8"))["buckets"])
+        buckets = self.default_buckets or min(1024, 1 << max(0, (rows - 1) // self.rows_per_bucket).bit_length())
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._write_json(path, {"buckets": buckets})
+        return buckets
+
+    @staticmethod
+    def _write_json(path: Path, payload: dict) -> None:
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(payload, ensure_ascii=False, indent=1), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def save(self, df: pd.DataFrame, period: str, fingerprint: str | None = None) -> SavedPeriod:
+        manifest_path = self._manifest_path(period)
+        buckets = self._bucket_count(len(df))
+        self.blobs.mkdir(parents=True, exist_ok=True)
+        self.manifest_dir.mkdir(exist_ok=True)
+
+        keys = df[KEY].astype(str).to_numpy(dtype=object)
+        bucket = pd.util.hash_array(keys) % buckets
+        order = np.lexsort((keys, bucket))
+        df = df.iloc[order].reset_index(drop=True)
+        bounds = np.searchsorted(bucket[order], np.arange(buckets + 1))
+        # Хэши строк по колонкам считаются один раз, хэш колонки корзины — по их срезу.
+        row_hashes = {col: pd.util.hash_pandas_object(df[col], index=False).to_numpy() for col in df.columns}
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        schema = str(table.schema.remove_metadata())
+
+        parts, written = [], 0
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            hashes = {
+                col: hashlib.sha256(values[start:stop].tobytes()).hexdigest()[:16]
+                for col, values in row_hashes.items()
+            }
+            digest = hashlib.sha256(json.dumps([schema, hashes], ensure_ascii=False).encode("utf-8"))
+            name = f"{digest.hexdigest()[:32]}.arrow"
+            if not (self.blobs / name).exists():
+                self._write_part(table.slice(start, stop - start), self.blobs / name)
+                written += 1
+            parts.append({"file": name, "rows": int(stop - start), "hashes": hashes})
+
+        self._write_json(
+            manifest_path,
+            {
+                "period": period,
+                "fingerprint": fingerprint,
+                "saved": pd.Timestamp.now().isoformat(timespec="seconds"),
+                "rows": len(df),
+                "columns": list(df.columns),
+                "parts": parts,
+            },
+        )
+        self._prune()
+        return SavedPeriod(period, len(df), len(parts), written)
+
+    @staticmethod
+    def _write_part(part: pa.Table, path: Path) -> None:
+        # Словари категорий перекодируются по корзине, чтобы каждый файл не нес
+        # полный справочник набора.
+        columns = [
+            column.combine_chunks().dictionary_decode().dictionary_encode()
+            if pa.types.is_dictionary(column.type)
+            else column
+            for column in part.columns
+        ]
+        part = pa.Table.from_arrays(columns, names=part.column_names)
+        options = pa.ipc.IpcWriteOptions(compression="zstd")
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, part.schema, options=options) as writer:
+            writer.write_table(part)
+        os.replace(tmp, path)
+
+    def _prune(self) -> None:
+        # Файлы корзин, на которые не ссылается ни один период, удаляются.
+        used = {part["file"] for manifest in self.manifests() for part in manifest["parts"]}
+        for path in self.blobs.glob("*.arrow"):
+            if path.name not in used:
+                path.unlink(missing_ok=True)
+
+    def manifests(self) -> list[dict]:
+        return [json.loads(path.read_text(encoding="utf-8")) for path in sorted(self.manifest_dir.glob("*.json"))]
+
+    def manifest(self, period: str) -> dict:
+        path = self._manifest_path(period)
+        if not path.exists():
+            raise KeyError(f"Период {period} не сохранен")
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def _read_part(self, manifest: dict, part: dict, columns: Sequence[str]) -> pa.Table:
+        fields = [manifest["columns"].index(column) for column in columns]
+        options = pa.ipc.IpcReadOptions(included_fields=fields)
+        with pa.memory_map(str(self.blobs / part["file"])) as source:
+            return pa.ipc.open_file(source, options=options).read_all()
+
+    def load(self, period: str, columns: Sequence[str] | None = None) -> pd.DataFrame:
+        manifest = self.manifest(period)
+        columns = list(columns or manifest["columns"])
+        tables = [self._read_part(manifest, part, columns) for part in manifest["parts"]]
+        return pa.concat_tables(tables, promote_options="permissive").to_pandas()
+
+    def diff(self, before: str, after: str, columns: Sequence[str] = DIFF_COLUMNS) -> pd.DataFrame:
+        # Строка результата — штатная единица, у которой изменилась хотя бы одна
+        # из колонок, появилась или пропала. Сравниваются только корзины с
+        # разными хэшами ключа или колонок.
+        old, new = self.manifest(before), self.manifest(after)
+        needed = [KEY, *columns]
+        for manifest in (old, new):
+            missing = [column for column in needed if column not in manifest["columns"]]
+            if missing:
+                raise ValueError(f"В периоде {manifest['period']} нет колонок: {missing}")
+        if len(old["parts"]) != len(new["parts"]):
+            raise ValueError("Периоды сохранены с разным числом корзин")
+
+        frames = []
+        for old_part, new_part in zip(old["parts"], new["parts"]):
+            if all(old_part["hashes"][column] == new_part["hashes"][column] for column in needed):
+                continue
+            frames.append(
+                self._diff_part(
+                    self._read_part(old, old_part, needed),
+                    self._read_part(new, new_part, needed),
+                    list(columns),
+                )
+            )
+        labels = [KEY, "Изменение", *(f"{column} {when}" for column in columns for when in ("до", "после"))]
+        if not frames:
+            return pd.DataFrame(columns=labels)
+        return pd.concat(frames, ignore_index=True).sort_values(KEY, ignore_index=True)[labels]
+
+    @staticmethod
+    def _diff_part(old: pa.Table, new: pa.Table, columns: list[str]) -> pd.DataFrame:
+        def keys(table: pa.Table) -> pa.Array:
+            return column_of(table, KEY).cast(pa.string())
+
+        def column_of(table: pa.Table, column: str) -> pa.Array:
+            data = table.column(column).combine_chunks()
+            return data.dictionary_decode() if pa.types.is_dictionary(data.type) else data
+
+        old_keys, new_keys = keys(old), keys(new)
+        position = pc.index_in(new_keys, value_set=old_keys).fill_null(-1).to_numpy()
+        removed = np.flatnonzero(~pc.is_in(old_keys, value_set=new_keys).to_numpy(zero_copy_only=False))
+        matched = np.flatnonzero(position >= 0)
+        added = np.flatnonzero(position < 0)
+
+        flags = np.zeros((len(columns), len(matched)), dtype=bool)
+        for row, column in enumerate(columns):
+            before = column_of(old, column).to_numpy(zero_copy_only=False)[position[matched]]
+            after = column_of(new, column).to_numpy(zero_copy_only=False)[matched]
+            flags[row] = ~((before == after) | (pd.isna(before) & pd.isna(after)))
+        changed = np.flatnonzero(flags.any(axis=0))
+        labels = [", ".join(np.asarray(columns)[flags[:, index]]) for index in changed]
+
+        # Индексы строк результата в старой и новой корзине; null — строки нет.
+        old_rows = pa.array(
+            np.concatenate([position[matched[changed]], np.zeros(len(added), dtype=np.int64), removed]),
+            mask=np.concatenate([np.zeros(len(changed), bool), np.ones(len(added), bool), np.zeros(len(removed), bool)]),
+        )
+        new_rows = pa.array(
+            np.concatenate([matched[changed], added, np.zeros(len(removed), dtype=np.int64)]),
+            mask=np.concatenate([np.zeros(len(changed) + len(added), bool), np.ones(len(removed), bool)]),
+        )
+        result = {
+            KEY: pc.coalesce(new_keys.take(new_rows), old_keys.take(old_rows)).to_pandas(),
+            "Изменение": labels + [ADDED] * len(added) + [REMOVED] * len(removed),
+        }
+        for column in columns:
+            result[f"{column} до"] = column_of(old, column).take(old_rows).to_pandas()
+            result[f"{column} после"] = column_of(new, column).take(new_rows).to_pandas()
+        return pd.DataFrame(result)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Снимки расчета по периодам и их сравнение")
+    root_dir = Path(__file__).resolve().parents[1]
+    parser.add_argument(
+        "--store",
+        default=root_dir / "output" / "periods",
+        type=Path,
+        help="Каталог снимков периодов (periods/ в каталоге результатов main.py)",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="Сохраненные периоды")
+    diff = commands.add_parser("diff", help="Кто изменил ФОТ, проплаченность или статус рекомендации")
+    diff.add_argument("before", help="Ранний период")
+    diff.add_argument("after", help="Поздний период")
+    diff.add_argument("--output", default=None, type=Path, help="Сохранить изменения в CSV")
+    args = parser.parse_args()
+
+    store = PeriodStore(args.store)
+    if args.command == "list":
+        for manifest in store.manifests():
+            print(f"{manifest['period']}\t{manifest['rows']}\t{manifest['saved']}\t{manifest['fingerprint']}")
+        return
+
+    try:
+        changes = store.diff(args.before, args.after)
+    except (KeyError, ValueError) as exc:
+        parser.error(str(exc.args[0]))
+    counts = changes["Изменение"].value_counts()
+    print(f"Добавлено: {counts.get(ADDED, 0)}")
+    print(f"Удалено: {counts.get(REMOVED, 0)}")
+    print(f"Изменено: {len(changes) - counts.get(ADDED, 0) - counts.get(REMOVED, 0)}")
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        changes.to_csv(args.output, index=False)
+        print(f"Изменения сохранены: {args.output}")
+    else:
+        print(changes.head(20).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+import pandas as pd
+
+from frame_cache import FrameCache
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    inputs: tuple[str, ...]
+    run: Callable[..., pd.DataFrame]
+    version: str = "1"
+
+
+@dataclass
+class StageRun:
+    name: str
+    status: str
+    fingerprint: str
+    seconds: float = 0.0
+
+
+class StagePipeline:
+    # Исходные файлы — листья графа: их отпечаток — хэш содержимого.
+    # Отпечаток этапа — хэш имени, версии и отпечатков входов; результат этапа
+    # хранится на диске и пересчитывается, только если отпечаток изменился.
+    def __init__(
+        self,
+        stages: list[Stage],
+        sources: dict[str, Callable[[], object]],
+        source_fingerprints: dict[str, str],
+        cache: FrameCache | None = None,
+        salt: str = "",
+        prefetch: Callable[[list[str]], dict[str, object]] | None = None,
+    ) -> None:
+        self.stages = {stage.name: stage for stage in stages}
+        clashes = set(self.stages) & set(sources)
+        if clashes:
+            raise ValueError(f"Имена этапов совпадают с источниками: {sorted(clashes)}")
+        self.sources = sources
+        self.cache = cache
+        self.prefetch = prefetch
+        self.fingerprints = dict(source_fingerprints)
+        for stage in stages:
+            parts = [salt, stage.name, stage.version, *(self.fingerprints[name] for name in stage.inputs)]
+            self.fingerprints[stage.name] = hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+        self.report: dict[str, StageRun] = {}
+        self._results: dict[str, pd.DataFrame] = {}
+
+    def _resolve(self, name: str) -> pd.DataFrame:
+        if name in self._results:
+            return self._results[name]
+        if name in self.sources:
+            result = self.sources[name]()
+            self._results[name] = result
+            return result
+
+        stage = self.stages[name]
+        fingerprint = self.fingerprints[name]
+        started = time.perf_counter()
+        result = self.cache.get(f"stage:{name}", fingerprint) if self.cache else None
+        if result is not None:
+            status = "reused"
+        else:
+            inputs = [self._resolve(input_name) for input_name in stage.inputs]
+            started = time.perf_counter()
+            result = stage.run(*inputs)
+            if self.cache:
+                self.cache.put(f"stage:{name}", fingerprint, result)
+            status = "recomputed"
+        self.report[name] = StageRun(name, status, fingerprint, time.perf_counter() - started)
+        self._results[name] = result
+        return result
+
+    def required_sources(self, *targets: str) -> list[str]:
+        # Источники, которые понадобятся: обход останавливается на этапах из кэша.
+        required: list[str] = []
+        seen: set[str] = set()
+        pending = list(targets)
+        while pending:
+            name = pending.pop()
+            if name in seen or name in self._results:
+                continue
+            seen.add(name)
+            if name in self.sources:
+                required.append(name)
+            elif not (self.cache and self.cache.has(f"stage:{name}", self.fingerprints[name])):
+                pending.extend(self.stages[name].inputs)
+        return required
+
+    def run(self, *targets: str) -> list[pd.DataFrame]:
+        required = self.required_sources(*targets) if self.prefetch else []
+        if required:
+            # Нужные файлы читаются заранее одним пакетом (возможно, параллельно).
+            self._results.update(self.prefetch(required))
+        results = [self._resolve(target) for target in targets]
+        for name in self.stages:
+            self.report.setdefault(name, StageRun(name, "skipped", self.fingerprints[name]))
+        return results
+
+    def explain(self) -> str:
+        labels = {"reused": "из кэша", "recomputed": "пересчитан", "skipped": "не нужен"}
+        lines = [f"{'этап':<12} {'статус':<12} {'время, с':>9}  отпечаток"]
+        for name in self.stages:
+            run = self.report[name]
+            lines.append(
+                f"{name:<12} {labels[run.status]:<12} {run.seconds:>9.3f}  {run.fingerprint[:12]}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Iterator
+
+_active: ContextVar[Profiler | None] = ContextVar("payroll_profiler", default=None)
+
+
+@dataclass
+class StageProfile:
+    name: str
+    calls: int = 0
+    wall: float = 0.0
+    cpu: float = 0.0
+    peak_mb: float | None = None
+    rows_in: int | None = None
+    rows_out: int | None = None
+    extra: dict[str, int] = field(default_factory=dict)
+
+    @property
+    def rows_lost(self) -> int | None:
+        if self.rows_in is None or self.rows_out is None:
+            return None
+        return self.rows_in - self.rows_out
+
+
+class StageRecord:
+    def __init__(self, rows_in: int | None = None) -> None:
+        self.rows_in = rows_in
+        self.rows_out: int | None = None
+        self.extra: dict[str, int] = {}
+        self.peak = 0
+
+
+def _add(total: int | None, value: int | None) -> int | None:
+    if value is None:
+        return total
+    return (total or 0) + value
+
+
+class Profiler:
+    # Этапы с одинаковым именем (например, части потокового режима) суммируются.
+    def __init__(self, trace_memory: bool = False) -> None:
+        self.trace_memory = trace_memory
+        self.stages: dict[str, StageProfile] = {}
+        self._stack: list[StageRecord] = []
+        self._started_tracing = False
+
+    def start(self) -> None:
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self) -> None:
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name: str, rows_in: int | None = None) -> Iterator[StageRecord]:
+        record = StageRecord(rows_in)
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1].peak = max(self._stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+            start_memory = current
+        self._stack.append(record)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            self._stack.pop()
+            profile = self.stages.setdefault(name, StageProfile(name))
+            if tracing:
+                record.peak = max(record.peak, tracemalloc.get_traced_memory()[1])
+                if self._stack:
+                    self._stack[-1].peak = max(self._stack[-1].peak, record.peak)
+                growth = (record.peak - start_memory) / 2**20
+                profile.peak_mb = max(profile.peak_mb or 0.0, growth)
+            profile.calls += 1
+            profile.wall += wall
+            profile.cpu += cpu
+            profile.rows_in = _add(profile.rows_in, record.rows_in)
+            profile.rows_out = _add(profile.rows_out, record.rows_out)
+            for key, value in record.extra.items():
+                profile.extra[key] = profile.extra.get(key, 0) + value
+
+    def table(self) -> str:
+        lines = [
+            f"{'этап':<24} {'вызовов':>7} {'время, с':>9} {'CPU, с':>8} {'пик, МБ':>8} "
+            f"{'строк на входе':>14} {'на выходе':>10} {'потеряно':>9}"
+        ]
+
+        def fmt(value, spec: str) -> str:
+            return "—" if value is None else format(value, spec)
+
+        for profile in self.stages.values():
+            line = (
+                f"{profile.name:<24} {profile.calls:>7} {profile.wall:>9.3f} {profile.cpu:>8.3f} "
+                f"{fmt(profile.peak_mb, '.1f'):>8} {fmt(profile.rows_in, 'd'):>14} "
+                f"{fmt(profile.rows_out, 'd'):>10} {fmt(profile.rows_lost, 'd'):>9}"
+            )
+            extra = {key: value for key, value in profile.extra.items() if value}
+            if extra:
+                line += "  " + ", ".join(f"{key}={value}" for key, value in extra.items())
+            lines.append(line)
+        return "\n".join(lines)
+
+    def report(self) -> list[dict]:
+        return [{**asdict(profile), "rows_lost": profile.rows_lost} for profile in self.stages.values()]
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"stages": self.report()}, ensure_ascii=False, indent=1), encoding="utf-8")
+
+
+@contextmanager
+def activate(profiler: Profiler) -> Iterator[Profiler]:
+    token = _active.set(profiler)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        _active.reset(token)
+
+
+@contextmanager
+def stage(name: str, rows_in: int | None = None) -> Iterator[StageRecord]:
+    # Без активного профайлера этап ничего не измеряет.
+    profiler = _active.get()
+    if profiler is None:
+        yield StageRecord(rows_in)
+        return
+    with profiler.stage(name, rows_in) as record:
+        yield record
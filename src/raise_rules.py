@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import itertools
+import json
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Mapping, Sequence
+
+import numpy as np
+import pandas as pd
+
+RULE_COLUMNS = {
+    "max_paid_ratio": "Порог проплаченности",
+    "months_since_raise": "Месяцев с повышения",
+    "min_seniority": "Стаж от, лет",
+    "min_units": "Ставка от",
+    "raise_percent": "Повышение, % оклада",
+}
+
+
+@dataclass(frozen=True)
+class RaiseRule:
+    # Кандидат на повышение: проплаченность ниже порога, последнее повышение не
+    # позже чем months_since_raise месяцев назад, стаж и ставка больше минимума.
+    # Желаемое повышение — raise_percent процентов оклада.
+    max_paid_ratio: float = 0.8
+    months_since_raise: int = 24
+    min_seniority: float = 1.0
+    min_units: float = 0.5
+    raise_percent: float = 30.0
+
+    @classmethod
+    def from_mapping(cls, raw: Mapping[str, object]) -> RaiseRule:
+        unknown = set(raw) - set(RULE_COLUMNS)
+        if unknown:
+            raise ValueError(f"Неизвестные параметры правила: {sorted(unknown)}")
+        values = {
+            item.name: int(raw[item.name]) if item.name == "months_since_raise" else float(raw[item.name])
+            for item in fields(cls)
+            if item.name in raw
+        }
+        return cls(**values)
+
+    @classmethod
+    def from_file(cls, path: Path) -> RaiseRule:
+        # {"max_paid_ratio": 0.85, "months_since_raise": 18, "raise_percent": 20}
+        return cls.from_mapping(json.loads(Path(path).read_text(encoding="utf-8")))
+
+    def last_raise_cutoff(self, now: pd.Timestamp) -> pd.Timestamp:
+        return now - pd.DateOffset(months=self.months_since_raise)
+
+
+def load_rule_grid(path: Path) -> list[RaiseRule]:
+    # Список правил или словарь «параметр — значение или список значений»:
+    # во втором случае перебираются все сочетания.
+    raw = json.loads(Path(path).read_text(encoding="utf-8"))
+    if isinstance(raw, list):
+        return [RaiseRule.from_mapping(item) for item in raw]
+    axes = {name: values if isinstance(values, list) else [values] for name, values in raw.items()}
+    return [RaiseRule.from_mapping(dict(zip(axes, combo))) for combo in itertools.product(*axes.values())]
+
+
+def _threshold_masks(values: np.ndarray, thresholds: np.ndarray, op) -> tuple[np.ndarray, np.ndarray]:
+    # Маска считается один раз на различное значение порога, правила ссылаются на нее по индексу.
+    unique, index = np.unique(thresholds, return_inverse=True)
+    return op(values[None, :], unique[:, None]), index
+
+
+def evaluate_rules(
+    df: pd.DataFrame,
+    rules: Sequence[RaiseRule],
+    budget_limit: float,
+    now: pd.Timestamp,
+    max_cells: int = 8_000_000,
+) -> pd.DataFrame:
+    # Признаки сотрудников берутся из посчитанных метрик один раз, каждое правило —
+    # строка матрицы масок. Правила идут блоками, чтобы матрица правил на
+    # сотрудников не превышала max_cells ячеек.
+    paid_ratio = df["Проплаченность"].to_numpy(dtype="float64", na_value=np.nan)
+    last_raise = df["Дата последнего повышения"].to_numpy(dtype="datetime64[ns]")
+    seniority = df["Стаж (лет)"].to_numpy(dtype="float64", na_value=np.nan)
+    units = df["Кол-во единиц"].to_numpy(dtype="float64", na_value=np.nan)
+    salary = df["Тарифная ставка (оклад), руб."].to_numpy(dtype="float64", na_value=np.nan) / 100
+    salary = np.nan_to_num(salary, nan=0.0)
+
+    params = pd.DataFrame(
+        [[getattr(rule, name) for name in RULE_COLUMNS] for rule in rules], columns=list(RULE_COLUMNS)
+    )
+    # Процент повышения только масштабирует сумму: правила, которые отличаются
+    # лишь им, делят одну маску кандидатов.
+    cutoffs = np.array([rule.last_raise_cutoff(now).to_datetime64() for rule in rules], dtype="datetime64[ns]")
+    keys = params[["max_paid_ratio", "min_seniority", "min_units"]].assign(cutoff=cutoffs)
+    masks = keys.drop_duplicates().reset_index(drop=True)
+    mask_index = keys.groupby(list(keys.columns), sort=False).ngroup().to_numpy()
+
+    counts = np.zeros(len(masks), dtype=np.int64)
+    salary_totals = np.zeros(len(masks))
+    step = max(1, max_cells // max(len(df), 1))
+    for start in range(0, len(masks), step):
+        block = masks.iloc[start:start + step]
+        ratio_masks, ratio_index = _threshold_masks(paid_ratio, block["max_paid_ratio"].to_numpy(), np.less)
+        date_masks, date_index = _threshold_masks(last_raise, block["cutoff"].to_numpy(), np.less_equal)
+        seniority_masks, seniority_index = _threshold_masks(
+            seniority, block["min_seniority"].to_numpy(), np.greater
+        )
+        unit_masks, unit_index = _threshold_masks(units, block["min_units"].to_numpy(), np.greater)
+        candidates = (
+            ratio_masks[ratio_index]
+            & date_masks[date_index]
+            & seniority_masks[seniority_index]
+            & unit_masks[unit_index]
+        )
+        counts[start:start + step] = candidates.sum(axis=1)
+        salary_totals[start:start + step] = candidates.astype(np.float64) @ salary
+
+    counts, salary_totals = counts[mask_index], salary_totals[mask_index]
+    desired = salary_totals * params["raise_percent"].to_numpy(dtype="float64")
+    scales = np.ones_like(desired)
+    over = (desired > 0) & (desired > budget_limit)
+    scales[over] = budget_limit / desired[over]
+    summary = params.rename(columns=RULE_COLUMNS)
+    summary["Рекомендовано"] = counts
+    summary["Желаемые повышения"] = desired
+    summary["Коэффициент"] = scales
+    return summary
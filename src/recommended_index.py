@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import base64
+import json
+from typing import Iterable, Mapping, Sequence
+
+import numpy as np
+import pandas as pd
+
+
+class RecommendedIndex:
+    # Кандидаты на повышение в порядке убывания желаемой суммы (при равенстве —
+    # по ключу сотрудника). Порядок от лимита не зависит: лимит умножает все
+    # суммы на один коэффициент. Позиция в этом порядке — ранг; ранги разложены
+    # по ячейкам фильтров (сочетаниям значений колонок groups), страница — бинарный
+    # поиск курсора в подходящих ячейках и выбор лучших рангов из их окон.
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        key: str,
+        order_by: str,
+        groups: Sequence[str],
+        ratio: str,
+        columns: Iterable[str],
+    ) -> None:
+        candidates = df[df["Рекомендуется повышение"]]
+        keys = candidates[key].astype(str).to_numpy()
+        # Сортируем по отрицанию суммы; кандидаты без суммы — в конце.
+        sort_key = -candidates[order_by].to_numpy(dtype="float64", na_value=np.nan)
+        sort_key[np.isnan(sort_key)] = np.inf
+        order = np.lexsort((keys, sort_key))
+
+        self.keys = keys[order]
+        self.ranks = np.arange(len(order))
+        self.sort_key = sort_key[order]
+        self.ratio = candidates[ratio].to_numpy(dtype="float64", na_value=np.nan)[order]
+        self.rows = candidates[[column for column in dict.fromkeys(columns) if column in candidates.columns]]
+        self.rows = self.rows.iloc[order].reset_index(drop=True)
+        self.groups = list(groups)
+
+        values = {column: candidates[column].to_numpy()[order] for column in self.groups}
+        codes = np.zeros(len(order), dtype=np.int64)
+        for column in self.groups:
+            column_codes, _ = pd.factorize(values[column])
+            codes = codes * (int(column_codes.max(initial=-1)) + 2) + column_codes + 1
+        cell, cell_keys = pd.factorize(codes)
+        # Ранги каждой ячейки идут по возрастанию: устойчивая сортировка по ячейке.
+        by_cell = np.argsort(cell, kind="stable")
+        bounds = np.cumsum(np.bincount(cell, minlength=len(cell_keys)))[:-1]
+        self.cells = np.split(by_cell, bounds) if len(order) else []
+        first = by_cell[np.concatenate([[0], bounds])] if len(order) else by_cell
+        self.cell_labels = pd.DataFrame({column: values[column][first].astype(str) for column in self.groups})
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def cursor(self, rank: int) -> str:
+        raw = json.dumps([float(self.sort_key[rank]), str(self.keys[rank])])
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+    def _boundary(self, cursor: str) -> int:
+        # Число кандидатов не дальше курсора: курсор хранит значения ключа
+        # сортировки, а не позицию, поэтому переживает обновление данных.
+        try:
+            sort_key, key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            sort_key, key = float(sort_key), str(key)
+        except (ValueError, TypeError) as exc:
+            raise ValueError("Некорректный курсор") from exc
+        low = np.searchsorted(self.sort_key, sort_key, side="left")
+        high = np.searchsorted(self.sort_key, sort_key, side="right")
+        return int(low + np.searchsorted(self.keys[low:high], key, side="right"))
+
+    def _cell_ranks(self, filters: Mapping[str, Iterable[str]]) -> list[np.ndarray]:
+        filters = {column: {str(value) for value in values} for column, values in filters.items() if values}
+        if not filters:
+            return [self.ranks]
+        keep = np.ones(len(self.cells), dtype=bool)
+        for column, values in filters.items():
+            keep &= self.cell_labels[column].isin(values).to_numpy()
+        return [self.cells[cell] for cell in np.flatnonzero(keep)]
+
+    def page(
+        self,
+        size: int,
+        after: str | None = None,
+        filters: Mapping[str, Iterable[str]] | None = None,
+        ratio_range: tuple[float | None, float | None] = (None, None),
+    ) -> tuple[np.ndarray, str | None]:
+        # Из каждой подходящей ячейки берется окно после курсора; окно растет,
+        # только если фильтр по проплаченности отсеял слишком много.
+        boundary = self._boundary(after) if after else 0
+        low, high = ratio_range
+        bounded = low is not None or high is not None
+        low = -np.inf if low is None else low
+        high = np.inf if high is None else high
+        need = size + 1
+        picked = []
+        for ranks in self._cell_ranks(filters or {}):
+            start = np.searchsorted(ranks, boundary, side="left")
+            window = need
+            while True:
+                chunk = ranks[start:start + window]
+                if bounded:
+                    ratio = self.ratio[chunk]
+                    chunk = chunk[(ratio >= low) & (ratio <= high)]
+                if len(chunk) >= need or start + window >= len(ranks):
+                    break
+                window *= 4
+            picked.append(chunk[:need])
+
+        ranks = np.concatenate(picked) if picked else np.empty(0, dtype=np.int64)
+        if len(ranks) > need:
+            ranks = ranks[np.argpartition(ranks, need - 1)[:need]]
+        ranks.sort()
+        if len(ranks) > size:
+            return ranks[:size], self.cursor(ranks[size - 1])
+        return ranks, None
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class SharedColumns:
+    # Числовые колонки фрейма, сложенные подряд в один блок разделяемой памяти.
+    # Описание (имя блока и раскладка) дешево передается в процессы пула, а сами
+    # данные не сериализуются: каждый процесс читает из блока только свои строки.
+    name: str
+    rows: int
+    layout: tuple[tuple[str, str, int], ...]
+
+    @classmethod
+    def create(cls, df: pd.DataFrame, columns: list[str]) -> tuple[SharedColumns, SharedMemory]:
+        arrays = [df[column].to_numpy() for column in columns]
+        layout, offset = [], 0
+        for column, values in zip(columns, arrays):
+            if values.dtype.hasobject:
+                raise TypeError(f"Колонка {column} не числовая: {values.dtype}")
+            layout.append((column, values.dtype.str, offset))
+            # Смещения выравниваются по 8 байт, чтобы массивы читались без копии.
+            offset += -(-values.nbytes // 8) * 8
+        shm = SharedMemory(create=True, size=max(offset, 1))
+        for (_, dtype, start), values in zip(layout, arrays):
+            np.ndarray(len(values), dtype=dtype, buffer=shm.buf, offset=start)[:] = values
+        return cls(shm.name, len(df), tuple(layout)), shm
+
+    def read(self, start: int, stop: int) -> pd.DataFrame:
+        # Строки [start, stop) копируются из блока, после чего блок можно закрыть.
+        shm = SharedMemory(name=self.name)
+        try:
+            frame = pd.DataFrame(
+                {
+                    column: np.ndarray(self.rows, dtype=dtype, buffer=shm.buf, offset=offset)[start:stop].copy()
+                    for column, dtype, offset in self.layout
+                },
+                index=pd.RangeIndex(start, stop),
+            )
+        finally:
+            shm.close()
+        return frame
@@ -0,0 +1,188 @@
+from __future__ import annotations
+
+import math
+import os
+import shutil
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from frame_cache import FileStamp
+from output_store import OutputWriter
+from payroll_processor import COST_SPLIT, UNIT_KEY, PayrollProcessor
+
+# Во сколько раз датафрейм из строк/категорий больше CSV на диске (оценка сверху).
+FRAME_EXPANSION = 6
+STAFF_SOURCES = ("positions", "org_units", "salaries", "projects", "bonuses")
+
+
+@dataclass
+class StreamResult:
+    employees: int
+    vacancies: int
+    leftover: float
+    partitions: int
+
+
+class StreamingPayrollProcessor(PayrollProcessor):
+    # Штатные таблицы читаются кусками и раскладываются на диск по хэшу
+    # Имени штатной единицы: все строки одной единицы попадают в одну часть,
+    # поэтому соединение и метрики считаются по частям. В памяти целиком
+    # держатся только справочники (взносы и ставки рынка).
+    def __init__(
+        self,
+        data_dir: Path | str,
+        output_dir: Path | str = "output",
+        memory_limit: int = 1024 * 1024 * 1024,
+        spill_dir: Path | str | None = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(data_dir, output_dir, **kwargs)
+        self.memory_limit = memory_limit
+        self.spill_dir = Path(spill_dir) if spill_dir else self.output_dir
+
+    def plan(self) -> tuple[int, int]:
+        sizes = [(self.data_dir / getattr(self.files, name)).stat().st_size for name in STAFF_SOURCES]
+        partitions = max(1, math.ceil(sum(sizes) * FRAME_EXPANSION / self.memory_limit))
+
+        with open(self.data_dir / self.files.positions, "rb") as fh:
+            sample = fh.read(1 << 16)
+        row_bytes = max(len(sample) / max(sample.count(b"\n"), 1), 1)
+        # Кусок одного файла занимает не больше четверти бюджета.
+        chunksize = max(1_000, int(self.memory_limit / 4 / (row_bytes * FRAME_EXPANSION)))
+        return partitions, chunksize
+
+    @staticmethod
+    def _part_path(root: Path, stage: str, partition: int) -> Path:
+        return root / stage / f"{partition:05d}"
+
+    def spill_sources(self, root: Path, partitions: int, chunksize: int) -> None:
+        for name in STAFF_SOURCES:
+            path = self.data_dir / getattr(self.files, name)
+            schema = getattr(self.schemas, name)
+            for number, chunk in enumerate(self.iter_csv(path, schema, chunksize)):
+                hashes = pd.util.hash_pandas_object(chunk[UNIT_KEY].astype(str), index=False)
+                parts = (hashes.to_numpy() % np.uint64(partitions)).astype(np.int64)
+                for partition in np.unique(parts):
+                    target = self._part_path(root, name, int(partition))
+                    target.mkdir(parents=True, exist_ok=True)
+                    piece = chunk.loc[parts == partition].reset_index(drop=True)
+                    piece.to_feather(target / f"{number:06d}.feather")
+
+    def _read_part(self, root: Path, name: str, partition: int) -> pd.DataFrame:
+        target = self._part_path(root, name, partition)
+        pieces = sorted(target.glob("*.feather")) if target.exists() else []
+        if pieces:
+            return pd.concat([pd.read_feather(p) for p in pieces], ignore_index=True)
+        path = self.data_dir / getattr(self.files, name)
+        return pd.read_csv(path, sep="\t", encoding="utf-8-sig", dtype=str, nrows=0)
+
+    @staticmethod
+    def _append_csv(df: pd.DataFrame, path: Path) -> None:
+        df.to_csv(path, mode="a", header=not path.exists(), index=False)
+
+    def process_stream(self, budget_limit: float = 10_000_000, plot: bool = True) -> StreamResult:
+        partitions, chunksize = self.plan()
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.spill_dir.mkdir(parents=True, exist_ok=True)
+        root = Path(tempfile.mkdtemp(prefix=".spill-", dir=self.spill_dir))
+        employees_tmp = self.output_dir / f"employees_fot.csv.{os.getpid()}.tmp"
+        vacancies_tmp = self.output_dir / f"vacancies.csv.{os.getpid()}.tmp"
+        try:
+            self.spill_sources(root, partitions, chunksize)
+
+            header = pd.read_csv(
+                self.data_dir / self.files.salaries, sep="\t", encoding="utf-8-sig", nrows=0
+            )
+            self.salary_pay_cols = self.salary_pay_columns(header.columns)
+            duplicates: dict[str, int] = {}
+            market = self.load_csv(self.files.market, self.schemas.market)
+            insurance = self.load_csv(self.files.insurance, self.schemas.insurance)
+
+            # Первый проход: метрики по частям, общая сумма желаемых повышений
+            # и максимумы долей затрат для нормализации процентов.
+            self.percent_max = {}
+            total_desired = 0.0
+            percent_max = {col: np.nan for col in COST_SPLIT}
+            vacancies = 0
+            for partition in range(partitions):
+                sources = {name: self._read_part(root, name, partition) for name in STAFF_SOURCES}
+                self.duplicate_keys = {}
+                joined, part_vacancies = self.join_staff(sources)
+                self._append_csv(part_vacancies, vacancies_tmp)
+                vacancy_dtypes = part_vacancies.dtypes
+                vacancies += len(part_vacancies)
+                del sources, part_vacancies
+
+                df = self.join_market(joined, market)
+                df = self.join_insurance(df, insurance)
+                df = self.prepare_metrics(df)
+                # Дубликаты штатных таблиц суммируются по частям, справочники общие.
+                for name, count in self.duplicate_keys.items():
+                    duplicates[name] = duplicates.get(name, 0) + count if name in STAFF_SOURCES else count
+                total_desired += float(df["Сумма повышения"].sum())
+                for col in COST_SPLIT:
+                    if df[col].notna().any():
+                        percent_max[col] = np.nanmax([percent_max[col], df[col].max()])
+                target = self._part_path(root, "prepared", partition)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                df.to_feather(target.with_suffix(".feather"))
+                del joined, df
+
+            # Второй, легкий проход: общий коэффициент лимита и доли затрат
+            # по максимуму всего набора, как в расчете в памяти.
+            self.duplicate_keys = duplicates
+            self.percent_max = {col: val for col, val in percent_max.items() if not np.isnan(val)}
+            scale = self.budget_scale(total_desired, budget_limit)
+            employees = 0
+            raised = 0.0
+            totals: dict[str, pd.Series] = {}
+            for partition in range(partitions):
+                df = pd.read_feather(self._part_path(root, "prepared", partition).with_suffix(".feather"))
+                self.split_costs(df)
+                df["Повышение по лимиту"] = df["Сумма повышения"] * scale
+                df["Новый ФОТ (после лимита)"] = df["ФОТ"] + df["Повышение по лимиту"]
+                raised += float(df["Повышение по лимиту"].sum())
+                employees += len(df)
+                self._append_csv(df, employees_tmp)
+                employee_dtypes = df.dtypes
+                if plot:
+                    for kind, series in self.raise_totals(df).items():
+                        totals[kind] = series.add(totals[kind], fill_value=0) if kind in totals else series
+                del df
+
+            tables = {}
+            for tmp, name, dtypes in (
+                (employees_tmp, "employees_fot", employee_dtypes),
+                (vacancies_tmp, "vacancies", vacancy_dtypes),
+            ):
+                # Без строк таблица все равно публикуется — файлом из одного
+                # заголовка: по employees_fot.csv считается версия набора.
+                if not tmp.exists():
+                    pd.DataFrame(columns=dtypes.index).to_csv(tmp, index=False)
+                os.replace(tmp, self.output_dir / f"{name}.csv")
+                rows = employees if name == "employees_fot" else vacancies
+                tables[name] = {
+                    "rows": rows,
+                    "columns": {col: str(dtype) for col, dtype in dtypes.items()},
+                    "partition_by": None,
+                    "files": [{"path": f"{name}.csv", "rows": rows, "value": None}],
+                }
+            # Манифест обновляется, а указатель снимка снимается, чтобы читатели
+            # не взяли результаты прошлого прогона.
+            version = FileStamp.content_hash(self.output_dir / "employees_fot.csv")[:20]
+            OutputWriter(self.output_dir).write_manifest(tables, version)
+            self.snapshot.pointer.unlink(missing_ok=True)
+            self.dataset_version = version
+            if plot:
+                for kind, series in totals.items():
+                    if not series.empty:
+                        self.render_chart(series, kind, self.output_dir / f"raise_by_{kind}.png")
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+            employees_tmp.unlink(missing_ok=True)
+            vacancies_tmp.unlink(missing_ok=True)
+        return StreamResult(employees, vacancies, budget_limit - raised, partitions)
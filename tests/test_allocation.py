@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from allocation import CAP, FULL, MINIMUM, TOTAL, AllocationRules, water_fill
+
+
+def test_rules_file_casts_values(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"max_raise": "50000", "mrf": {"МРФ Юг": 1e6}, "grade": {5: "5e5"}}), encoding="utf-8")
+    rules = AllocationRules.from_file(path)
+    assert rules.max_raise == 50000.0 and isinstance(rules.max_raise, float)
+    assert rules.mrf_budgets == {"МРФ Юг": 1e6}
+    assert rules.grade_budgets == {"5": 5e5}
+
+
+def test_rules_file_rejects_unknown_keys(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"max_rise": 50000}), encoding="utf-8")
+    with pytest.raises(ValueError, match="max_rise"):
+        AllocationRules.from_file(path)
+
+
+def test_water_fill_funds_lowest_paid_ratio_first():
+    # Лимита 20 хватает, чтобы поднять первого до проплаченности 0,7;
+    # второй (0,8) выше этого уровня и не получает ничего.
+    result = water_fill([50, 80], [100, 100], [40, 40], 20)
+    assert result.amount.tolist() == pytest.approx([20, 0])
+    assert list(result.binding) == [TOTAL, TOTAL]
+    assert result.spent == pytest.approx(20)
+
+
+def test_water_fill_applies_cap_and_minimum():
+    result = water_fill([50, 50, 50, 50], [100, 100, 100, 0], [40, 10, 2, 40], np.inf, cap=30, minimum=5)
+    assert result.amount[:3].tolist() == pytest.approx([30, 10, 0])
+    assert np.isnan(result.amount[3])
+    assert list(result.binding[:3]) == [CAP, FULL, MINIMUM]
+    assert pd.isna(result.binding[3])
+
+
+def test_water_fill_group_budgets_bind_separately():
+    # Бюджет грейда «4» исчерпывается раньше (уровень 0,625), затем МРФ «Юг»
+    # отдает остаток A; у C ограничений нет.
+    groups = {
+        "МРФ": (np.array(["Юг", "Юг", "Север", "Север"]), {"Юг": 30}),
+        "грейд": (np.array(["5", "4", "5", "4"]), {"4": 25}),
+    }
+    result = water_fill([50] * 4, [100] * 4, [40] * 4, 1000, groups)
+    assert result.amount.tolist() == pytest.approx([17.5, 12.5, 40, 12.5])
+    assert list(result.binding) == ["МРФ", "грейд", FULL, "грейд"]
+    assert result.binding_counts() == {FULL: 1, "МРФ": 1, "грейд": 2}
+
+
+def test_water_fill_never_exceeds_budgets():
+    rng = np.random.default_rng(7)
+    size = 5000
+    market = rng.uniform(50_000, 200_000, size)
+    current = market * rng.uniform(0.4, 1.1, size)
+    desired = current * 0.3
+    mrf = rng.integers(0, 4, size).astype(str)
+    grade = rng.integers(1, 4, size).astype(str)
+    mrf_budgets = {"0": 2e7, "1": 3e7, "2": 1e8}
+    grade_budgets = {"1": 2.5e7, "3": 4e7}
+    result = water_fill(
+        current, market, desired, 1.2e8,
+        {"МРФ": (mrf, mrf_budgets), "грейд": (grade, grade_budgets)},
+        cap=40_000, minimum=3_000,
+    )
+    amount = result.amount
+    assert result.spent == pytest.approx(amount.sum())
+    assert amount.sum() <= 1.2e8 * (1 + 1e-9)
+    for labels, budgets in ((mrf, mrf_budgets), (grade, grade_budgets)):
+        for label, limit in budgets.items():
+            assert amount[labels == label].sum() <= limit * (1 + 1e-9)
+    assert (amount <= np.minimum(desired, 40_000) + 1e-6).all()
+    assert ((amount == 0) | (amount >= 3_000 - 1e-6)).all()
+    assert {"МРФ", "грейд", MINIMUM} <= set(result.binding_counts())
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import multiprocessing
+
+import pandas as pd
+
+from frame_cache import FrameCache
+
+
+def _store_many(cache_dir, source_dir, worker):
+    cache = FrameCache(cache_dir)
+    for number in range(10):
+        path = source_dir / f"{worker}-{number}.csv"
+        stamp, _ = cache.lookup(path)
+        cache.store(path, "", stamp, pd.DataFrame({"value": [worker, number]}))
+
+
+def test_parallel_stores_keep_every_entry(tmp_path):
+    sources = tmp_path / "src"
+    sources.mkdir()
+    for worker in range(4):
+        for number in range(10):
+            (sources / f"{worker}-{number}.csv").write_text(f"{worker},{number}\n")
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_store_many, args=(tmp_path / "cache", sources, w)) for w in range(4)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+        assert process.exitcode == 0
+
+    cache = FrameCache(tmp_path / "cache")
+    assert len(cache._read_index()) == 40
+    assert len(list((tmp_path / "cache").glob("*.feather"))) == 40
+    stamp, df = cache.lookup(sources / "2-7.csv")
+    assert df["value"].tolist() == [2, 7]
+
+
+def test_warm_hit_does_not_rewrite_index_and_eviction_is_lru(tmp_path):
+    frame = pd.DataFrame({"value": range(1000)})
+    cache = FrameCache(tmp_path / "cache")
+    paths = []
+    for number in range(3):
+        path = tmp_path / f"{number}.csv"
+        path.write_text(str(number))
+        stamp, _ = cache.lookup(path)
+        cache.store(path, "", stamp, frame)
+        paths.append(path)
+    index_path = tmp_path / "cache" / cache.index_name
+    before = index_path.stat().st_mtime_ns
+    assert cache.lookup(paths[0])[1] is not None
+    assert index_path.stat().st_mtime_ns == before
+
+    # Первый файл только что прочитан, поэтому вытесняется второй.
+    single = cache._read_index()[cache._key(paths[0], "")]["bytes"]
+    cache.max_bytes = 3 * single
+    path = tmp_path / "3.csv"
+    path.write_text("3")
+    stamp, _ = cache.lookup(path)
+    cache.store(path, "", stamp, frame)
+    assert cache.lookup(paths[0])[1] is not None
+    assert cache.lookup(paths[1])[1] is None
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from payroll_processor import UNIT_KEY, PayrollProcessor
+
+STAFF = ["positions", "org_units", "salaries", "projects", "bonuses"]
+
+
+def merge_staff(sources: dict[str, pd.DataFrame]) -> pd.DataFrame:
+    # Прежнее соединение: цепочка merge по всем общим колонкам и первая строка по ключу.
+    frames = [sources[name].loc[sources[name]["Статус назначения"].ne("Вакансия")] for name in STAFF]
+    df = frames[0]
+    for frame in frames[1:]:
+        df = pd.merge(df, frame, how="inner")
+    return df.drop_duplicates(subset=UNIT_KEY).reset_index(drop=True)
+
+
+def with_duplicates(df: pd.DataFrame, units: pd.Series, **changes) -> pd.DataFrame:
+    # Перед строками единиц вставляются их копии с измененными колонками.
+    copies = df.loc[df[UNIT_KEY].isin(units)].assign(**changes)
+    return pd.concat([copies, df], ignore_index=True)
+
+
+def test_inner_join_matches_merge_on_duplicate_keys(data_dir, tmp_path):
+    processor = PayrollProcessor(data_dir, tmp_path)
+    sources = processor.load_sources()
+    employees = sources["positions"].loc[sources["positions"]["Статус назначения"].ne("Вакансия"), UNIT_KEY]
+    units = employees.drop_duplicates().sample(15, random_state=0)
+    # Ранний дубликат оклада с чужим табельным номером не должен отменять пару.
+    sources["salaries"] = with_duplicates(sources["salaries"], units[:5], **{"Таб. №": "0"})
+    # Ранний дубликат должности без пары в других таблицах уступает следующей строке.
+    sources["positions"] = with_duplicates(sources["positions"], units[5:10], **{"Таб. №": "0"})
+    # Дубликат с тем же табельным номером, но другим окладом: берется первый.
+    salary = sources["salaries"]["Тарифная ставка (оклад), руб."]
+    sources["salaries"] = with_duplicates(
+        sources["salaries"], units[10:], **{"Тарифная ставка (оклад), руб.": salary.max() + 1}
+    )
+
+    joined, _ = processor.join_staff(sources)
+    expected = merge_staff(sources)
+    assert len(joined) == len(expected)
+    assert list(joined.columns) == list(expected.columns)
+    for column in expected.columns:
+        left = joined[column].astype(object).to_numpy()
+        right = expected[column].astype(object).to_numpy()
+        assert np.array_equal(pd.isna(left), pd.isna(right)), column
+        assert (left[~pd.isna(left)] == right[~pd.isna(right)]).all(), column
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import pandas as pd
+import pytest
+
+from parallel_loader import ParallelLoader
+from payroll_processor import PayrollProcessor
+
+
+@pytest.mark.parametrize("pool", ["thread", "process"])
+def test_parallel_load_matches_serial(data_dir, tmp_path, pool):
+    serial = PayrollProcessor(data_dir, tmp_path).load_sources()
+    # Малый split_bytes режет файлы на части, чтобы проверить и разбор диапазонов.
+    loader = ParallelLoader(2, pool=pool, split_bytes=64 * 1024)
+    parallel = PayrollProcessor(data_dir, tmp_path, loader=loader).load_sources()
+    assert list(parallel) == list(serial)
+    for name, df in serial.items():
+        pd.testing.assert_frame_equal(parallel[name], df, check_categorical=False, obj=name)
+
+
+@pytest.mark.parametrize("pool", ["thread", "process"])
+def test_parallel_load_error_names_file(data_dir, tmp_path, pool):
+    broken = tmp_path / "data"
+    broken.mkdir()
+    processor = PayrollProcessor(broken, tmp_path / "output", loader=ParallelLoader(2, pool=pool))
+    for name in vars(processor.files).values():
+        (broken / name).write_bytes((data_dir / name).read_bytes())
+    # Файл не в UTF-8: разбор падает в пуле.
+    (broken / processor.files.positions).write_bytes("Имя\tДолжность\nа\tб\n".encode("cp1251"))
+    with pytest.raises(Exception) as error:
+        processor.load_sources()
+    assert f"Файл: {broken / processor.files.positions}" in error.value.__notes__
+
+
+@pytest.mark.parametrize("loader", [None, ParallelLoader(2, pool="thread", split_bytes=64 * 1024)])
+def test_conversion_failures_are_replayed_from_cache(data_dir, tmp_path, loader):
+    broken = tmp_path / "data"
+    broken.mkdir()
+    files = PayrollProcessor(data_dir).files
+    for name in vars(files).values():
+        (broken / name).write_bytes((data_dir / name).read_bytes())
+    salaries = broken / files.salaries
+    lines = salaries.read_text(encoding="utf-8-sig").split("\n")
+    column = lines[0].split("\t").index("Тарифная ставка (оклад), руб.")
+    for number in (1, 2, len(lines) // 2):
+        fields = lines[number].split("\t")
+        fields[column] = "договорная"
+        lines[number] = "\t".join(fields)
+    salaries.write_text("\n".join(lines), encoding="utf-8-sig")
+
+    reports = []
+    for _ in range(2):
+        processor = PayrollProcessor(broken, tmp_path / "output", cache_dir=tmp_path / "cache", loader=loader)
+        processor.prepare()
+        reports.append([(s.column, s.failed, s.rows, s.examples) for s in processor.conversion_failures()])
+    assert reports[0] == reports[1] == [("Тарифная ставка (оклад), руб.", 3, len(lines) - 2, ["договорная"])]
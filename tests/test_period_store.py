@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+import pandas as pd
+
+from period_store import ADDED, KEY, REMOVED, PeriodStore
+
+
+def frame(units: list[str], fot: list[float]) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            KEY: units,
+            "ФОТ": fot,
+            "Проплаченность": [0.5] * len(units),
+            "Рекомендуется повышение": ["Да"] * len(units),
+        }
+    )
+
+
+def test_period_named_like_settings_keeps_store(tmp_path):
+    store = PeriodStore(tmp_path, buckets=4)
+    store.save(frame(["a", "b"], [1.0, 2.0]), "store")
+    store.save(frame(["a", "c"], [1.5, 3.0]), "next")
+    assert PeriodStore(tmp_path)._bucket_count(2) == 4
+    assert [manifest["period"] for manifest in store.manifests()] == ["next", "store"]
+
+    changes = store.diff("store", "next").set_index(KEY)["Изменение"]
+    assert changes.to_dict() == {"a": "ФОТ", "b": REMOVED, "c": ADDED}
@@ -1,3 +1,10 @@
 from django.contrib import admin
 
-# No models to register.
+from .models import BudgetJob
+
+
+@admin.register(BudgetJob)
+class BudgetJobAdmin(admin.ModelAdmin):
+    list_display = ("dataset_version", "limit", "status", "attempts", "created_at", "finished_at")
+    list_filter = ("status",)
+    readonly_fields = ("result", "error", "created_at", "started_at", "finished_at")
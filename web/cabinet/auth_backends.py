@@ -2,8 +2,10 @@ from __future__ import annotations
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
+from django.db.models import Exists, OuterRef
 
-from .data_access import load_employees_df
+from .data_access import get_employee_store
+from .provisioning import BUDGETOLOGIST_GROUP, EMPLOYEE_GROUP, sync_users
 
 
 class TabNumberBackend:
@@ -15,30 +17,32 @@ class TabNumberBackend:
         if not username:
             return None
 
+        # Один запрос по индексу username: пользователь и признаки групп.
+        # Пользователи, имена и группа employee заводятся заранее командой
+        # sync_employee_users, поэтому обычный вход в базу не пишет.
         user_model = get_user_model()
-        user = user_model.objects.filter(username=username).first()
-        if user and (user.is_superuser or user.groups.filter(name="budgetologist").exists()):
+        user = (
+            user_model.objects.filter(username=username)
+            .annotate(
+                is_budgetologist=Exists(Group.objects.filter(user=OuterRef("pk"), name=BUDGETOLOGIST_GROUP)),
+                is_employee=Exists(Group.objects.filter(user=OuterRef("pk"), name=EMPLOYEE_GROUP)),
+            )
+            .first()
+        )
+        if user and (user.is_superuser or user.is_budgetologist):
             return user
 
-        df = load_employees_df()
-        row = df[df["Таб. №"].astype(str).str.strip() == username]
-        if row.empty:
+        record = get_employee_store().get(username)
+        if record is None:
             return None
 
-        if not user:
-            user = user_model.objects.create_user(username=username)
-            user.set_unusable_password()
-            user.save()
-
-        fio = row.iloc[0].get("Ф.И.О.")
-        if fio and user.first_name != fio:
-            user.first_name = fio
-            user.save(update_fields=["first_name"])
-
-        group, _ = Group.objects.get_or_create(name="employee")
-        if not user.groups.filter(name="employee").exists():
-            user.groups.add(group)
-
+        name = record.get("Ф.И.О.")
+        if not user or not user.is_employee or (name and user.first_name != name):
+            # Сотрудник появился, сменил Ф.И.О. или выпал из группы после
+            # последней синхронизации.
+            sync_users({username: name})
+            user = user_model.objects.get(username=username)
+            user.is_budgetologist = False
         return user
 
     def get_user(self, user_id):
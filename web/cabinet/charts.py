@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+
+import pandas as pd
+from django.conf import settings
+
+from payroll_processor import PayrollProcessor
+
+
+class ChartService:
+    def __init__(self, root: Path, max_items: int = 64, workers: int = 1) -> None:
+        self.root = root
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="charts")
+        self._pending: dict[str, Future] = {}
+        self._items: OrderedDict[str, Path] = OrderedDict()
+        if root.exists():
+            rendered = (p for p in root.glob("*.png") if ".tmp" not in p.name)
+            for path in sorted(rendered, key=lambda p: p.stat().st_mtime_ns):
+                self._items[path.stem] = path
+
+    @staticmethod
+    def key(version: str, limit: float, kind: str) -> str:
+        digest = hashlib.sha256(f"{version}|{limit:.2f}|{kind}".encode("utf-8")).hexdigest()
+        return f"{kind}-{digest[:20]}"
+
+    def _render(self, key: str, series: pd.Series, kind: str) -> None:
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            path = self.root / f"{key}.png"
+            tmp = path.with_name(f"{path.stem}.{os.getpid()}.tmp.png")
+            PayrollProcessor.render_chart(series, kind, tmp)
+            os.replace(tmp, path)
+            with self._lock:
+                self._items[key] = path
+                while len(self._items) > self.max_items:
+                    _, evicted = self._items.popitem(last=False)
+                    evicted.unlink(missing_ok=True)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def chart(self, version: str, limit: float, kind: str, series: pd.Series) -> str | None:
+        # Готовый график отдается из кэша, иначе рендер ставится в фоновую очередь
+        # и страница показывает заглушку до следующего обновления.
+        if series.empty:
+            return None
+        key = self.key(version, limit, kind)
+        with self._lock:
+            path = self._items.get(key)
+            if path is not None and path.exists():
+                self._items.move_to_end(key)
+                return path.name
+            if key not in self._pending:
+                self._pending[key] = self._executor.submit(self._render, key, series.copy(), kind)
+        return None
+
+
+@lru_cache(maxsize=1)
+def get_chart_service() -> ChartService:
+    return ChartService(settings.OUTPUT_DIR / "charts", max_items=settings.CHART_CACHE_SIZE)
@@ -1,16 +1,174 @@
 from __future__ import annotations
 
+import threading
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
 import pandas as pd
 from django.conf import settings
 
-from payroll_processor import PayrollProcessor
+from dataset_snapshot import DatasetSnapshot
+from output_store import OutputReader
+from parallel_loader import ParallelLoader
+from payroll_processor import GRADE, MARKET_KEY, TAB_KEY, PayrollProcessor
+from recommended_index import RecommendedIndex
+
+
+@lru_cache(maxsize=1)
+def get_processor() -> PayrollProcessor:
+    # Один процессор на процесс: подготовленный (не зависящий от лимита) результат
+    # кэшируется в нем и пересчитывается только при изменении исходных файлов.
+    loader = ParallelLoader(settings.SOURCE_LOAD_WORKERS) if settings.SOURCE_LOAD_WORKERS > 1 else None
+    return PayrollProcessor(
+        settings.DATA_DIR, settings.OUTPUT_DIR, cache_dir=settings.SOURCE_CACHE_DIR, loader=loader
+    )
+
+
+# Колонки, нужные кабинету сотрудника и входу по табельному номеру.
+EMPLOYEE_COLUMNS = [
+    TAB_KEY,
+    "Ф.И.О.",
+    "ФОТ",
+    "ФОТ по рынку",
+    "Проплаченность",
+    *MARKET_KEY,
+]
+
+# Колонки списка рекомендованных к повышению (ключ в JSON -> колонка расчета).
+RECOMMENDED_COLUMNS = {
+    "tab": TAB_KEY,
+    "fio": "Ф.И.О.",
+    "position": "Должность /профессия (разряд, категория)",
+    "fot": "ФОТ",
+    "fot_market": "ФОТ по рынку",
+    "paid_ratio": "Проплаченность",
+    "raise_amount": "Повышение по лимиту",
+    "mrf": "МРФ",
+    "grade": GRADE,
+}
+
+
+class EmployeeStore:
+    def __init__(
+        self,
+        output_dir: Path,
+        snapshot: DatasetSnapshot | None = None,
+        columns: list[str] | None = None,
+    ) -> None:
+        self.reader = OutputReader(output_dir)
+        self.snapshot = snapshot
+        self.columns = columns
+        self._lock = threading.Lock()
+        self._version: tuple | None = None
+        self._dataset: str | None = None
+        self._state: tuple[pd.DataFrame, dict[str, int]] | None = None
+
+    @staticmethod
+    def _build_index(df: pd.DataFrame) -> dict[str, int]:
+        tabs = df[TAB_KEY].astype(str).str.strip()
+        first = ~tabs.duplicated() & df[TAB_KEY].notna()
+        return dict(zip(tabs[first], np.flatnonzero(first.to_numpy())))
+
+    def _current_version(self) -> tuple:
+        if self.snapshot and self.snapshot.pointer.exists():
+            stat = self.snapshot.pointer.stat()
+            return ("snapshot", stat.st_size, stat.st_mtime_ns)
+        for path in (self.reader.manifest_path, self.reader.root / "employees_fot.csv"):
+            if path.exists():
+                stat = path.stat()
+                return ("file", str(path), stat.st_size, stat.st_mtime_ns)
+        return ("sources", get_processor().sources_stamp())
+
+    def _load(self, version: tuple) -> None:
+        if version[0] == "snapshot":
+            opened = self.snapshot.open_frame(self.columns)
+            if opened is None:
+                return
+            self._dataset, df = opened
+        elif version[0] == "file":
+            manifest = self.reader.manifest()
+            dataset = manifest["version"] if manifest else version[1:]
+            if self._state and dataset == self._dataset:
+                return
+            df = self.reader.read(
+                "employees_fot", columns=self.columns, dtype={TAB_KEY: str}, manifest=manifest
+            )
+            self._dataset = dataset
+        else:
+            df, _, _ = get_processor().process(write_outputs=False, plot=False)
+            self._dataset = None
+        self._state = (df, self._build_index(df))
+
+    def state(self) -> tuple[pd.DataFrame, dict[str, int]]:
+        version = self._current_version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._load(version)
+                    self._version = version
+        return self._state
+
+    def frame(self) -> pd.DataFrame:
+        return self.state()[0]
+
+    def get(self, tab_number: str) -> dict | None:
+        df, index = self.state()
+        position = index.get(str(tab_number).strip())
+        if position is None:
+            return None
+        return df.iloc[position].to_dict()
+
+
+@lru_cache(maxsize=1)
+def get_employee_store() -> EmployeeStore:
+    return EmployeeStore(
+        settings.OUTPUT_DIR,
+        DatasetSnapshot(settings.OUTPUT_DIR / "snapshots"),
+        columns=EMPLOYEE_COLUMNS,
+    )
+
+
+class RecommendedStore:
+    # Индекс рекомендованных строится один раз на подготовленный датафрейм
+    # процессора и заменяется, когда процессор подготовит новый.
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._state: tuple[pd.DataFrame, RecommendedIndex] | None = None
+
+    def index(self, prepared: pd.DataFrame) -> RecommendedIndex:
+        with self._lock:
+            if self._state is None or self._state[0] is not prepared:
+                index = RecommendedIndex(
+                    prepared,
+                    key=TAB_KEY,
+                    order_by="Сумма повышения",
+                    groups=("МРФ", GRADE),
+                    ratio="Проплаченность",
+                    columns=[*RECOMMENDED_COLUMNS.values(), "Сумма повышения"],
+                )
+                self._state = (prepared, index)
+            return self._state[1]
+
+
+@lru_cache(maxsize=1)
+def get_recommended_store() -> RecommendedStore:
+    return RecommendedStore()
 
 
 def load_employees_df(force_recalc: bool = False) -> pd.DataFrame:
-    output_path = settings.OUTPUT_DIR / "employees_fot.csv"
-    if output_path.exists() and not force_recalc:
-        return pd.read_csv(output_path)
+    if not force_recalc:
+        return get_employee_store().frame()
 
-    processor = PayrollProcessor(settings.DATA_DIR, settings.OUTPUT_DIR)
-    employees, _, _ = processor.process(write_outputs=False, plot=False)
+    employees, _, _ = get_processor().process(write_outputs=False, plot=False)
     return employees
+
+
+def market_rate(record: dict) -> float | None:
+    key = []
+    for col in MARKET_KEY:
+        value = record.get(col)
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        key.append(value)
+    return get_processor().load_market_index().rate(*key)
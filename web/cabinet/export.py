@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import io
+from typing import Iterable, Iterator, Mapping, Sequence
+
+import pandas as pd
+import pyarrow as pa
+
+from aggregation import RAISE, SCALED_RAISE
+
+NEW_FOT = "Новый ФОТ (после лимита)"
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "employees_fot.csv"),
+    "arrow": ("application/vnd.apache.arrow.stream", "employees_fot.arrows"),
+}
+
+
+def export_columns(df: pd.DataFrame, requested: Sequence[str], with_limit: bool) -> list[str]:
+    # Колонки выгрузки: запрошенные или все; колонки лимита есть только при заданном лимите.
+    available = [*df.columns, *((SCALED_RAISE, NEW_FOT) if with_limit else ())]
+    if not requested:
+        return available
+    unknown = [column for column in requested if column not in available]
+    if unknown:
+        raise KeyError(", ".join(unknown))
+    return list(dict.fromkeys(requested))
+
+
+def _source_columns(df: pd.DataFrame, columns: Sequence[str], scale: float | None) -> list[str]:
+    source = [column for column in columns if column in df.columns]
+    for column in (RAISE, "ФОТ") if scale is not None else ():
+        if column not in source:
+            source.append(column)
+    return source
+
+
+def _project(chunk: pd.DataFrame, source: list[str], columns: Sequence[str], scale: float | None) -> pd.DataFrame:
+    chunk = chunk[source]
+    if scale is not None:
+        raised = chunk[RAISE] * scale
+        chunk = chunk.assign(**{SCALED_RAISE: raised, NEW_FOT: chunk["ФОТ"] + raised})
+    return chunk[list(columns)]
+
+
+def export_header(df: pd.DataFrame, columns: Sequence[str], scale: float | None) -> pd.DataFrame:
+    # Пустой фрейм с колонками и типами выгрузки.
+    return _project(df.iloc[:0], _source_columns(df, columns, scale), columns, scale)
+
+
+def export_chunks(
+    df: pd.DataFrame,
+    columns: Sequence[str],
+    filters: Mapping[str, Iterable[str]],
+    scale: float | None,
+    chunk_rows: int,
+) -> Iterator[pd.DataFrame]:
+    # Фрейм идет кусками по chunk_rows строк: фильтр, колонки лимита и проекция
+    # применяются к куску, поэтому первый кусок готов до просмотра всего набора.
+    filters = {column: {str(value) for value in values} for column, values in filters.items() if values}
+    source = _source_columns(df, columns, scale)
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        for column, values in filters.items():
+            chunk = chunk[chunk[column].astype(str).isin(values)]
+        if not chunk.empty:
+            yield _project(chunk, source, columns, scale)
+
+
+def csv_stream(header: pd.DataFrame, chunks: Iterator[pd.DataFrame]) -> Iterator[bytes]:
+    # Заголовок уходит сразу, до первого куска данных.
+    yield header.to_csv(index=False).encode("utf-8")
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=False).encode("utf-8")
+
+
+def arrow_schema(header: pd.DataFrame) -> pa.Schema:
+    # Тип строковых колонок по пустому фрейму не вывести, и в разных кусках он
+    # мог бы различаться, поэтому object-колонки выгружаются строками.
+    schema = pa.Schema.from_pandas(header, preserve_index=False)
+    for position, (column, dtype) in enumerate(header.dtypes.items()):
+        if dtype == object:
+            schema = schema.set(position, pa.field(column, pa.string()))
+    return schema.remove_metadata()
+
+
+def _as_strings(chunk: pd.DataFrame) -> pd.DataFrame:
+    objects = [column for column, dtype in chunk.dtypes.items() if dtype == object]
+    if not objects:
+        return chunk
+    return chunk.assign(**{column: chunk[column].astype(str).where(chunk[column].notna()) for column in objects})
+
+
+def arrow_stream(header: pd.DataFrame, chunks: Iterator[pd.DataFrame]) -> Iterator[bytes]:
+    # Поток Arrow IPC: схема, затем по пакету записей на кусок. Буфер
+    # опустошается после каждого пакета.
+    schema = arrow_schema(header)
+    buffer = io.BytesIO()
+
+    def drain() -> bytes:
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    with pa.ipc.new_stream(pa.PythonFile(buffer, mode="w"), schema) as writer:
+        yield drain()
+        for chunk in chunks:
+            writer.write_batch(pa.RecordBatch.from_pandas(_as_strings(chunk), schema=schema, preserve_index=False))
+            yield drain()
+    yield drain()
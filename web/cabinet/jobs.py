@@ -0,0 +1,262 @@
+from __future__ import annotations
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from functools import lru_cache
+
+import pandas as pd
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from aggregation import COUNT, RAISE, RECOMMENDED, SCALED_RAISE, AggregationCube
+from payroll_processor import CUBE_DIMENSIONS, PayrollProcessor
+from recommended_index import RecommendedIndex
+
+from .data_access import RECOMMENDED_COLUMNS, get_processor, get_recommended_store
+from .models import BudgetJob
+
+logger = logging.getLogger("cabinet.jobs")
+
+
+class QueueFull(Exception):
+    pass
+
+
+class DatasetChanged(Exception):
+    def __init__(self, expected: str, current: str | None) -> None:
+        super().__init__(f"Данные обновились: версия {current} вместо {expected}")
+        self.expected = expected
+        self.current = current
+
+
+def json_value(value):
+    # JSONField не принимает numpy-типы и NaN.
+    if pd.isna(value):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+def budget_result(processor: PayrollProcessor, limit: float, version: str | None = None) -> dict:
+    # Итоги и разрезы берутся из куба: смена лимита только меняет коэффициент.
+    # Результат сохраняется под версией задачи, поэтому считать по другим
+    # данным нельзя.
+    prepared, _ = processor.prepare()
+    if version is not None and processor.prepared_version != version:
+        raise DatasetChanged(version, processor.prepared_version)
+    cube = processor.aggregation_cube()
+    scale = processor.budget_scale(cube.total(RAISE), limit)
+    total_raise = cube.total(RAISE) * scale
+
+    index = get_recommended_store().index(prepared)
+    ranks, _ = index.page(20)
+    return {
+        "version": processor.prepared_version,
+        "summary": {
+            "total_employees": int(cube.total(COUNT)),
+            "recommended_count": int(cube.total(RECOMMENDED)),
+            "total_raise": total_raise,
+            "leftover": float(limit - total_raise),
+        },
+        "recommended": recommended_rows(index, ranks, scale),
+        "totals": {
+            kind: {"labels": [str(label) for label in series.index], "values": series.astype(float).tolist()}
+            for kind, series in raise_totals(cube, scale).items()
+        },
+    }
+
+
+def recommended_rows(index: RecommendedIndex, ranks, scale: float) -> list[dict]:
+    rows = index.rows.iloc[ranks]
+    rows = rows.assign(**{SCALED_RAISE: rows[RAISE] * scale})
+    return [
+        {key: json_value(row.get(column)) for key, column in RECOMMENDED_COLUMNS.items()}
+        for row in rows.to_dict("records")
+    ]
+
+
+def raise_totals(cube: AggregationCube, scale: float) -> dict[str, pd.Series]:
+    return {
+        kind: cube.query([CUBE_DIMENSIONS[kind]], scale=scale).set_index(CUBE_DIMENSIONS[kind])[SCALED_RAISE]
+        for kind in ("mrf", "grade")
+    }
+
+
+def enqueue_budget(version: str, limit: Decimal, user=None, retry: bool = False) -> BudgetJob:
+    # Задача с той же версией данных и лимитом переиспользуется: готовая отдается
+    # сразу, ожидающая — общая для всех запросивших. Упавшая перезапускается
+    # только явным повторным запросом (retry).
+    limit = Decimal(limit).quantize(Decimal("0.01"))
+    job = BudgetJob.objects.filter(dataset_version=version, limit=limit).first()
+    if job is None:
+        if BudgetJob.objects.filter(status=BudgetJob.QUEUED).count() >= settings.BUDGET_JOB_QUEUE_LIMIT:
+            raise QueueFull
+        try:
+            with transaction.atomic():
+                job = BudgetJob.objects.create(
+                    dataset_version=version,
+                    limit=limit,
+                    requested_by=user if user and user.is_authenticated else None,
+                )
+        except IntegrityError:
+            job = BudgetJob.objects.get(dataset_version=version, limit=limit)
+    elif retry and job.status == BudgetJob.FAILED:
+        BudgetJob.objects.filter(pk=job.pk, status=BudgetJob.FAILED).update(
+            status=BudgetJob.QUEUED, attempts=0, error="", finished_at=None
+        )
+        job.refresh_from_db()
+
+    if not job.finished and settings.BUDGET_JOBS_IN_PROCESS:
+        get_job_runner().kick()
+    return job
+
+
+def _requeue_stale() -> None:
+    # Задачи воркера, который упал посреди расчета, возвращаются в очередь.
+    # Живой воркер обновляет heartbeat_at, поэтому долгий расчет сюда не попадает.
+    deadline = timezone.now() - timedelta(seconds=settings.BUDGET_JOB_TIMEOUT)
+    stale = BudgetJob.objects.filter(status=BudgetJob.RUNNING, heartbeat_at__lt=deadline)
+    exhausted = Q(attempts__gte=settings.BUDGET_JOB_MAX_ATTEMPTS)
+    stale.filter(exhausted).update(
+        status=BudgetJob.FAILED, error="Воркер перестал отвечать", finished_at=timezone.now()
+    )
+    stale.exclude(exhausted).update(status=BudgetJob.QUEUED)
+
+
+def claim_next() -> BudgetJob | None:
+    _requeue_stale()
+    while True:
+        pk = (
+            BudgetJob.objects.filter(status=BudgetJob.QUEUED)
+            .order_by("created_at")
+            .values_list("pk", flat=True)
+            .first()
+        )
+        if pk is None:
+            return None
+        # Условное обновление: задачу забирает только один воркер.
+        now = timezone.now()
+        claimed = BudgetJob.objects.filter(pk=pk, status=BudgetJob.QUEUED).update(
+            status=BudgetJob.RUNNING, started_at=now, heartbeat_at=now, attempts=F("attempts") + 1
+        )
+        if claimed:
+            return BudgetJob.objects.get(pk=pk)
+
+
+@contextmanager
+def heartbeat(pk: int):
+    # Пока идет расчет, отдельный поток отмечает задачу раз в BUDGET_JOB_HEARTBEAT секунд.
+    stop = threading.Event()
+
+    def beat() -> None:
+        try:
+            while not stop.wait(settings.BUDGET_JOB_HEARTBEAT):
+                BudgetJob.objects.filter(pk=pk, status=BudgetJob.RUNNING).update(heartbeat_at=timezone.now())
+        except Exception:
+            logger.exception("Не удалось отметить задачу %s", pk)
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=beat, name=f"budget-job-{pk}-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job: BudgetJob, processor: PayrollProcessor | None = None) -> None:
+    processor = processor or get_processor()
+    try:
+        with heartbeat(job.pk):
+            result = budget_result(processor, float(job.limit), job.dataset_version)
+    except DatasetChanged as exc:
+        # Пока задача ждала, данные обновились: она закрывается, а расчет того же
+        # лимита ставится на новую версию.
+        BudgetJob.objects.filter(pk=job.pk).update(
+            status=BudgetJob.FAILED, error=str(exc), finished_at=timezone.now()
+        )
+        try:
+            enqueue_budget(exc.current, job.limit, job.requested_by)
+        except QueueFull:
+            logger.warning("Очередь заполнена, расчет лимита %s для версии %s не поставлен", job.limit, exc.current)
+        return
+    except Exception as exc:
+        logger.exception("Расчет лимита %s завершился ошибкой", job.limit)
+        BudgetJob.objects.filter(pk=job.pk).update(
+            status=BudgetJob.FAILED, error=f"{type(exc).__name__}: {exc}", finished_at=timezone.now()
+        )
+        return
+    BudgetJob.objects.filter(pk=job.pk).update(
+        status=BudgetJob.DONE, result=result, error="", finished_at=timezone.now()
+    )
+    prune_finished()
+
+
+def prune_finished(keep: int | None = None) -> int:
+    keep = settings.BUDGET_JOB_KEEP if keep is None else keep
+    finished = BudgetJob.objects.filter(status__in=[BudgetJob.DONE, BudgetJob.FAILED])
+    old = list(finished.order_by("-finished_at").values_list("pk", flat=True)[keep:])
+    if not old:
+        return 0
+    return BudgetJob.objects.filter(pk__in=old).delete()[0]
+
+
+def drain(stop: threading.Event | None = None) -> int:
+    done = 0
+    try:
+        while not (stop and stop.is_set()):
+            job = claim_next()
+            if job is None:
+                break
+            run_job(job)
+            done += 1
+    finally:
+        # Соединения с базой у Django свои на каждый поток.
+        connections.close_all()
+    return done
+
+
+class JobRunner:
+    # Локальный пул: запрос только ставит задачу и будит пул, расчет идет
+    # в фоновых потоках процесса. Не больше workers расчетов одновременно.
+    def __init__(self, workers: int = 1) -> None:
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="budget-jobs")
+        self._lock = threading.Lock()
+        self._active = 0
+        self._wake = False
+
+    def kick(self) -> None:
+        with self._lock:
+            self._wake = True
+            if self._active >= self.workers:
+                return
+            self._active += 1
+        self._executor.submit(self._run)
+
+    def _run(self) -> None:
+        # Задача, поставленная, пока поток разбирал очередь, не теряется:
+        # поток проходит очередь еще раз.
+        while True:
+            with self._lock:
+                self._wake = False
+            try:
+                drain()
+            except Exception:
+                logger.exception("Ошибка разбора очереди расчетов")
+            with self._lock:
+                if not self._wake:
+                    self._active -= 1
+                    return
+
+
+@lru_cache(maxsize=1)
+def get_job_runner() -> JobRunner:
+    return JobRunner(settings.BUDGET_JOB_WORKERS)
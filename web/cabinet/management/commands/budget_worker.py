@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from cabinet.jobs import drain
+
+
+class Command(BaseCommand):
+    help = "Выполняет задачи пересчета бюджета из очереди"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.BUDGET_JOB_WORKERS,
+            help="Число одновременных расчетов",
+        )
+        parser.add_argument("--poll", type=float, default=1.0, help="Пауза между опросами очереди, с")
+        parser.add_argument("--once", action="store_true", help="Разобрать очередь и завершиться")
+
+    def handle(self, *args, workers: int, poll: float, once: bool, **options) -> None:
+        workers = max(1, workers)
+        stop = threading.Event()
+        totals = [0] * workers
+
+        def work(number: int) -> None:
+            while not stop.is_set():
+                done = drain(stop)
+                totals[number] += done
+                if not done:
+                    if once:
+                        return
+                    stop.wait(poll)
+
+        threads = [
+            threading.Thread(target=work, args=(number,), name=f"budget-worker-{number}")
+            for number in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            # Начатые расчеты доводятся до конца, новые не берутся.
+            stop.set()
+            for thread in threads:
+                thread.join()
+        self.stdout.write(f"Выполнено задач: {sum(totals)}")
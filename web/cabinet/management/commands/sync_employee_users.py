@@ -0,0 +1,30 @@
+from __future__ import annotations
+
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from cabinet.data_access import get_employee_store
+from cabinet.provisioning import sync_users
+
+
+class Command(BaseCommand):
+    help = "Заводит пользователей сотрудников из расчета: имена и группа employee"
+
+    def add_arguments(self, parser) -> None:
+        parser.add_argument("--batch-size", type=int, default=500, help="Строк в одном запросе к базе")
+
+    def handle(self, *args, batch_size: int, **options) -> None:
+        # Те же табельные номера, по которым кабинет пускает сотрудников.
+        df, index = get_employee_store().state()
+        names = df["Ф.И.О."].to_numpy()
+        records = {
+            tab: (str(names[position]).strip() if pd.notna(names[position]) else "")
+            for tab, position in index.items()
+        }
+        result = sync_users(records, batch_size=max(1, batch_size))
+        self.stdout.write(f"Сотрудников в расчете: {len(records)}")
+        self.stdout.write(f"Создано пользователей: {result.created}")
+        self.stdout.write(f"Обновлено имен: {result.renamed}")
+        self.stdout.write(f"Добавлено в группу employee: {result.added_to_group}")
+        if result.privileged:
+            self.stdout.write(f"Пропущено бюджетологов и администраторов: {result.privileged}")
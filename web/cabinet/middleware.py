@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import json
+import logging
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from profiling import Profiler, activate
+
+logger = logging.getLogger("cabinet.profiling")
+
+
+class ProfilingMiddleware:
+    # Этапы расчета, выполненные за запрос, пишутся в лог и в заголовок
+    # Server-Timing (виден в инструментах разработчика браузера).
+    def __init__(self, get_response) -> None:
+        if not settings.PROFILE_REQUESTS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        # tracemalloc общий на процесс: PROFILE_MEMORY имеет смысл только
+        # при однопоточном сервере.
+        profiler = Profiler(trace_memory=settings.PROFILE_MEMORY)
+        with activate(profiler):
+            response = self.get_response(request)
+        if profiler.stages:
+            logger.info(
+                "%s %s %s",
+                request.method,
+                request.path,
+                json.dumps(profiler.report(), ensure_ascii=False),
+            )
+            response["Server-Timing"] = ", ".join(
+                f"{stage.name};dur={stage.wall * 1000:.1f}" for stage in profiler.stages.values()
+            )
+        return response
@@ -1 +1,49 @@
-"""No database models for this app."""
+from __future__ import annotations
+
+from django.conf import settings
+from django.db import models
+
+
+class BudgetJob(models.Model):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "В очереди"),
+        (RUNNING, "Выполняется"),
+        (DONE, "Готово"),
+        (FAILED, "Ошибка"),
+    ]
+
+    # Одинаковые запросы (версия данных, лимит) сводятся в одну задачу,
+    # а ее результат переиспользуется всеми, кто спросит тот же лимит.
+    dataset_version = models.CharField(max_length=64)
+    limit = models.DecimalField(max_digits=14, decimal_places=2)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Воркер обновляет отметку, пока считает задачу; по устаревшей отметке
+    # задача считается брошенной упавшим воркером.
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        constraints = [
+            models.UniqueConstraint(fields=["dataset_version", "limit"], name="budget_job_unique_request"),
+        ]
+        indexes = [models.Index(fields=["status", "created_at"])]
+
+    def __str__(self) -> str:
+        return f"{self.dataset_version} / {self.limit} ({self.status})"
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (self.DONE, self.FAILED)
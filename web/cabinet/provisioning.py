@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Mapping
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.db import transaction
+from django.db.models import Q
+
+EMPLOYEE_GROUP = "employee"
+BUDGETOLOGIST_GROUP = "budgetologist"
+
+
+@dataclass
+class SyncResult:
+    created: int = 0
+    renamed: int = 0
+    added_to_group: int = 0
+    privileged: int = 0
+
+
+def sync_users(records: Mapping[str, str], batch_size: int = 500) -> SyncResult:
+    # records: табельный номер -> Ф.И.О. Заводит недостающих пользователей,
+    # обновляет имена и членство в группе employee пакетами, в одной транзакции.
+    # Суперпользователи и бюджетологи не трогаются, как и при входе.
+    user_model = get_user_model()
+    name_length = user_model._meta.get_field("first_name").max_length
+    names = {tab: (name or "")[:name_length] for tab, name in records.items()}
+    tabs = list(names)
+    result = SyncResult()
+
+    with transaction.atomic():
+        group, _ = Group.objects.get_or_create(name=EMPLOYEE_GROUP)
+        privileged = set(
+            user_model.objects.filter(Q(is_superuser=True) | Q(groups__name=BUDGETOLOGIST_GROUP))
+            .values_list("username", flat=True)
+        )
+        existing = {}
+        for start in range(0, len(tabs), batch_size):
+            batch = tabs[start:start + batch_size]
+            existing.update(
+                (user.username, user)
+                for user in user_model.objects.filter(username__in=batch).only("pk", "username", "first_name")
+            )
+
+        # Непригодный пароль («!» и случайный хвост) ни с чем не совпадает,
+        # поэтому один на всех новых пользователей.
+        password = make_password(None)
+        new = [
+            user_model(username=tab, first_name=names[tab], password=password)
+            for tab in tabs
+            if tab not in existing
+        ]
+        user_model.objects.bulk_create(new, batch_size=batch_size)
+        result.created = len(new)
+
+        renamed = []
+        for tab, user in existing.items():
+            if tab in privileged:
+                continue
+            if names[tab] and user.first_name != names[tab]:
+                user.first_name = names[tab]
+                renamed.append(user)
+        user_model.objects.bulk_update(renamed, ["first_name"], batch_size=batch_size)
+        result.renamed = len(renamed)
+        result.privileged = len(privileged & set(tabs))
+
+        # Ключи новых пользователей перечитываются: не все базы возвращают их из bulk_create.
+        members = [tab for tab in tabs if tab not in privileged]
+        user_ids = []
+        for start in range(0, len(members), batch_size):
+            batch = members[start:start + batch_size]
+            user_ids.extend(user_model.objects.filter(username__in=batch).values_list("pk", flat=True))
+        membership = user_model.groups.through
+        in_group = set()
+        for start in range(0, len(user_ids), batch_size):
+            in_group.update(
+                membership.objects.filter(group=group, user_id__in=user_ids[start:start + batch_size])
+                .values_list("user_id", flat=True)
+            )
+        missing = [membership(user_id=pk, group_id=group.pk) for pk in user_ids if pk not in in_group]
+        membership.objects.bulk_create(missing, batch_size=batch_size, ignore_conflicts=True)
+        result.added_to_group = len(missing)
+    return result
@@ -10,4 +10,9 @@ urlpatterns = [
     path("", views.dashboard_redirect, name="dashboard"),
     path("employee/", views.employee_dashboard, name="employee"),
     path("budget/", views.budget_dashboard, name="budget"),
+    path("budget/jobs/<int:pk>/", views.budget_job_status, name="budget_job"),
+    path("budget/chart-data/", views.budget_chart_data, name="budget_chart_data"),
+    path("budget/drilldown/", views.budget_drilldown, name="budget_drilldown"),
+    path("budget/recommended/", views.budget_recommended, name="budget_recommended"),
+    path("budget/export/", views.budget_export, name="budget_export"),
 ]
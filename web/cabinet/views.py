@@ -1,22 +1,53 @@
 from __future__ import annotations
 
+import time
 from decimal import Decimal
 
+import pandas as pd
 from django.conf import settings
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse, StreamingHttpResponse
 from django.shortcuts import redirect, render
+from django.urls import reverse
 
-from payroll_processor import PayrollProcessor
+from aggregation import RAISE
+from payroll_processor import CUBE_DIMENSIONS, GRADE
 
-from .data_access import load_employees_df
+from .charts import get_chart_service
+from .data_access import get_employee_store, get_processor, get_recommended_store, market_rate
+from .export import EXPORT_FORMATS, arrow_stream, csv_stream, export_chunks, export_columns, export_header
 from .forms import BudgetForm, TabLoginForm
+from .jobs import QueueFull, enqueue_budget, get_job_runner, json_value, raise_totals, recommended_rows
+from .models import BudgetJob
+from .provisioning import BUDGETOLOGIST_GROUP
+
+
+ROLE_SESSION_KEY = "cabinet_budgetologist"
 
 
 def _user_in_group(user, group_name: str) -> bool:
     return user.groups.filter(name=group_name).exists()
 
 
+def _remember_role(request, is_budgetologist: bool) -> bool:
+    request.session[ROLE_SESSION_KEY] = [is_budgetologist, time.time()]
+    return is_budgetologist
+
+
+def _is_budgetologist(request) -> bool:
+    # Роль кэшируется в сессии на ROLE_CACHE_SECONDS: редиректы и страницы
+    # не запрашивают группы пользователя каждый раз. Сессия сбрасывается при
+    # входе и выходе, так что роль не переходит к другому пользователю.
+    user = request.user
+    if user.is_superuser:
+        return True
+    cached = request.session.get(ROLE_SESSION_KEY)
+    if cached and time.time() - cached[1] < settings.ROLE_CACHE_SECONDS:
+        return cached[0]
+    return _remember_role(request, _user_in_group(user, BUDGETOLOGIST_GROUP))
+
+
 def login_view(request):
     if request.user.is_authenticated:
         return redirect("cabinet:dashboard")
@@ -28,6 +59,8 @@ def login_view(request):
         user = authenticate(request, username=tab_number)
         if user:
             login(request, user, backend="cabinet.auth_backends.TabNumberBackend")
+            # Признак бюджетолога пришел тем же запросом, что и пользователь.
+            _remember_role(request, user.is_superuser or user.is_budgetologist)
             return redirect("cabinet:dashboard")
         error = "Сотрудник с таким табельным номером не найден."
 
@@ -42,20 +75,18 @@ def logout_view(request):
 
 @login_required
 def dashboard_redirect(request):
-    if request.user.is_superuser or _user_in_group(request.user, "budgetologist"):
+    if _is_budgetologist(request):
         return redirect("cabinet:budget")
     return redirect("cabinet:employee")
 
 
 @login_required
 def employee_dashboard(request):
-    df = load_employees_df()
     tab_number = str(request.user.username).strip()
-    row = df[df["Таб. №"].astype(str) == tab_number]
+    data = get_employee_store().get(tab_number)
 
     employee = None
-    if not row.empty:
-        data = row.iloc[0].to_dict()
+    if data is not None:
         employee = {
             "fio": data.get("Ф.И.О."),
             "position": data.get("Должность /профессия (разряд, категория)"),
@@ -64,6 +95,11 @@ def employee_dashboard(request):
             "fot_market": data.get("ФОТ по рынку"),
             "paid_ratio": data.get("Проплаченность"),
         }
+        # Показатели — из опубликованного расчета. Ставка из текущего файла рынка
+        # показывается отдельно, если она уже разошлась с расчетом.
+        current_rate = market_rate(data)
+        if current_rate and current_rate != employee["fot_market"]:
+            employee["current_market"] = current_rate
 
     return render(
         request,
@@ -72,68 +108,242 @@ def employee_dashboard(request):
     )
 
 
+def _budget_context(result: dict) -> dict:
+    totals = {
+        kind: pd.Series(values["values"], index=values["labels"], dtype="float64")
+        for kind, values in result["totals"].items()
+    }
+    charts = {}
+    for kind, series in totals.items():
+        name = get_chart_service().chart(result["version"], result["limit"], kind, series)
+        charts[kind] = f"{settings.MEDIA_URL}charts/{name}" if name else None
+
+    return {
+        "summary": result["summary"],
+        "recommended": result["recommended"],
+        "by_mrf": list(totals["mrf"].sort_values(ascending=False).head(10).items()),
+        "by_grade": list(totals["grade"].sort_values(ascending=False).head(10).items()),
+        "charts": charts,
+    }
+
+
 @login_required
 def budget_dashboard(request):
-    if not (request.user.is_superuser or _user_in_group(request.user, "budgetologist")):
+    if not _is_budgetologist(request):
         return redirect("cabinet:employee")
 
-    form = BudgetForm(request.POST or None)
+    form = BudgetForm(request.POST or request.GET or None)
     limit = Decimal("10000000")
     if form.is_valid():
         limit = form.cleaned_data["limit"]
 
-    processor = PayrollProcessor(settings.DATA_DIR, settings.OUTPUT_DIR)
-    df, _, leftover = processor.process(budget_limit=float(limit), write_outputs=False, plot=True)
+    version = get_processor().current_version()
+    if request.method == "POST" and form.is_valid():
+        # Расчет ставится в очередь, страница открывается по GET и ждет результат.
+        try:
+            enqueue_budget(version, limit, request.user, retry=True)
+        except QueueFull:
+            pass
+        return redirect(f"{reverse('cabinet:budget')}?limit={limit:.2f}")
+
+    context = {"form": form, "limit": float(limit)}
+    try:
+        job = enqueue_budget(version, limit, request.user)
+    except QueueFull:
+        return render(request, "cabinet/budget_dashboard.html", {**context, "busy": True}, status=503)
+
+    context["job"] = job
+    if job.status == BudgetJob.DONE:
+        context.update(_budget_context({**job.result, "limit": float(job.limit)}))
+    return render(request, "cabinet/budget_dashboard.html", context)
+
 
-    recommended = df[df["Рекомендуется повышение"]].copy()
-    recommended = recommended.sort_values("Повышение по лимиту", ascending=False).head(20)
+@login_required
+def budget_job_status(request, pk: int):
+    if not _is_budgetologist(request):
+        return JsonResponse({"error": "forbidden"}, status=403)
 
-    by_mrf = (
-        df.groupby("МРФ")["Повышение по лимиту"]
-        .sum()
-        .sort_values(ascending=False)
-        .head(10)
+    job = BudgetJob.objects.filter(pk=pk).first()
+    if job is None:
+        return JsonResponse({"error": "not found"}, status=404)
+    if not job.finished and settings.BUDGET_JOBS_IN_PROCESS:
+        # Очередь могла остаться после перезапуска процесса.
+        get_job_runner().kick()
+    ahead = 0
+    if job.status == BudgetJob.QUEUED:
+        ahead = BudgetJob.objects.filter(status=BudgetJob.QUEUED, created_at__lt=job.created_at).count()
+    return JsonResponse(
+        {"id": job.pk, "status": job.status, "error": job.error, "limit": float(job.limit), "queued_ahead": ahead}
     )
-    by_grade = (
-        df.groupby("Грейд")["Повышение по лимиту"]
-        .sum()
-        .sort_values(ascending=False)
-        .head(10)
+
+
+@login_required
+def budget_chart_data(request):
+    if not _is_budgetologist(request):
+        return JsonResponse({"error": "forbidden"}, status=403)
+
+    form = BudgetForm(request.GET or None)
+    limit = Decimal("10000000")
+    if form.is_valid():
+        limit = form.cleaned_data["limit"]
+
+    processor = get_processor()
+    cube = processor.aggregation_cube()
+    scale = processor.budget_scale(cube.total(RAISE), float(limit))
+    charts = {
+        kind: {"labels": [str(label) for label in series.index], "values": series.tolist()}
+        for kind, series in raise_totals(cube, scale).items()
+    }
+    return JsonResponse(
+        {
+            "version": processor.prepared_version,
+            "limit": float(limit),
+            "leftover": float(limit) - cube.total(RAISE) * scale,
+            "charts": charts,
+        },
+        json_dumps_params={"ensure_ascii": False},
     )
 
-    recommended_rows = []
-    for _, row in recommended.iterrows():
-        recommended_rows.append(
-            {
-                "tab": row.get("Таб. №"),
-                "fio": row.get("Ф.И.О."),
-                "position": row.get("Должность /профессия (разряд, категория)"),
-                "fot": row.get("ФОТ"),
-                "fot_market": row.get("ФОТ по рынку"),
-                "paid_ratio": row.get("Проплаченность"),
-                "raise_amount": row.get("Повышение по лимиту"),
-                "mrf": row.get("МРФ"),
-                "grade": row.get("Грейд"),
-            }
+
+@login_required
+def budget_drilldown(request):
+    # Разрез по измерениям куба: ?by=mrf,rf&mrf=МРФ Юг&limit=... — суммы по группам
+    # среза, отобранного по значениям измерений.
+    if not _is_budgetologist(request):
+        return JsonResponse({"error": "forbidden"}, status=403)
+
+    form = BudgetForm(request.GET or None)
+    limit = Decimal("10000000")
+    if form.is_valid():
+        limit = form.cleaned_data["limit"]
+
+    by = [key for key in request.GET.get("by", "mrf").split(",") if key]
+    unknown = [key for key in by if key not in CUBE_DIMENSIONS]
+    if unknown:
+        return JsonResponse(
+            {"error": f"неизвестные измерения: {', '.join(unknown)}", "dimensions": list(CUBE_DIMENSIONS)},
+            status=400,
+            json_dumps_params={"ensure_ascii": False},
         )
+    filters = {CUBE_DIMENSIONS[key]: request.GET[key] for key in CUBE_DIMENSIONS if key in request.GET}
 
-    chart_mrf = settings.OUTPUT_DIR / "raise_by_mrf.png"
-    chart_grade = settings.OUTPUT_DIR / "raise_by_grade.png"
+    processor = get_processor()
+    cube = processor.aggregation_cube()
+    scale = processor.budget_scale(cube.total(RAISE), float(limit))
+    groups = cube.query([CUBE_DIMENSIONS[key] for key in by], filters, scale=scale)
+    columns = {CUBE_DIMENSIONS[key]: key for key in by}
+    rows = [
+        {columns.get(column, column): json_value(value) for column, value in row.items()}
+        for row in groups.to_dict("records")
+    ]
+    return JsonResponse(
+        {"version": processor.prepared_version, "limit": float(limit), "by": by, "groups": rows},
+        json_dumps_params={"ensure_ascii": False},
+    )
 
-    context = {
-        "form": form,
-        "summary": {
-            "total_employees": len(df),
-            "recommended_count": int(df["Рекомендуется повышение"].sum()),
-            "total_raise": float(df["Повышение по лимиту"].sum()),
-            "leftover": float(leftover),
-        },
-        "recommended": recommended_rows,
-        "by_mrf": list(by_mrf.items()),
-        "by_grade": list(by_grade.items()),
-        "charts": {
-            "mrf": settings.MEDIA_URL + chart_mrf.name if chart_mrf.exists() else None,
-            "grade": settings.MEDIA_URL + chart_grade.name if chart_grade.exists() else None,
+
+def _optional_float(value: str | None) -> float | None:
+    return float(value) if value not in (None, "") else None
+
+
+@login_required
+def budget_recommended(request):
+    # Рекомендованные к повышению по убыванию суммы, постранично:
+    # ?mrf=...&grade=...&paid_min=0.5&paid_max=0.7&size=50&after=<курсор>.
+    # Следующая страница запрашивается с курсором из поля next.
+    if not _is_budgetologist(request):
+        return JsonResponse({"error": "forbidden"}, status=403)
+
+    form = BudgetForm(request.GET or None)
+    limit = Decimal("10000000")
+    if form.is_valid():
+        limit = form.cleaned_data["limit"]
+
+    try:
+        size = min(max(int(request.GET.get("size", 50)), 1), settings.RECOMMENDED_PAGE_MAX)
+        ratio_range = (_optional_float(request.GET.get("paid_min")), _optional_float(request.GET.get("paid_max")))
+    except ValueError:
+        return JsonResponse(
+            {"error": "size, paid_min и paid_max должны быть числами"},
+            status=400,
+            json_dumps_params={"ensure_ascii": False},
+        )
+
+    processor = get_processor()
+    prepared, _ = processor.prepare()
+    index = get_recommended_store().index(prepared)
+    try:
+        ranks, cursor = index.page(
+            size,
+            after=request.GET.get("after") or None,
+            filters={"МРФ": request.GET.getlist("mrf"), GRADE: request.GET.getlist("grade")},
+            ratio_range=ratio_range,
+        )
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400, json_dumps_params={"ensure_ascii": False})
+
+    cube = processor.aggregation_cube()
+    scale = processor.budget_scale(cube.total(RAISE), float(limit))
+    return JsonResponse(
+        {
+            "version": processor.prepared_version,
+            "limit": float(limit),
+            "results": recommended_rows(index, ranks, scale),
+            "next": cursor,
         },
-    }
-    return render(request, "cabinet/budget_dashboard.html", context)
+        json_dumps_params={"ensure_ascii": False},
+    )
+
+
+@login_required
+def budget_export(request):
+    # Выгрузка всего расчета потоком: ?format=csv|arrow&columns=ФОТ,МРФ&mrf=...&grade=...&limit=...
+    # Без limit выгружается расчет до лимита, с limit добавляются колонки повышения по лимиту.
+    if not _is_budgetologist(request):
+        return JsonResponse({"error": "forbidden"}, status=403)
+
+    fmt = request.GET.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        return JsonResponse(
+            {"error": f"неизвестный формат: {fmt}", "formats": list(EXPORT_FORMATS)},
+            status=400,
+            json_dumps_params={"ensure_ascii": False},
+        )
+
+    processor = get_processor()
+    prepared, _ = processor.prepare()
+    scale = None
+    if "limit" in request.GET:
+        form = BudgetForm(request.GET)
+        if not form.is_valid():
+            return JsonResponse(
+                {"error": "limit должен быть неотрицательным числом"},
+                status=400,
+                json_dumps_params={"ensure_ascii": False},
+            )
+        # Сумма по строкам в том же порядке, что в apply_budget: выгрузка совпадает с employees_fot.csv.
+        scale = processor.budget_scale(prepared[RAISE].sum(), float(form.cleaned_data["limit"]))
+
+    try:
+        columns = export_columns(
+            prepared, [column for column in request.GET.get("columns", "").split(",") if column], scale is not None
+        )
+    except KeyError as exc:
+        return JsonResponse(
+            {"error": f"неизвестные колонки: {exc.args[0]}"}, status=400, json_dumps_params={"ensure_ascii": False}
+        )
+
+    header = export_header(prepared, columns, scale)
+    chunks = export_chunks(
+        prepared,
+        columns,
+        {"МРФ": request.GET.getlist("mrf"), GRADE: request.GET.getlist("grade")},
+        scale,
+        settings.EXPORT_CHUNK_ROWS,
+    )
+    content_type, filename = EXPORT_FORMATS[fmt]
+    stream = csv_stream(header, chunks) if fmt == "csv" else arrow_stream(header, chunks)
+    response = StreamingHttpResponse(stream, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    response["X-Dataset-Version"] = processor.prepared_version
+    return response
@@ -28,6 +28,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "cabinet.middleware.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -75,6 +76,39 @@ LOGOUT_REDIRECT_URL = "/login/"
 
 DATA_DIR = BASE_DIR / "data"
 OUTPUT_DIR = BASE_DIR / "output"
+SOURCE_CACHE_DIR = OUTPUT_DIR / "cache"
+CHART_CACHE_SIZE = 64
+# Сколько секунд роль пользователя (бюджетолог или сотрудник) берется из сессии.
+ROLE_CACHE_SECONDS = 300
+# Наибольший размер страницы списка рекомендованных (budget/recommended/).
+RECOMMENDED_PAGE_MAX = 500
+# Строк в одном куске потоковой выгрузки (budget/export/).
+EXPORT_CHUNK_ROWS = 20_000
+SOURCE_LOAD_WORKERS = 4
+PROFILE_REQUESTS = False
+PROFILE_MEMORY = False
+
+# Пересчет бюджета идет фоновыми задачами. При BUDGET_JOBS_IN_PROCESS задачи
+# выполняет пул потоков веб-процесса, иначе — manage.py budget_worker.
+BUDGET_JOBS_IN_PROCESS = True
+BUDGET_JOB_WORKERS = 2
+BUDGET_JOB_QUEUE_LIMIT = 20
+# Воркер отмечается в задаче раз в BUDGET_JOB_HEARTBEAT секунд; задача без
+# отметки дольше BUDGET_JOB_TIMEOUT секунд возвращается в очередь.
+BUDGET_JOB_HEARTBEAT = 30
+BUDGET_JOB_TIMEOUT = 600
+BUDGET_JOB_MAX_ATTEMPTS = 3
+BUDGET_JOB_KEEP = 200
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        "cabinet.profiling": {"handlers": ["console"], "level": "INFO"},
+        "cabinet.jobs": {"handlers": ["console"], "level": "INFO"},
+    },
+}
 
 STATIC_URL = "static/"
 